@@ -1,2 +1,2 @@
 __author__ = 'Gjum'
-__all__ = ['drawutils', 'main', 'reload', 'skins', 'subscriber', 'team_overlay', 'window']
+__all__ = ['allocations', 'callcount', 'control', 'diagnostics', 'drawutils', 'export', 'gtk_control', 'headless', 'latency', 'layers', 'logger', 'main', 'plugins', 'prediction', 'profiles', 'reload', 'replay', 'skins', 'spatial', 'startup', 'stats', 'subscriber', 'team_overlay', 'team_sync', 'telemetry', 'threats', 'tiles', 'view', 'widgets', 'window']
@@ -0,0 +1,84 @@
+"""
+Counts the memory allocations of drawing frames, using tracemalloc:
+
+    gagar bench-alloc [cells] [frames]
+
+Renders a synthetic world through all built-in drawers and prints,
+per frame, the peak of temporary allocations while drawing and the blocks
+that stay allocated, plus the source lines that keep the most.
+"""
+import tracemalloc
+
+
+def render_setup(num_cells, size=(1280, 720), context=None):
+    """
+    Returns functions updating and drawing one frame of a synthetic world,
+    into `context` or a new image surface.
+    """
+    import cairo
+    from agarnet.client import Client
+    from .plugins import subscribe_drawers
+    from .subscriber import MultiSubscriber
+    from .tiles import dense_world
+    from .view import View
+
+    multi_sub = MultiSubscriber()
+    client = Client(multi_sub)
+    world = client.player.world = dense_world(num_cells, size=2000)
+    world.leaderboard_names[:] = [(cid, 'cell %i' % cid) for cid in range(1, 11)]
+    client.player.own_ids.update((1, 2, 3))
+    client.player.cells_changed()
+    subscribe_drawers(multi_sub, client, config_path=None)
+
+    view = View(world, size)
+    view.draw_subscriber = view.button_subscriber = multi_sub
+    view.focus_player(client.player)
+    if context is None:
+        context = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, *size))
+
+    def render():
+        view.render(context)
+
+    return multi_sub.on_world_update_post, render
+
+
+def measure(update, render, frames=50, warmup=10, top=10):
+    """
+    Returns (peak bytes while drawing a frame, retained blocks per frame,
+    lines keeping the most blocks), after `warmup` frames so caches are filled.
+    """
+    for _ in range(warmup):
+        update()
+        render()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    peak = 0
+    for _ in range(frames):
+        update()
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        render()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, 'lineno')
+    retained = sum(s.count_diff for s in stats) / frames
+    lines = sorted(stats, key=lambda s: s.count_diff, reverse=True)[:top]
+    return peak, retained, lines
+
+
+def main(args):
+    if args[:1] in (['-h'], ['--help']):
+        print("Usage: gagar bench-alloc [cells] [frames]")
+        return
+    num_cells, frames, *_ = args + [None] * 2
+    num_cells = int(num_cells or 2000)
+    frames = int(frames or 50)
+    peak, retained, lines = measure(*render_setup(num_cells), frames=frames)
+    print('%i cells, %i frames' % (num_cells, frames))
+    print('peak temporary allocations: %.1f KiB per frame' % (peak / 1024))
+    print('blocks still allocated:     %.1f per frame' % retained)
+    for stat in lines:
+        if stat.count_diff > 0:
+            print('  %6i  %s' % (stat.count_diff, stat.traceback))
@@ -0,0 +1,96 @@
+"""
+Counts the cairo calls of drawing frames, of a recording or a synthetic world:
+
+    gagar bench-calls [cells|replay] [frames]
+
+Prints the calls per frame by method, and how many colour, line width and
+font changes `Canvas` did not send because they were set already.
+"""
+from collections import Counter
+import os
+
+from .drawutils import canvas_stats
+
+
+class CallCounter(object):
+    """Wraps a cairo context, counting the calls of each of its methods."""
+
+    def __init__(self, context):
+        self.context = context
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        method = getattr(self.context, name)
+        calls = self.calls
+
+        def counted(*args, **kwargs):
+            calls[name] += 1
+            return method(*args, **kwargs)
+
+        return counted
+
+
+def replay_setup(path, size=(1280, 720), context=None, fps=25):
+    """Like `allocations.render_setup()`, stepping through a recording."""
+    from .export import FrameRenderer
+
+    renderer = FrameRenderer(path, size[0], size[1], fps)
+    context = context or renderer.context
+    frame = [0]
+
+    def update():
+        frame[0] += 1
+        renderer.client.advance(renderer.frame_time(frame[0]))
+
+    def render():
+        renderer.view.render(context)
+
+    renderer.client.seek(renderer.frame_time(0))
+    return update, render
+
+
+def count_calls(source, frames=50, warmup=10, size=(1280, 720)):
+    """
+    Returns ({method: calls per frame}, skipped state changes per frame)
+    for `source`, a replay path or a number of synthetic cells.
+    """
+    import cairo
+    from .allocations import render_setup
+
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, *size)
+    counter = CallCounter(cairo.Context(surface))
+    if isinstance(source, str):
+        update, render = replay_setup(source, size, counter)
+    else:
+        update, render = render_setup(source, size, counter)
+    for _ in range(warmup):  # fill the caches and layers
+        update()
+        render()
+    counter.calls.clear()
+    skipped = canvas_stats['skipped']
+    for _ in range(frames):
+        update()
+        render()
+    calls = {name: n / frames for name, n in counter.calls.items()}
+    return calls, (canvas_stats['skipped'] - skipped) / frames
+
+
+def main(args):
+    if args[:1] in (['-h'], ['--help']):
+        print("Usage: gagar bench-calls [cells|replay] [frames]")
+        return
+    source, frames, *_ = args + [None] * 2
+    if source and os.path.exists(source):
+        print('%s, ' % source, end='')
+    else:
+        source = int(source or 2000)
+        print('%i cells, ' % source, end='')
+    frames = int(frames or 50)
+    print('%i frames' % frames)
+    calls, skipped = count_calls(source, frames)
+    for name, n in sorted(calls.items(), key=lambda item: -item[1]):
+        print('  %8.1f  %s' % (n, name))
+    total = sum(calls.values())
+    print('cairo calls:            %.1f per frame' % total)
+    print('state changes skipped:  %.1f per frame (%.0f%% fewer calls)'
+          % (skipped, 100 * skipped / max(1, total + skipped)))
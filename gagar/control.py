@@ -0,0 +1,118 @@
+import time
+
+from agarnet.vec import Vec
+from .subscriber import Subscriber
+
+# Gdk key values, to not need GTK
+KEY_RETURN = 0xff0d
+KEY_SPACE = 0x20
+
+TICK_SLACK = .75  # world updates jitter, still flush those arriving a bit early
+
+
+class TargetScheduler(object):
+    """
+    Coalesces target updates to the latest one, and sends it when flushed
+    on a world update, at most `rate` times per second (with some slack
+    for jitter), skipping unchanged targets. A target held back stays
+    pending for the next flush.
+    """
+
+    def __init__(self, client, rate=25):
+        self.client = client
+        self.interval = 1 / rate if rate else 0
+        self.pending = None  # latest target, not sent yet
+        self.pending_requests = 0  # updates merged into `pending`
+        self.last_target = None
+        self.last_sent = 0
+        self.requests = 0
+        self.sent = 0
+
+    def set(self, x, y):
+        self.pending = (int(x), int(y))  # what send_target() sends anyway
+        self.pending_requests += 1
+        self.requests += 1
+
+    def flush(self, force=False):
+        """Sends the pending target if due (or `force`d), returns if it did."""
+        if self.pending is None:
+            return False
+        now = time.monotonic()
+        if not force and now - self.last_sent < self.interval * TICK_SLACK:
+            return False  # keep coalescing
+
+        target, requests = self.pending, self.pending_requests
+        self.pending = None
+        self.pending_requests = 0
+        sent = target != self.last_target
+        if sent:
+            self.client.send_target(*target)
+            self.last_target = target
+            self.last_sent = now
+            self.sent += 1
+        self.client.subscriber.on_target_flush(requests=requests, sent=int(sent))
+        return sent
+
+    def reset(self):
+        self.pending = None
+        self.pending_requests = 0
+        self.last_target = None  # new connection, resend
+
+
+class NativeControl(Subscriber):
+    def __init__(self, client, target_rate=25):
+        self.client = client
+        self.movement_delta = Vec()
+        self.sending_mouse = True
+        # the server moves cells once per tick (25/s), coalesce mouse moves to that
+        self.targets = TargetScheduler(client, target_rate)
+
+    def toggle_sending_mouse(self):
+        self.sending_mouse = not self.sending_mouse
+
+    def send_mouse(self, force=False):
+        target = self.client.player.center + self.movement_delta
+        self.targets.set(*target)
+        self.targets.flush(force)
+
+    def on_world_update_post(self):
+        # one target per server tick, also keeps cells moving when the mouse stands still
+        if self.sending_mouse:
+            self.send_mouse()
+
+    def on_sock_open(self):
+        self.targets.reset()
+
+    def on_mouse_moved(self, pos, pos_world):
+        # sent with the next world update
+        self.movement_delta = pos_world - self.client.player.center
+
+    def on_mouse_pressed(self, button):
+        # aim first, split/eject can not wait for the next flush
+        if button == 2: # Middle click
+            self.send_mouse(force=True)
+            self.client.send_shoot()
+            self.client.subscriber.on_input_sent(command='shoot')
+        elif button == 3: # Right click
+            self.send_mouse(force=True)
+            self.client.send_split()
+            self.client.subscriber.on_input_sent(command='split')
+
+    def on_key_pressed(self, val, char):
+        if char == 's':
+            self.client.send_spectate()
+        elif char == 'q':
+            self.client.send_spectate_toggle()
+        elif char == 'r' or val == KEY_RETURN:
+            self.client.send_respawn()
+            self.client.subscriber.on_input_sent(command='respawn')
+        elif char == 'w':
+            self.send_mouse(force=True)
+            self.client.send_shoot()
+            self.client.subscriber.on_input_sent(command='shoot')
+        elif val == KEY_SPACE:
+            self.send_mouse(force=True)
+            self.client.send_split()
+            self.client.subscriber.on_input_sent(command='split')
+        elif char == 'k':
+            self.client.send_explode()
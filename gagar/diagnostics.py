@@ -0,0 +1,45 @@
+"""
+Exceptions that drawing code catches to keep going, counted per call site
+instead of silently passed, so broken drawing does not go unnoticed:
+
+    try:
+        ...
+    except SystemError as e:
+        swallowed('Canvas.fill_circle', e)
+
+The counts are shown by the FPS meter (F3) and exported with the metrics.
+Each site is logged the first time; with `gagar --diagnostics` it is logged
+again at most every LOG_INTERVAL seconds, with a traceback the first time.
+"""
+from collections import Counter
+import time
+import traceback
+
+LOG_INTERVAL = 10.0  # seconds
+
+enabled = False
+error_counts = Counter()  # 'site: ErrorType' -> times caught
+_logged_at = {}  # 'site: ErrorType' -> time of the last log message
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def swallowed(site, error):
+    """Counts that `site` caught `error` and carried on, and logs it rate-limited."""
+    key = '%s: %s' % (site, type(error).__name__)
+    error_counts[key] += 1
+    now = time.time()
+    last = _logged_at.get(key)
+    if last is None or (enabled and now - last >= LOG_INTERVAL):
+        _logged_at[key] = now
+        print('[DIAG] %s (%i times): %s' % (key, error_counts[key], error))
+        if enabled and last is None:
+            traceback.print_exception(type(error), error, error.__traceback__)
+
+
+def most_common(n=5):
+    """The `n` most often caught (site: ErrorType, count)."""
+    return error_counts.most_common(n)
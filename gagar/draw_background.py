@@ -11,16 +11,21 @@ class SolidBackground(Subscriber):
 
 
 class GridDrawer(Subscriber):
+    def __init__(self, settings=None):
+        self.settings = settings
+
     def on_draw_background(self, c, w):
+        spacing = self.settings.grid_spacing if self.settings else 50
+        if spacing <= 0:
+            return
         wl, wt = w.world_to_screen_pos(w.world.top_left)
         wr, wb = w.world_to_screen_pos(w.world.bottom_right)
-        grid_spacing = w.world_to_screen_size(50)
+        grid_spacing = w.world_to_screen_size(spacing)
+        color = to_rgba(LIGHT_GRAY, .3)
         for y in frange(wt, wb, grid_spacing):
-            c.draw_line((wl, y), (wr, y), width=.5,
-                        color=to_rgba(LIGHT_GRAY, .3))
+            c.draw_line((wl, y), (wr, y), width=.5, color=color)
         for x in frange(wl, wr, grid_spacing):
-            c.draw_line((x, wt), (x, wb), width=.5,
-                        color=to_rgba(LIGHT_GRAY, .3))
+            c.draw_line((x, wt), (x, wb), width=.5, color=color)
 
 
 class WorldBorderDrawer(Subscriber):
@@ -1,10 +1,13 @@
 from time import time
 
 from agarnet.vec import Vec
+from .spatial import visible_cells
 from .subscriber import Subscriber
 from .drawutils import *
+from .threats import *
 
 info_size = 14
+MIN_TILED_CELLS = 500  # below this, drawing on several threads is slower
 
 
 def nick_size(cell, w):
@@ -18,10 +21,34 @@ class CellsDrawer(Subscriber):
             pos = w.world_to_screen_pos(cell.pos)
         c.fill_circle(pos, w.world_to_screen_size(cell.draw_size), color=to_rgba(cell.color, min(cell.draw_alpha, alpha)))
 
+    def __init__(self, cell_index=None, settings=None, world_space=True, tile_threads=0):
+        self.cell_index = cell_index
+        self.settings = settings
+        # let cairo transform the cells, instead of each one in python
+        self.world_space = world_space
+        self.tiles = None
+        if tile_threads:
+            from .tiles import TileRasterizer
+            self.tiles = TileRasterizer(tile_threads)
+
     def on_draw_cells(self, c, w):
-        # reverse to show small over large cells
-        for cell in sorted(w.world.cells.values(), reverse=True):
-            self.draw(c, w, cell, alpha=0.9)
+        cells = visible_cells(w, self.cell_index)
+        if not self.cell_index:
+            # reverse to show small over large cells
+            cells = sorted(cells, reverse=True)
+        min_tiled = self.settings.tiled_cells if self.settings else MIN_TILED_CELLS
+        if self.tiles and len(cells) >= min_tiled:
+            self.tiles.draw(c, w, cells)  # zoomed out, many cells
+            return
+        if not self.world_space:
+            for cell in cells:
+                self.draw(c, w, cell, alpha=0.9)
+            return
+        c.push_transform(w.transform)
+        for cell in cells:
+            c.fill_circle(cell.pos, cell.draw_size,
+                          color=to_rgba(cell.color, min(cell.draw_alpha, 0.9)))
+        c.pop_transform()
 
 
 class CellNames(Subscriber):
@@ -33,21 +60,39 @@ class CellNames(Subscriber):
             size = nick_size(cell, w)
             c.draw_text(pos, '%s' % cell.name, align='center', outline=(BLACK, 2), size=size)
 
+    def __init__(self, cell_index=None, settings=None):
+        self.cell_index = cell_index
+        self.settings = settings
+        self.screen_coords = None  # reused every frame
+
     def on_draw_cells(self, c, w):
-        for cell in w.world.cells.values():
-            self.draw(c, w, cell)
+        cells = [cell for cell in visible_cells(w, self.cell_index) if cell.name]
+        min_radius = self.settings.name_min_radius if self.settings else 0
+        if min_radius:  # too small to read anyway
+            min_size = min_radius / w.transform.scale
+            cells = [cell for cell in cells if cell.draw_size >= min_size]
+        # all positions at once, instead of a Vec per cell
+        xy = self.screen_coords = w.transform.map_coords(
+            [v for cell in cells for v in (cell.pos.x, cell.pos.y)], self.screen_coords)
+        for i, cell in enumerate(cells):
+            self.draw(c, w, cell, (xy[2 * i], xy[2 * i + 1]))
 
 
 class RemergeTimes(Subscriber):
+    def __init__(self, stats):
+        self.stats = stats
+
     def on_draw_cells(self, c, w):
-        if len(w.player.own_ids) <= 1:
+        remerge_at = self.stats.remerge_at
+        if not remerge_at:
             return  # dead or only one cell, no re-merge time to display
 
         now = time()
         for cell in w.player.own_cells:
+            if cell.cid not in remerge_at:
+                continue  # new cell, not yet in the stats
             split_for = now - cell.spawn_time
-            # formula by HungryBlob
-            ttr = max(30, cell.size // 5) - split_for
+            ttr = remerge_at[cell.cid] - now
             if ttr < 0:
                 continue
             pos = w.world_to_screen_pos(cell.pos)
@@ -72,86 +117,117 @@ class CellMasses(Subscriber):
         text_pos.iadd(Vec(0, info_size))
         c.draw_text(text_pos, '(%i)' % ((cell.mass*2*1.33)-w.player.total_mass), align='center', outline=(BLACK, 2), size=info_size/1.5)
 
+    def __init__(self, cell_index=None):
+        self.cell_index = cell_index
+
     def on_draw_cells(self, c, w):
-        for cell in w.world.cells.values():
+        for cell in visible_cells(w, self.cell_index):
             self.draw(c, w, cell)
 
 
+HOSTILITY_COLORS = {
+    PREY_SPLIT: PURPLE,
+    PREY: GREEN,
+    NEUTRAL: YELLOW,
+    THREAT: ORANGE,
+    SPLIT_THREAT: RED,
+    VIRUS: RED,
+}
+
+
 class CellHostility(Subscriber):
     @staticmethod
-    def draw(c, w, cell, pos=None, own_min_mass=None, own_max_mass=None, alpha=1.0):
+    def draw(c, w, cell, pos=None, own_min_mass=None, own_max_mass=None, alpha=1.0,
+             level=None):
         if not w.player.is_alive:
             return  # nothing to be hostile against
-        if cell.is_food or cell.is_ejected_mass:
-            return  # no threat
         if cell.cid in w.player.own_ids:
             return  # own cell, also no threat lol
 
+        if level is None:
+            if not own_min_mass:
+                own_min_mass = min(c.mass for c in w.player.own_cells)
+            if not own_max_mass:
+                own_max_mass = max(c.mass for c in w.player.own_cells)
+            level = hostility(cell, own_min_mass, own_max_mass)
+            if level is None:
+                return  # food, or harmless virus
+
         if not pos:
             pos = w.world_to_screen_pos(cell.pos)
-        if not own_min_mass:
-            own_min_mass = min(c.mass for c in w.player.own_cells)
-        if not own_max_mass:
-            own_max_mass = max(c.mass for c in w.player.own_cells)
-
-        color = YELLOW
-        if cell.is_virus:
-            if own_max_mass >= cell.mass * 1.33:
-                color = RED
-            else:
-                return  # no threat, do not mark
-        elif own_min_mass > cell.mass * 1.33 * 2:
-            color = PURPLE
-        elif own_min_mass > cell.mass * 1.33:
-            color = GREEN
-        elif cell.mass > own_min_mass * 1.33 * 2:
-            color = RED
-        elif cell.mass > own_min_mass * 1.33:
-            color = ORANGE
         c.stroke_circle(pos, w.world_to_screen_size(cell.draw_size),
-                        width=5, color=to_rgba(color, min(cell.draw_alpha, alpha)))
+                        width=5, color=to_rgba(HOSTILITY_COLORS[level],
+                                               min(cell.draw_alpha, alpha)))
+
+    def __init__(self, cell_index=None, threats=None):
+        self.cell_index = cell_index
+        self.threats = threats
 
     def on_draw_cells(self, c, w):
         if not w.player.is_alive:
             return  # nothing to be hostile against
 
+        if self.threats and w.world is self.threats.client.player.world:
+            # classified once per world update
+            levels = self.threats.levels
+            for cell in visible_cells(w, self.cell_index):
+                level = levels.get(cell.cid)
+                if level is not None:
+                    self.draw(c, w, cell, level=level)
+            return
+
         own_min_mass = min(c.mass for c in w.player.own_cells)
         own_max_mass = max(c.mass for c in w.player.own_cells)
-        for cell in w.world.cells.values():
+        for cell in visible_cells(w, self.cell_index):
             self.draw(c, w, cell, own_min_mass=own_min_mass, own_max_mass=own_max_mass)
 
 
 class ForceFields(Subscriber):
+    def __init__(self, threats=None, stats=None):
+        self.threats = threats
+        self.stats = stats
+
     def on_draw_cells(self, c, w):
         if not w.player.is_alive:
             return
-        split_dist = 760
         for cell in w.player.own_cells:
             pos = w.world_to_screen_pos(cell.pos)
-            radius = split_dist + cell.size * .7071
+            radius = split_reach(cell)
             c.stroke_circle(pos, w.world_to_screen_size(radius),
                             width=3, color=to_rgba(PURPLE, min(cell.draw_alpha, 0.5)))
 
-        if w.player.is_alive:
+        if self.threats and self.stats and w.world is self.threats.client.player.world:
+            # classified and aggregated once per world update
+            own_max_size = self.stats.own_max_size
+            own_min_mass = self.stats.own_min_mass
+            split_threats = self.threats.split_threats
+            viruses = self.threats.viruses
+        else:
             own_max_size = max(c.size for c in w.player.own_cells)
-            own_min_mass = max(min(c.mass for c in w.player.own_cells), own_max_size/2) # prevent confusing force fields due to many small cells
-        else:  # spectating or dead, still draw some lines
-            own_max_size = own_min_mass = 0
-
-        for cell in w.world.cells.values():
-            if cell.size < 60:
-                continue  # cannot split
-            if cell.cid in w.player.own_ids:
-                continue  # own cell, not hostile
-            pos = w.world_to_screen_pos(cell.pos)
-            if cell.is_virus:
-                if own_max_size > cell.size:  # dangerous virus
-                    c.stroke_circle(pos, w.world_to_screen_size(own_max_size),
-                                    width=3, color=to_rgba(RED, min(cell.draw_alpha, 0.5)))
-            elif cell.mass > own_min_mass * 1.33 * 2:  # can split+kill me
-                radius = max(split_dist + cell.draw_size * .7071, cell.draw_size)
-                c.stroke_circle(pos, w.world_to_screen_size(radius),
-                                width=3, color=to_rgba(RED, min(cell.draw_alpha, 0.5)))
+            own_min_mass = min(c.mass for c in w.player.own_cells)
+            own_max_mass = max(c.mass for c in w.player.own_cells)
+            split_threats = []
+            viruses = []
+            for cell in w.world.cells.values():
+                if cell.cid in w.player.own_ids:
+                    continue  # own cell, not hostile
+                level = hostility(cell, own_min_mass, own_max_mass)
+                if level == VIRUS:
+                    viruses.append(cell)
+                elif level == SPLIT_THREAT and cell.size >= MIN_SPLIT_SIZE:
+                    split_threats.append(cell)
+
+        for cell in viruses:  # dangerous virus
+            c.stroke_circle(w.world_to_screen_pos(cell.pos), w.world_to_screen_size(own_max_size),
+                            width=3, color=to_rgba(RED, min(cell.draw_alpha, 0.5)))
+        # prevent confusing force fields due to many small cells
+        own_min_mass = max(own_min_mass, own_max_size / 2)
+        for cell in split_threats:  # can split+kill me
+            if cell.mass <= own_min_mass * EAT_RATIO * 2:
+                continue
+            radius = max(split_reach(cell), cell.draw_size)
+            c.stroke_circle(w.world_to_screen_pos(cell.pos), w.world_to_screen_size(radius),
+                            width=3, color=to_rgba(RED, min(cell.draw_alpha, 0.5)))
 
 
 class MovementLines(Subscriber):
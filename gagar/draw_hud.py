@@ -3,35 +3,39 @@ from time import time
 
 from agarnet.vec import Vec
 
+from . import diagnostics
 from .drawutils import *
+from .layers import Layer
+from .view import Transform
 from .subscriber import Subscriber
 
 
 class SplitCounter(Subscriber):
-    @staticmethod
-    def on_draw_hud(c, w):
+    def __init__(self, stats):
+        self.stats = stats
+        self.layer = Layer()
+
+    def on_draw_hud(self, c, w):
         if w.player.is_alive:
-            if len(w.player.own_ids) <= 1:
+            if self.stats.num_cells <= 1:
                 return
 
-            c.fill_circle((w.win_size.x/2-18, 22), 18.0, color=to_rgba(LIGHT_GRAY, .8))
-            c.fill_circle((w.win_size.x/2+15, 22), 15.0, color=to_rgba(GRAY, .8))
-            split_text = '%d / 16' % len(w.player.own_ids)
-            c.draw_text((w.win_size.x/2, 67), split_text, align='center', color=WHITE, outline=(BLACK, 3), size=30)
+            split_text = '%d / 16' % self.stats.num_cells
+            merge_times = self.stats.merge_times()
+            # whole seconds, so the layer is only redrawn once per second
+            ttr_text = 'Min: %.0fs / Max: %.0fs' % merge_times if merge_times else None
+            x = w.win_size.x/2
+            rect = (x - 150, 0, 300, 100)
+            self.layer.draw(c, (split_text, ttr_text, rect), rect,
+                            lambda c: self.draw(c, x, split_text, ttr_text))
 
-            now = time()
-            ttr_list = []
-            for cell in w.player.own_cells:
-                split_for = now - cell.spawn_time
-
-                # formula by DebugMonkey
-                ttr = w.player.total_mass * 0.02 + 30 - split_for
-                if ttr > 0.0:
-                    ttr_list.append(ttr)
-
-            if len(ttr_list) > 0:
-                ttr_text = 'Min: %.1fs / Max: %.1fs' % (min(ttr_list), max(ttr_list))
-                c.draw_text((w.win_size.x/2, 90), ttr_text, align='center', color=WHITE, outline=(BLACK, 1), size=15)
+    @staticmethod
+    def draw(c, x, split_text, ttr_text):
+        c.fill_circle((x-18, 22), 18.0, color=to_rgba(LIGHT_GRAY, .8))
+        c.fill_circle((x+15, 22), 15.0, color=to_rgba(GRAY, .8))
+        c.draw_text((x, 67), split_text, align='center', color=WHITE, outline=(BLACK, 3), size=30)
+        if ttr_text:
+            c.draw_text((x, 90), ttr_text, align='center', color=WHITE, outline=(BLACK, 1), size=15)
 
 
 class FieldOfView(Subscriber):
@@ -39,46 +43,54 @@ class FieldOfView(Subscriber):
     def on_draw_hud(c, w):
         if w.player.is_alive and w.screen_zoom_scale != 1.0:
             window_scale = max(w.win_size.x / 1920, w.win_size.y / 1080)
-            screen_scale_no_zoom = w.player.scale * window_scale
-
-            def screen_to_world_pos(screen_pos):
-                return (screen_pos - w.screen_center) \
-                    .idiv(screen_scale_no_zoom).iadd(w.world_center)
+            no_zoom = Transform()
+            no_zoom.set(w.player.scale * window_scale, w.world_center, w.screen_center)
 
             # outline the area visible in window
-            c.stroke_rect(w.world_to_screen_pos(screen_to_world_pos(Vec(0, 0))),
-                          w.world_to_screen_pos(screen_to_world_pos(w.win_size)),
+            to_screen = w.transform.xy
+            c.stroke_rect(to_screen(*no_zoom.inverse_xy(0, 0)),
+                          to_screen(*no_zoom.inverse_xy(w.win_size.x, w.win_size.y)),
                           width=1, color=LIGHT_GRAY)
 
 
 class Minimap(Subscriber):
-    @staticmethod
-    def on_draw_minimap(c, w):
-        if w.world.size:
-            minimap_w = w.win_size.x / 5
-            minimap_size = Vec(minimap_w, minimap_w)
-            minimap_scale = minimap_size.x / w.world.size.x
-            minimap_offset = w.win_size - minimap_size
-
-            def world_to_map(world_pos):
-                pos_from_top_left = world_pos - w.world.top_left
-                return minimap_offset + pos_from_top_left * minimap_scale
+    def __init__(self):
+        self.map_coords = None  # reused every frame
 
-            for cell in w.world.cells.values():
-                c.stroke_circle(world_to_map(cell.pos),
+    def on_draw_minimap(self, c, w):
+        if w.world.size:
+            cells = list(w.world.cells.values())
+            xy = self.map_coords = w.minimap.map_coords(
+                [v for cell in cells for v in (cell.pos.x, cell.pos.y)], self.map_coords)
+            minimap_scale = w.minimap.scale
+            for i, cell in enumerate(cells):
+                c.stroke_circle((xy[2 * i], xy[2 * i + 1]),
                                 cell.size * minimap_scale,
                                 color=to_rgba(cell.color, .8))
 
 
 class Leaderboard(Subscriber):
+    def __init__(self, stats):
+        self.stats = stats
+        self.layer = Layer()
+        self.version = 0
+
+    def on_leaderboard_names(self, leaderboard):
+        self.version += 1
+
+    def on_draw_hud(self, c, w):
+        leaderboard = w.world.leaderboard_names
+        player_cid = self.stats.own_cid
+        visible = tuple(cid in w.world.cells for cid, _ in leaderboard)
+        rect = (w.win_size.x - w.INFO_SIZE, 0, w.INFO_SIZE, 50 + 23 * len(leaderboard))
+        self.layer.draw(c, (self.version, player_cid, visible, rect), rect,
+                        lambda c: self.draw(c, w, player_cid))
+
     @staticmethod
-    def on_draw_hud(c, w):
+    def draw(c, w, player_cid):
         c.draw_text((w.win_size.x - 10, 30), 'Leaderboard',
                     align='right', color=WHITE, outline=(BLACK, 2), size=27)
 
-        player_cid = min(c.cid for c in w.player.own_cells) \
-            if w.player and w.player.own_ids else -1
-
         for rank, (cid, name) in enumerate(w.world.leaderboard_names):
             rank += 1  # start at rank 1
             name = name or 'An unnamed cell'
@@ -93,54 +105,84 @@ class Leaderboard(Subscriber):
                         align='right', color=color, outline=(BLACK, 2), size=18)
 
 
+class MassSample(object):
+    __slots__ = ('total_mass', 'masses')
+
+    def __init__(self, total_mass, masses):
+        self.total_mass = total_mass
+        self.masses = masses  # sorted (cid, mass), shared with the stats
+
+
 class MassGraph(Subscriber):
-    def __init__(self, client):
+    REDRAW_SAMPLES = 10  # world updates between redraws of the graph
+
+    def __init__(self, client, stats):
         self.client = client
-        self.graph = []
+        self.stats = stats
+        self.graph = []  # MassSample per world update
+        self.max_mass = 0
+        self.layer = Layer()
 
     def on_respawn(self):
         self.graph.clear()
+        self.max_mass = 0
+        self.layer.invalidate()
 
     def on_world_update_post(self):
-        player = self.client.player
-        if not player.is_alive:
+        if not self.client.player.is_alive:
             return
-        sample = (
-            player.total_mass,
-            sorted((c.cid, c.mass) for c in player.own_cells)
-        )
-        self.graph.append(sample)
+        total_mass = self.stats.total_mass
+        self.graph.append(MassSample(total_mass, self.stats.masses))
+        self.max_mass = max(self.max_mass, total_mass)
 
     def on_draw_hud(self, c, w):
         if not self.graph:
             return
-        scale_x = w.INFO_SIZE / len(self.graph)
-        scale_y = w.INFO_SIZE / (max(self.graph)[0] or 10)
+        rect = (0, 0, w.INFO_SIZE, w.INFO_SIZE)
+        key = (len(self.graph) // self.REDRAW_SAMPLES, rect)
+        self.layer.draw(c, key, rect, lambda c: self.draw(c, w))
+
+    def draw(self, c, w):
+        graph = self.graph
+        # at most one point per pixel
+        step = max(1, len(graph) // w.INFO_SIZE)
+        scale_x = w.INFO_SIZE / len(graph) * step
+        scale_y = w.INFO_SIZE / (self.max_mass or 10)
         points = [(w.INFO_SIZE, 0), (0, 0)]
-        for i, (total_mass, masses) in enumerate(reversed(self.graph)):
-            points.append((i * scale_x, total_mass * scale_y))
+        for i, sample in enumerate(graph[::-step]):
+            points.append((i * scale_x, sample.total_mass * scale_y))
         c.fill_polygon(*points, color=to_rgba(BLUE, .3))
 
 
 class ExperienceMeter(Subscriber):
+    BAR_WIDTH = 200
+    LEVEL_HEIGHT = 30
+
     def __init__(self):
         self.level = 0
         self.current_xp = 0
         self.next_xp = 0
+        self.layer = Layer()
+        self.version = 0
 
     def on_experience_info(self, level, current_xp, next_xp):
         self.level = level
         self.current_xp = current_xp
         self.next_xp = next_xp
+        self.version += 1
 
     def on_draw_hud(self, c, w):
         if self.level == 0:
             return
         if w.player.is_alive:
             return
-        bar_width = 200
-        level_height = 30
-        x = (w.win_size.x - bar_width - level_height) / 2
+        x = (w.win_size.x - self.BAR_WIDTH - self.LEVEL_HEIGHT) / 2
+        rect = (x, 0, self.BAR_WIDTH + self.LEVEL_HEIGHT, self.LEVEL_HEIGHT)
+        self.layer.draw(c, (self.version, rect), rect, lambda c: self.draw(c, x))
+
+    def draw(self, c, x):
+        bar_width = self.BAR_WIDTH
+        level_height = self.LEVEL_HEIGHT
         # bar progress
         bar_progress = bar_width * self.current_xp / self.next_xp
         c.fill_rect((x, 0), size=(bar_progress, level_height),
@@ -157,8 +199,12 @@ class ExperienceMeter(Subscriber):
 
 
 class FpsMeter(Subscriber):
-    def __init__(self, queue_len):
+    def __init__(self, settings=None, queue_len=50):
+        self.settings = settings
         self.draw_last = self.world_last = time()
+        self.resize(settings.fps_history if settings else queue_len)
+
+    def resize(self, queue_len):
         self.draw_times = deque([0] * queue_len, queue_len)
         self.world_times = deque([0] * queue_len, queue_len)
 
@@ -169,13 +215,16 @@ class FpsMeter(Subscriber):
         self.world_times.appendleft(dt)
 
     def on_draw_hud(self, c, w):
+        if self.settings and self.settings.fps_history != self.draw_times.maxlen:
+            self.resize(self.settings.fps_history)
+        x, y = w.win_size
+        color = to_rgba(RED, .3)
         for i, t in enumerate(self.draw_times):
-            c.draw_line(w.win_size - Vec(4 * i - 2, 0), relative=(0, -t * 1000),
-                        width=2, color=to_rgba(RED, .3))
+            c.draw_line((x - 4 * i + 2, y), relative=(0, -t * 1000), width=2, color=color)
 
+        color = to_rgba(YELLOW, .3)
         for i, t in enumerate(self.world_times):
-            c.draw_line(w.win_size - Vec(4 * i, 0), relative=(0, -t * 1000),
-                        width=2, color=to_rgba(YELLOW, .3))
+            c.draw_line((x - 4 * i, y), relative=(0, -t * 1000), width=2, color=color)
 
         # 25, 30, 60 FPS marks
         graph_width = 4 * len(self.draw_times)
@@ -184,6 +233,11 @@ class FpsMeter(Subscriber):
                         relative=(graph_width, 0),
                         width=.5, color=to_rgba(color, .3))
 
+        # exceptions caught while drawing, see diagnostics.py
+        for i, (key, count) in enumerate(diagnostics.most_common()):
+            c.draw_text((x - 10, y - 1000 / 25 - 10 - 16 * i), '%s: %i' % (key, count),
+                        align='right', color=RED, outline=(BLACK, 2), size=12)
+
         now = time()
         dt = now - self.draw_last
         self.draw_last = now
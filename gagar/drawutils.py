@@ -1,3 +1,5 @@
+from .diagnostics import swallowed
+
 TWOPI = 6.28318530717958
 
 BLACK = (0, 0, 0)
@@ -34,17 +36,49 @@ def frange(start, end, step):
         start += step
 
 
+PALETTE_ALPHAS = 32  # alphas cached per colour, more are created each time
+_palette = {}  # rgb -> alpha -> rgba
+
+
 def to_rgba(c, a):
-    return c[0], c[1], c[2], a
+    """The colour `c` with alpha `a`, shared between calls instead of a new tuple."""
+    alphas = _palette.get(c)
+    if alphas is None:
+        alphas = _palette[c] = {}
+    rgba = alphas.get(a)
+    if rgba is None:
+        rgba = c[0], c[1], c[2], a
+        if len(alphas) < PALETTE_ALPHAS:
+            alphas[a] = rgba
+    return rgba
+
+
+MAX_PATTERNS = 256  # colours kept as cairo patterns, others are set as rgba
+_patterns = {}  # rgb(a) tuple -> cairo.SolidPattern
+canvas_stats = {'skipped': 0}  # state changes not sent to cairo, as they were set already
+
+
+def solid_pattern(color):
+    """A shared cairo pattern of `color`, or None if too many are cached."""
+    pattern = _patterns.get(color)
+    if pattern is None and len(_patterns) < MAX_PATTERNS:
+        import cairo  # not needed without a display
+        pattern = _patterns[color] = cairo.SolidPattern(*color)
+    return pattern
 
 
-class Button():
+class Button(object):
+    __slots__ = ('x', 'y', 'width', 'height', 'text', 'id',
+                 'border', 'border_color', 'fill', 'fill_color',
+                 'text_color', 'text_size', 'highlight', 'highlight_color')
+
     def __init__(self, x, y, width, height, text=""):
         self.x = x
         self.y = y
         self.width = width
         self.height = height
         self.text = text
+        self.id = None  # set by the owner, e.g. the team member
 
         self.border = True
         self.border_color = BLACK
@@ -61,18 +95,59 @@ class Button():
 
 
 class Canvas(object):
-    """Bundles all drawing methods, providing a useful abstraction layer."""
+    """
+    Bundles all drawing methods, providing a useful abstraction layer.
+
+    Remembers the source colour, line width and font it set, and only tells
+    cairo when they change. Code using `_cairo_context` directly has to
+    restore what it changes (save/restore) or call `reset_state()`.
+    """
 
     def __init__(self, cairo_context):
         self._cairo_context = cairo_context
+        self._saved = []
+        self.reset_state()
+
+    def reset_state(self):
+        """Forgets the graphics state, the next drawing sets it again."""
+        self._source = None
+        self._line_width = None
+        self._font = None
+
+    def set_color(self, color):
+        if color == self._source:
+            canvas_stats['skipped'] += 1
+            return
+        pattern = solid_pattern(color) if type(color) is tuple else None
+        if pattern is None:
+            self._cairo_context.set_source_rgba(*color)
+        else:
+            self._cairo_context.set_source(pattern)
+        self._source = color
+
+    def set_line_width(self, width):
+        if width == self._line_width:
+            canvas_stats['skipped'] += 1
+            return
+        self._cairo_context.set_line_width(width)
+        self._line_width = width
+
+    def set_font(self, face, size):
+        font = (face, size)
+        if font == self._font:
+            canvas_stats['skipped'] += 1
+            return
+        c = self._cairo_context
+        c.select_font_face(face)
+        c.set_font_size(size)
+        self._font = font
 
     def draw_text(self, pos, text, size=12, face='sans',
                   align=None, anchor_x='left', anchor_y='baseline',
                   color=WHITE, shadow=None, outline=None):
         c = self._cairo_context
         try:
-            c.select_font_face(face)
-            c.set_font_size(size)
+            self.set_font(face, size)
 
             # align overrides anchors
             if align:
@@ -111,52 +186,52 @@ class Canvas(object):
                 s_color, s_offset = shadow
                 s_dx, s_dy = s_offset
                 c.move_to(x + s_dx, y + s_dy)
-                c.set_source_rgba(*s_color)
+                self.set_color(s_color)
                 c.show_text(text)
 
             if outline:
                 o_color, o_size = outline
                 c.move_to(x, y)
-                c.set_line_width(o_size)
-                c.set_source_rgba(*o_color)
+                self.set_line_width(o_size)
+                self.set_color(o_color)
                 c.text_path(text)
                 c.stroke()
 
             # draw the text itself
             c.move_to(x, y)
-            c.set_source_rgba(*color)
+            self.set_color(color)
             c.text_path(text)
             c.fill()
         except UnicodeEncodeError:  # tried to display invalid chars
             pass
-        except SystemError:
-            pass
+        except SystemError as e:
+            swallowed('Canvas.draw_text', e)
 
     def fill_circle(self, pos, radius, color=None):
         try:
             c = self._cairo_context
             x, y = pos
             if color:
-                c.set_source_rgba(*color)
+                self.set_color(color)
             c.new_sub_path()
             c.arc(x, y, radius, 0, TWOPI)
             c.fill()
-        except SystemError:
-            pass
+        except SystemError as e:
+            swallowed('Canvas.fill_circle', e)
 
     def stroke_circle(self, pos, radius, width=None, color=None):
         try:
             c = self._cairo_context
             x, y = pos
             if width:
-                c.set_line_width(width)
+                self.set_line_width(width)
             if color:
-                c.set_source_rgba(*color)
+                self.set_color(color)
             c.new_sub_path()
             c.arc(x, y, radius, 0, TWOPI)
             c.stroke()
-        except SystemError:
-            pass
+        except SystemError as e:
+            swallowed('Canvas.stroke_circle', e)
 
     def set_pixel(self, pos, color=None):
         self.fill_rect(pos, size=(4, 4), color=color)
@@ -166,40 +241,40 @@ class Canvas(object):
             c = self._cairo_context
             left, top = left_top
             if color:
-                c.set_source_rgba(*color)
+                self.set_color(color)
             if right_bottom:
                 right, bottom = right_bottom
                 c.rectangle(left, top, right - left, bottom - top)
             elif size:
                 c.rectangle(left, top, *size)
             c.fill()
-        except SystemError:
-            pass
+        except SystemError as e:
+            swallowed('Canvas.fill_rect', e)
 
     def stroke_rect(self, left_top, right_bottom=None, size=None, width=None, color=None):
         try:
             c = self._cairo_context
             left, top = left_top
             if width:
-                c.set_line_width(width)
+                self.set_line_width(width)
             if color:
-                c.set_source_rgba(*color)
+                self.set_color(color)
             if right_bottom:
                 right, bottom = right_bottom
                 c.rectangle(left, top, right - left, bottom - top)
             elif size:
                 c.rectangle(left, top, *size)
             c.stroke()
-        except SystemError:
-            pass
+        except SystemError as e:
+            swallowed('Canvas.stroke_rect', e)
 
     def draw_line(self, start, *points, relative=None, width=None, color=None):
         try:
             c = self._cairo_context
             if width:
-                c.set_line_width(width)
+                self.set_line_width(width)
             if color:
-                c.set_source_rgba(*color)
+                self.set_color(color)
             c.move_to(*start)
             if relative:
                 c.rel_line_to(*relative)
@@ -207,28 +282,49 @@ class Canvas(object):
                 for point in points:
                     c.line_to(*point)
             c.stroke()
-        except SystemError:
-            pass
+        except SystemError as e:
+            swallowed('Canvas.draw_line', e)
 
     def fill_polygon(self, start, *points, color=None):
         try:
             c = self._cairo_context
             if color:
-                c.set_source_rgba(*color)
+                self.set_color(color)
             c.move_to(*start)
             for point in points:
                 c.line_to(*point)
             c.fill()
-        except SystemError:
-            pass
+        except SystemError as e:
+            swallowed('Canvas.fill_polygon', e)
+
+    def push_transform(self, transform):
+        """Draw in world coordinates until `pop_transform()`, see `view.Transform`."""
+        c = self._cairo_context
+        c.save()
+        self._saved.append((self._source, self._line_width, self._font))
+        c.translate(transform.offset_x, transform.offset_y)
+        c.scale(transform.scale, transform.scale)
+
+    def pop_transform(self):
+        self._cairo_context.restore()
+        self._source, self._line_width, self._font = self._saved.pop()
 
     def fill_color(self, color):
         try:
             c = self._cairo_context
-            c.set_source_rgba(*color)
+            self.set_color(color)
             c.paint()
-        except SystemError:
-            pass
+        except SystemError as e:
+            swallowed('Canvas.fill_color', e)
+
+    def draw_surface(self, surface, pos=(0, 0)):
+        try:
+            c = self._cairo_context
+            c.set_source_surface(surface, *pos)
+            self._source = None
+            c.paint()
+        except SystemError as e:
+            swallowed('Canvas.draw_surface', e)
 
     def draw_button(self, button):
         try:
@@ -246,7 +342,7 @@ class Canvas(object):
                                button.text, button.text_size, anchor_x='center', anchor_y='center', color=button.text_color)
 
             return button
-        except SystemError:
-            pass
+        except SystemError as e:
+            swallowed('Canvas.draw_button', e)
 
 
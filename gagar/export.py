@@ -0,0 +1,188 @@
+"""
+Renders a recorded session headless, to PNG frames or raw video.
+
+The frames are split into chunks, which are rendered in parallel
+by a process pool. Each worker seeks to the nearest keyframe before its
+chunk and renders just that slice. Finished chunks arrive in any order
+and are written in order through a bounded reorder buffer.
+
+Raw video is written as BGRA (cairo's ARGB32 on little endian), e.g.
+
+    gagar export game.replay - 30 1280x720 | \\
+        ffmpeg -f rawvideo -pix_fmt bgra -s 1280x720 -r 30 -i - game.mp4
+"""
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+from .replay import ReplayReader
+
+PREROLL = 1.0  # seconds to simulate before a chunk, lets the view settle
+
+_worker = None  # per-process rendering state, see _init_worker()
+
+
+class ReorderBuffer(object):
+    """Collects results that arrive out of order, releases them in order."""
+
+    def __init__(self):
+        self.next_index = 0
+        self.pending = {}
+
+    def put(self, index, item):
+        self.pending[index] = item
+
+    def pop_ready(self):
+        while self.next_index in self.pending:
+            yield self.pending.pop(self.next_index)
+            self.next_index += 1
+
+
+class FrameRenderer(object):
+    """Draws a replay with the same subscribers as the GTK client."""
+
+    def __init__(self, path, width, height, fps):
+        import cairo
+        from .plugins import DEFAULT_CONFIG, subscribe_drawers
+        from .profiles import ProfileSwitcher, Settings, load_profiles
+        from .replay import ReplayClient
+        from .subscriber import MultiSubscriber
+        from .view import View
+
+        self.fps = fps
+        self.multi_sub = MultiSubscriber()
+        self.client = client = ReplayClient(self.multi_sub, path)
+        settings = Settings()
+        subscribe_drawers(self.multi_sub, client, settings=settings)
+
+        self.view = View(client.world, (width, height))
+        self.view.draw_subscriber = self.view.button_subscriber = self.multi_sub
+        self.view.focus_player(client.player)
+        ProfileSwitcher(self.multi_sub, settings, load_profiles(DEFAULT_CONFIG)).select('recording')
+        self.view.configure(settings)
+
+        self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+        self.context = cairo.Context(self.surface)
+
+    def frame_time(self, i):
+        return self.client.reader.start_time + i / self.fps
+
+    def render(self, first, count, out_dir=None):
+        """
+        Renders frames [first, first + count).
+        Writes PNGs into out_dir if given, otherwise returns the raw frames.
+        """
+        client = self.client
+        # let the smoothed zoom/center and the mass graph catch up
+        preroll_frames = int(PREROLL * self.fps)
+        client.seek(self.frame_time(first - preroll_frames))
+        for i in range(first - preroll_frames, first):
+            client.advance(self.frame_time(i))
+            self.view.recalculate()
+
+        frames = []
+        for i in range(first, first + count):
+            client.advance(self.frame_time(i))
+            self.view.render(self.context)
+            self.surface.flush()
+            if out_dir:
+                self.surface.write_to_png(os.path.join(out_dir, 'frame-%06i.png' % i))
+            else:
+                frames.append(bytes(self.surface.get_data()))
+        return frames
+
+
+def _init_worker(path, width, height, fps):
+    global _worker
+    sys.stdout = sys.stderr  # Logger prints, keep stdout clean for the video
+    _worker = FrameRenderer(path, width, height, fps)
+
+
+def _render_chunk(first, count, out_dir):
+    return _worker.render(first, count, out_dir)
+
+
+def export(path, out, fps=30, size=(1280, 720), processes=None,
+           chunk_len=2.0, max_buffered=512 * 1024 * 1024):
+    """
+    Renders the replay at `path` at a fixed frame rate.
+    :param out: directory for PNG frames, '-' for raw video on stdout,
+                or a file name ending in '.raw' for raw video
+    :param chunk_len: seconds of video rendered per task
+    :param max_buffered: bytes of raw frames that may be waiting to be written
+    """
+    reader = ReplayReader(path)
+    num_frames = int(reader.duration * fps) + 1
+    reader.close()
+
+    raw_out = None
+    out_dir = None
+    if out == '-':
+        raw_out = sys.stdout.buffer
+        sys.stdout = sys.stderr
+    elif out.endswith('.raw'):
+        raw_out = open(out, 'wb')
+    else:
+        out_dir = out
+        os.makedirs(out_dir, exist_ok=True)
+
+    processes = processes or os.cpu_count() or 1
+    max_pending = 2 * processes  # bounds the size of the reorder buffer
+    chunk_frames = max(1, int(chunk_len * fps))
+    if raw_out:
+        frame_bytes = 4 * size[0] * size[1]
+        chunk_frames = max(1, min(chunk_frames, max_buffered // (max_pending * frame_bytes)))
+    chunks = [(first, min(chunk_frames, num_frames - first))
+              for first in range(0, num_frames, chunk_frames)]
+
+    # spawn, so workers do not inherit our GTK state
+    ctx = multiprocessing.get_context('spawn')
+    pool = ctx.Pool(processes, _init_worker, (path, size[0], size[1], fps))
+    done = queue.Queue()
+    reorder = ReorderBuffer()
+    submitted = written = 0
+    start = time.monotonic()
+    try:
+        while written < len(chunks):
+            while submitted < len(chunks) and submitted - written < max_pending:
+                first, count = chunks[submitted]
+                pool.apply_async(
+                    _render_chunk, (first, count, out_dir),
+                    callback=lambda frames, i=submitted: done.put((i, frames)),
+                    error_callback=lambda e, i=submitted: done.put((i, e)))
+                submitted += 1
+
+            i, result = done.get()
+            if isinstance(result, BaseException):
+                raise result
+            reorder.put(i, result)
+            for frames in reorder.pop_ready():
+                if raw_out:
+                    for frame in frames:
+                        raw_out.write(frame)
+                written += 1
+
+            done_frames = min(num_frames, written * chunk_frames)
+            sys.stderr.write('\rExported %i/%i frames (%.1f fps)' % (
+                done_frames, num_frames, done_frames / (time.monotonic() - start)))
+        sys.stderr.write('\n')
+    finally:
+        pool.terminate()
+        if raw_out and out != '-':
+            raw_out.close()
+        elif raw_out:
+            raw_out.flush()
+
+
+def main(args):
+    if len(args) < 2 or args[0] in ('-h', '--help'):
+        print("Usage: gagar export <replay> <out dir|file.raw|-> [fps] [WIDTHxHEIGHT] [processes]")
+        return
+
+    path, out, fps, size, processes, *_ = args + [None] * 3
+    fps = float(fps or 30)
+    size = tuple(map(int, size.split('x'))) if size else (1280, 720)
+    processes = int(processes) if processes else None
+    export(path, out, fps, size, processes)
@@ -0,0 +1,311 @@
+"""
+The GTK client: shows the window right away, then finds a server and
+connects in the background, while the window shows "connecting".
+"""
+import random
+import sys
+import threading
+import time
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk, GLib, Gdk
+
+from agarnet.world import World
+from .control import NativeControl
+from .drawutils import *
+from .plugins import DEFAULT_CONFIG, subscribe_drawers
+from .profiles import ProfileSwitcher, Settings, load_profiles
+from .replay import ReplayClient, ReplayRecorder
+from .subscriber import MultiSubscriber, Subscriber
+from .telemetry import Telemetry, serve_prometheus, write_jsonl
+from .window import WorldViewer
+from . import startup
+from socket import gaierror
+
+
+def gtk_watch_client(client):
+    # watch client's websocket in GTK main loop
+    # `or True` is for always returning True to keep watching
+    GLib.io_add_watch(client.ws, GLib.IO_IN, lambda ws, _: client.on_message() or True)
+    GLib.io_add_watch(client.ws, GLib.IO_ERR, lambda ws, _: client.subscriber.on_sock_error() or True)
+    GLib.io_add_watch(client.ws, GLib.IO_HUP, lambda ws, _: client.disconnect() or True)
+
+
+def gtk_main_loop():
+    # Gtk.main() swallows exceptions, get them back
+    sys.excepthook = lambda *args: sys.__excepthook__(*args) or sys.exit()
+
+    Gtk.main()
+
+
+class GtkControl(Subscriber):
+    RETRY_DELAY = 1000  # ms between connection attempts
+
+    def __init__(self, address=None, token=None, nick=None,
+                 metrics_port=None, metrics_file=None, auto_reload=False,
+                 team_sync=None, team_sync_key=None, target_rate=25, latency_log=None,
+                 plugin_config=DEFAULT_CONFIG, profile='default'):
+        # connect the subscribers
+        self.multi_sub = MultiSubscriber(self)
+
+        # show the window first, everything else can happen while it is open
+        self.world_viewer = wv = WorldViewer(World())
+        wv.button_subscriber = wv.draw_subscriber = wv.input_subscriber = self.multi_sub
+        startup.mark('window shown')
+
+        from agarnet.client import Client
+        self.client = client = Client(self.multi_sub)
+        wv.focus_player(client.player)
+        self.nick = nick
+        self.address = address
+        self.token = token
+        self.connecting = False
+        self.frames_drawn = 0
+        self.world_drawn = False
+        self.last_draw = 0
+        self.draw_pending = False  # set while a scheduled_draw() is queued
+        self.window_state = (True, True)  # visible, focused
+
+        # shared with the plugins, switched with F6
+        self.settings = Settings()
+        self.profiles = ProfileSwitcher(self.multi_sub, self.settings,
+                                        load_profiles(plugin_config))
+
+        self.telemetry = Telemetry(client)
+        self.multi_sub.sub(self.telemetry)
+        if metrics_port:
+            serve_prometheus(self.telemetry.registry, int(metrics_port))
+        if metrics_file:
+            write_jsonl(self.telemetry.registry, metrics_file)
+
+        # before the controls, to see the input before the sent command
+        from .latency import LatencyTracker
+        self.latency = LatencyTracker(client, self.telemetry.registry, latency_log)
+        self.multi_sub.sub(self.latency)
+
+        self.native_control = NativeControl(client, target_rate)
+        self.multi_sub.sub(self.native_control)
+
+        self.recorder = ReplayRecorder(client)
+        self.multi_sub.sub(self.recorder)
+
+        from tagar.client import TagarClient
+        self.tagar_client = tagar_client = TagarClient(client)
+
+        if team_sync and not team_sync_key:
+            print('[TEAMSYNC] --team-sync needs --team-sync-key, not syncing')
+        elif team_sync:  # exchange cell deltas directly with teammates
+            from .team_sync import TeamSync, UdpTransport
+            bind, *peers = team_sync.split(',')
+            host, _, port = bind.rpartition(':')
+            peers = [(peer_host, int(peer_port)) for peer_host, peer_port
+                     in (peer.rsplit(':', 1) for peer in peers)]
+            self.team_sync = TeamSync(client, World(), tagar_client=tagar_client)
+            self.team_sync.transport = UdpTransport(int(port), peers, team_sync_key,
+                                                    self.team_sync, host or None)
+            self.multi_sub.sub(self.team_sync)
+
+        # drawers get imported when they draw the first frame,
+        # unless they have to be watched for reloading right away
+        subscribe_drawers(self.multi_sub, client, tagar_client, self.latency,
+                          plugin_config, lazy=not auto_reload, settings=self.settings)
+        self.profiles.select(profile)
+
+        if auto_reload:  # reload subscribers when their source changes
+            from .reload import ReloadWatcher
+            watcher = ReloadWatcher()
+            watcher.watch_subscribers(self.multi_sub)
+            self.multi_sub.sub(watcher)
+        startup.mark('subscribers created')
+
+        self.connect(address, token)
+
+    def connect(self, address=None, token=None):
+        """Finds a server if no address is given, in a background thread."""
+        self.connecting = True
+        self.multi_sub.on_status_msg('connection', 'Connecting to %s ...'
+                                     % (address or 'any server'))
+
+        def discover():
+            try:
+                # also imports urllib, not needed before
+                from agarnet.utils import find_server, get_party_address
+                if not address:
+                    found = find_server()[:2]
+                elif address[0] in 'Pp':  # party
+                    found = get_party_address(token), token
+                else:
+                    found = address, token
+            except Exception as e:  # no network, server list down, ...
+                print("Can't find a server:", e)
+                found = None
+            GLib.idle_add(self.connect_found, found)
+
+        thread = threading.Thread(target=discover)
+        thread.daemon = True
+        thread.start()
+
+    def connect_found(self, found):
+        """Called in the main loop when server discovery is done."""
+        if found is None:
+            GLib.timeout_add(self.RETRY_DELAY, self.retry)
+            return False
+        address, token = found
+        if self.nick is None:
+            from agarnet.utils import special_names
+            self.nick = random.choice(special_names)
+        self.client.player.nick = self.nick
+        try:
+            self.client.connect(address, token)
+        except (ConnectionResetError, gaierror) as e:
+            print("Error while connecting:", e)
+            print("Trying again...")
+            self.client.disconnect()
+            GLib.timeout_add(self.RETRY_DELAY, self.retry)
+            return False
+        self.connecting = False
+        self.multi_sub.on_status_msg('connection', None)
+        startup.mark('connected')
+        gtk_watch_client(self.client)
+        self.world_viewer.focus_player(self.client.player)
+        return False  # do not call again
+
+    def retry(self):
+        self.connect(self.address, self.token)
+        return False
+
+    def on_world_update_post(self):
+        self.queue_draw()
+
+    def queue_draw(self):
+        """
+        Draws a frame, or schedules one if the last one is too recent for the
+        frame rate, which is lower while the window is not focused.
+        Nothing is drawn while the window is minimized.
+        """
+        wv = self.world_viewer
+        if not wv.visible:
+            self.multi_sub.on_frame_skipped(reason='hidden')
+            return  # drawn again when shown
+        frame_rate = self.settings.frame_rate
+        reason = 'frame_rate'
+        if not wv.focused and self.settings.unfocused_frame_rate:
+            frame_rate = min(frame_rate or float('inf'), self.settings.unfocused_frame_rate)
+            reason = 'unfocused'
+        if self.draw_pending:
+            self.multi_sub.on_frame_skipped(reason=reason)
+            return
+        wait = self.last_draw + 1 / frame_rate - time.monotonic() if frame_rate else 0
+        if wait > 0:
+            self.draw_pending = True
+            GLib.timeout_add(int(wait * 1000) + 1, self.scheduled_draw)
+        else:
+            self.draw_now()
+
+    def draw_now(self):
+        self.last_draw = time.monotonic()
+        self.world_viewer.drawing_area.queue_draw()
+
+    def scheduled_draw(self):
+        self.draw_pending = False
+        self.draw_now()
+        return False  # do not call again
+
+    def on_profile_changed(self, settings):
+        self.world_viewer.configure(settings)
+
+    def on_window_state(self, visible, focused):
+        was_visible, was_focused = self.window_state
+        self.window_state = (visible, focused)
+        # shown again or focused: back at full rate right away
+        if visible and (not was_visible or (focused and not was_focused)):
+            self.draw_now()
+
+    def on_frame_drawn(self, duration):
+        if self.frames_drawn == 0:
+            startup.mark('first frame drawn')
+        self.frames_drawn += 1
+        if not self.connecting and not self.world_drawn:
+            self.world_drawn = True
+            startup.mark('first world frame drawn')
+            startup.report()
+
+    def on_draw_hud(self, c, w):
+        if self.connecting:
+            c.draw_text(w.win_size / 2, 'Connecting ...', align='center',
+                        color=WHITE, outline=(BLACK, 3), size=30)
+
+    def on_key_pressed(self, val, char):
+        if val == Gdk.KEY_Tab:
+            self.native_control.toggle_sending_mouse()
+        if val == Gdk.KEY_F5:
+            self.recorder.toggle()
+        if val == Gdk.KEY_F6:
+            self.profiles.cycle()
+        if val == Gdk.KEY_Escape:
+            self.recorder.stop()
+            self.client.disconnect()
+            Gtk.main_quit()
+        elif char == 'c' and not self.connecting:  # reconnect to any server
+            self.client.disconnect()
+            self.address = self.token = None
+            self.connect()
+
+
+class ReplayControl(Subscriber):
+    """Plays back a recorded session, with seeking via arrow keys."""
+
+    SEEK_STEP = 10  # seconds per arrow key press
+
+    def __init__(self, path, speed=1.0):
+        self.multi_sub = MultiSubscriber(self)
+        self.client = client = ReplayClient(self.multi_sub, path)
+        subscribe_drawers(self.multi_sub, client)
+
+        self.speed = speed
+        self.paused = False
+        self.replay_time = client.reader.start_time
+        self.last_tick = time.monotonic()
+
+        self.world_viewer = wv = WorldViewer(client.world)
+        wv.button_subscriber = wv.draw_subscriber = wv.input_subscriber = self.multi_sub
+        wv.focus_player(client.player)
+
+        client.seek(self.replay_time)
+        GLib.timeout_add(40, self.tick)
+
+    def tick(self):
+        now = time.monotonic()
+        if not self.paused:
+            self.replay_time += (now - self.last_tick) * self.speed
+            if not self.client.advance(self.replay_time):
+                self.paused = True
+        self.last_tick = now
+        if self.world_viewer.visible:
+            self.world_viewer.drawing_area.queue_draw()
+        return True  # keep ticking
+
+    def seek(self, t):
+        reader = self.client.reader
+        self.replay_time = min(max(t, reader.start_time), reader.end_time)
+        self.client.seek(self.replay_time)
+        self.multi_sub.on_status_msg('replay', 'Replay at %i:%02i / %i:%02i' % (
+            divmod(self.replay_time - reader.start_time, 60)
+            + divmod(reader.duration, 60)))
+
+    def on_key_pressed(self, val, char):
+        reader = self.client.reader
+        if val == Gdk.KEY_Escape:
+            self.client.disconnect()
+            Gtk.main_quit()
+        elif val == Gdk.KEY_space:
+            self.paused = not self.paused
+        elif val == Gdk.KEY_Left:
+            self.seek(self.replay_time - self.SEEK_STEP)
+        elif val == Gdk.KEY_Right:
+            self.seek(self.replay_time + self.SEEK_STEP)
+        elif val == Gdk.KEY_Home:
+            self.seek(reader.start_time)
+        elif '0' <= char <= '9':  # jump to 0%, 10%, ..., 90%
+            self.seek(reader.start_time + reader.duration * int(char) / 10)
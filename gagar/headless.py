@@ -0,0 +1,140 @@
+"""
+Runs clients without a display, for bots:
+
+    gagar --headless [--bots=N] [options] [nick]
+
+Each bot gets the usual subscribers that do not draw (NativeControl,
+Logger, MassGraph, the Tagar team client, Telemetry) plus the installed
+and configured plugins, and receives world updates at the full network rate.
+All bots share one selector loop, so many of them fit on one machine.
+"""
+import random
+import selectors
+import time
+
+from agarnet.client import Client
+from agarnet.utils import special_names, get_party_address, find_server
+from tagar.client import TagarClient
+from .control import NativeControl
+from .plugins import BUILTIN_PLUGINS, DEFAULT_CONFIG, subscribe_plugins
+from .profiles import ProfileSwitcher, Settings, load_profiles
+from .spatial import CellIndex
+from .stats import PlayerStats
+from .subscriber import MultiSubscriber, Subscriber
+from .telemetry import Registry, Telemetry, serve_prometheus, write_jsonl
+from .threats import ThreatIndex
+from socket import gaierror
+
+# built-in plugins that are useful without drawing
+HEADLESS_PLUGINS = [p for p in BUILTIN_PLUGINS if p.name in ('logger', 'mass_graph')]
+
+
+class HeadlessBot(Subscriber):
+    RETRY_DELAY = 1.0  # seconds between connection attempts
+
+    def __init__(self, address=None, token=None, nick=None, registry=None,
+                 target_rate=25, plugin_config=DEFAULT_CONFIG, profile='headless-bot'):
+        self.multi_sub = MultiSubscriber(self)
+        self.client = client = Client(self.multi_sub)
+        client.player.nick = nick or random.choice(special_names)
+        self.address = address
+        self.token = token
+        self.reconnect_at = 0
+
+        self.telemetry = Telemetry(client, registry)
+        self.multi_sub.sub(self.telemetry)
+
+        self.native_control = NativeControl(client, target_rate)
+        self.multi_sub.sub(self.native_control)
+
+        self.tagar_client = tagar_client = TagarClient(client)
+
+        # for bot plugins, classified before they get the world update
+        cell_index = self.multi_sub.sub(CellIndex(client))
+        self.stats = self.multi_sub.sub(PlayerStats(client))
+        self.threats = self.multi_sub.sub(ThreatIndex(client, cell_index, self.stats))
+
+        self.settings = Settings()
+        context = {'client': client, 'tagar_client': tagar_client,
+                   'cell_index': cell_index, 'stats': self.stats, 'threats': self.threats,
+                   'settings': self.settings}
+        subscribe_plugins(self.multi_sub, HEADLESS_PLUGINS, context, plugin_config)
+        ProfileSwitcher(self.multi_sub, self.settings,
+                        load_profiles(plugin_config)).select(profile)
+
+    def connect(self):
+        """Returns True if connected, schedules a retry otherwise."""
+        address, token = self.address, self.token
+        try:
+            if not address:
+                address, token, *_ = find_server()
+            elif address[0] in 'Pp':  # party
+                address = get_party_address(token)
+            if self.client.connect(address, token):
+                return True
+        except (ConnectionResetError, gaierror, OSError) as e:
+            print("Error while connecting:", e)
+            self.client.disconnect()
+        self.reconnect_at = time.monotonic() + self.RETRY_DELAY
+        return False
+
+    def on_sock_closed(self):
+        self.reconnect_at = time.monotonic() + self.RETRY_DELAY
+
+
+class HeadlessLoop(object):
+    """Reads the sockets of all bots, (re)connects them when needed."""
+
+    def __init__(self, bots=()):
+        self.bots = list(bots)
+        self.selector = selectors.DefaultSelector()
+        self.sockets = {}  # bot -> registered socket
+
+    def add(self, bot):
+        self.bots.append(bot)
+        return bot
+
+    def connect_due(self):
+        now = time.monotonic()
+        for bot in self.bots:
+            if bot in self.sockets or now < bot.reconnect_at:
+                continue
+            if bot.connect():
+                sock = bot.client.ws.sock
+                self.selector.register(sock, selectors.EVENT_READ, bot)
+                self.sockets[bot] = sock
+
+    def poll(self, timeout=0.1):
+        """Handles all received messages, waits at most `timeout` seconds."""
+        self.connect_due()
+        for key, _ in self.selector.select(timeout):
+            key.data.client.on_message()
+
+        # disconnected while receiving, or by a subscriber
+        for bot, sock in list(self.sockets.items()):
+            if not bot.client.connected:
+                self.selector.unregister(sock)
+                del self.sockets[bot]
+
+    def run(self):
+        while self.bots:
+            self.poll()
+
+
+def run_headless(address=None, token=None, nick=None, num_bots=1,
+                 metrics_port=None, metrics_file=None, **kwargs):
+    registry = Registry()  # shared, counters add up over all bots
+    if metrics_port:
+        serve_prometheus(registry, int(metrics_port))
+    if metrics_file:
+        write_jsonl(registry, metrics_file)
+    loop = HeadlessLoop()
+    for i in range(num_bots):
+        bot_nick = nick if num_bots == 1 or not nick else '%s %i' % (nick, i + 1)
+        loop.add(HeadlessBot(address, token, bot_nick, registry, **kwargs))
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        for bot in loop.bots:
+            bot.client.disconnect()
+    return registry
@@ -0,0 +1,155 @@
+"""
+Measures how long it takes from a key/mouse press until its effect is on screen.
+
+Every command (split, shoot, respawn) passes four timestamps:
+input (key/mouse event), send (packet written), world (first world update
+showing the effect) and frame (first frame drawn after that update).
+The stages in between and the total end up in histograms of the telemetry
+registry, in a JSONL log if requested, and in a HUD meter.
+"""
+from collections import deque
+import json
+from time import monotonic, time
+
+from .drawutils import *
+from .subscriber import Subscriber
+from .telemetry import Registry
+
+STAGES = ('send', 'world', 'frame', 'total')
+INPUT_MAX_AGE = 0.1  # seconds between input event and send, for matching
+EFFECT_TIMEOUT = 2.0  # seconds, e.g. splitting with too little mass does nothing
+
+
+class Measurement(object):
+    def __init__(self, command, input_time, send_time, player):
+        self.command = command
+        self.input_time = input_time
+        self.send_time = send_time
+        self.world_time = None
+        self.frame_time = None
+        # what the effect gets compared to
+        self.own_ids = set(player.own_ids)
+        self.world_cids = set(player.world.cells) if command == 'shoot' else ()
+
+    def has_effect(self, player):
+        if self.command == 'split':
+            return len(player.own_ids) > len(self.own_ids)
+        if self.command == 'respawn':
+            return bool(player.own_ids) and not player.own_ids & self.own_ids
+        if self.command == 'shoot':
+            # new ejected mass close to us
+            center = player.center
+            for cid, cell in player.world.cells.items():
+                if cid not in self.world_cids and cell.is_ejected_mass \
+                        and (cell.pos - center).len() < 500:
+                    return True
+        return False
+
+    def stages(self):
+        return {'send': self.send_time - self.input_time,
+                'world': self.world_time - self.send_time,
+                'frame': self.frame_time - self.world_time,
+                'total': self.frame_time - self.input_time}
+
+
+class LatencyTracker(Subscriber):
+    """
+    Subscribe before the controls, so the input timestamp is taken
+    before the command gets sent.
+    """
+
+    def __init__(self, client, registry=None, log_path=None, history=100):
+        self.client = client
+        self.registry = registry or Registry()
+        self.log_file = open(log_path, 'a', buffering=1) if log_path else None
+        self.last_input = None
+        self.pending = []  # sent, effect not yet seen
+        self.drawn = []  # effect seen, waiting for the frame
+        self.history = history
+        self.recent = {}  # command -> stage -> deque of seconds
+        self.histograms = {}  # (command, stage) -> Histogram
+        self.timeouts = self.registry.counter(
+            'gagar_input_timeouts_total', 'Commands without visible effect')
+
+    def on_key_pressed(self, val, char):
+        self.last_input = monotonic()
+
+    def on_mouse_pressed(self, button):
+        self.last_input = monotonic()
+
+    def on_input_sent(self, command):
+        """Emitted by the controls right after sending a command."""
+        now = monotonic()
+        input_time = self.last_input
+        if input_time is None or now - input_time > INPUT_MAX_AGE:
+            input_time = now  # not caused by a key press, e.g. a bot
+        self.last_input = None
+        self.pending.append(Measurement(command, input_time, now, self.client.player))
+
+    def on_world_update_post(self):
+        if not self.pending:
+            return
+        now = monotonic()
+        player = self.client.player
+        still_pending = []
+        for m in self.pending:
+            if m.has_effect(player):
+                m.world_time = now
+                self.drawn.append(m)
+            elif now - m.send_time > EFFECT_TIMEOUT:
+                self.timeouts.inc()
+            else:
+                still_pending.append(m)
+        self.pending = still_pending
+
+    def on_frame_drawn(self, duration):
+        if not self.drawn:
+            return
+        now = monotonic()
+        for m in self.drawn:
+            m.frame_time = now
+            self.record(m)
+        self.drawn = []
+
+    def on_sock_closed(self):
+        self.pending = []
+        self.drawn = []
+
+    def record(self, m):
+        stages = m.stages()
+        recent = self.recent.setdefault(m.command, {})
+        for stage, seconds in stages.items():
+            histogram = self.histograms.get((m.command, stage))
+            if histogram is None:
+                histogram = self.histograms[m.command, stage] = self.registry.histogram(
+                    'gagar_input_latency_seconds', 'Time from input to its effect, by stage',
+                    command=m.command, stage=stage)
+            histogram.observe(seconds)
+            recent.setdefault(stage, deque(maxlen=self.history)).append(seconds)
+
+        if self.log_file:
+            entry = dict(stages, command=m.command, time=time())
+            self.log_file.write(json.dumps(entry, sort_keys=True) + '\n')
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+class LatencyMeter(Subscriber):
+    """Shows median and worst recent latencies of each command and stage."""
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+
+    def on_draw_hud(self, c, w):
+        y = 120
+        for command, recent in sorted(self.tracker.recent.items()):
+            total = recent['total']
+            text = '%s: %i ms (max %i)  ' % (command, median(total) * 1000, max(total) * 1000)
+            text += '  '.join('%s %i' % (stage, median(recent[stage]) * 1000)
+                              for stage in STAGES[:-1])
+            c.draw_text((w.win_size.x / 2, y), text, align='center',
+                        color=WHITE, outline=(BLACK, 2), size=12)
+            y += 16
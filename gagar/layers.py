@@ -0,0 +1,58 @@
+"""
+HUD elements that rarely change get drawn into their own surface,
+which is only redrawn when the element's version changes
+(new leaderboard, window resized, ...) and otherwise blitted as is.
+
+    class Leaderboard(Subscriber):
+        def __init__(self):
+            self.layer = Layer()
+            self.version = 0
+
+        def on_leaderboard_names(self, leaderboard):
+            self.version += 1
+
+        def on_draw_hud(self, c, w):
+            rect = (w.win_size.x - 300, 0, 300, 300)
+            self.layer.draw(c, (self.version, rect), rect, self.draw)
+
+        def draw(self, c):
+            # drawn in window coordinates, as usual
+"""
+from .drawutils import Canvas
+
+
+class Layer(object):
+    def __init__(self):
+        self.surface = None
+        self.version = None
+        self.size = None
+        self.redraws = 0
+
+    def draw(self, c, version, rect, draw_func):
+        """
+        Blits the layer at `rect` (left, top, width, height in window coordinates),
+        calling `draw_func(canvas)` first if `version` changed since the last time.
+        """
+        left, top, width, height = rect
+        if version != self.version or self.surface is None:
+            self.redraw(left, top, max(1, int(width)), max(1, int(height)), draw_func)
+            self.version = version
+        c.draw_surface(self.surface, (left, top))
+
+    def redraw(self, left, top, width, height, draw_func):
+        import cairo  # not needed without a display
+        if self.size != (width, height):
+            self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+            self.size = (width, height)
+            ctx = cairo.Context(self.surface)
+        else:  # reuse, but clear it
+            ctx = cairo.Context(self.surface)
+            ctx.set_operator(cairo.OPERATOR_CLEAR)
+            ctx.paint()
+            ctx.set_operator(cairo.OPERATOR_OVER)
+        ctx.translate(-left, -top)
+        draw_func(Canvas(ctx))
+        self.redraws += 1
+
+    def invalidate(self):
+        self.version = None
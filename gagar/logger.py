@@ -0,0 +1,185 @@
+from collections import deque, OrderedDict
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import queue
+
+from .drawutils import *
+from .layers import Layer
+from .subscriber import Subscriber
+
+
+def format_log(lines, width, indent='  '):
+    width = int(width)
+    for l in lines:
+        ind = ''
+        while len(l) > len(ind):
+            yield l[:width]
+            ind = indent
+            l = ind + l[width:]
+
+
+def open_log_file(path, max_bytes=1024 * 1024, backup_count=3):
+    """
+    Returns a `logging.Logger` writing to a rotating file.
+    Writing happens in a background thread, logging only enqueues.
+    """
+    handler = RotatingFileHandler(path, maxBytes=max_bytes,
+                                  backupCount=backup_count, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    log_queue = queue.Queue()
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)  # flush remaining messages
+
+    file_logger = logging.getLogger('gagar.log.%s' % path)
+    file_logger.propagate = False
+    file_logger.setLevel(logging.INFO)
+    file_logger.addHandler(QueueHandler(log_queue))
+    return file_logger
+
+
+class Logger(Subscriber):
+    """
+    Scrolling log of the last `max_msgs` messages,
+    followed by status lines (mass, leaderboard, ...) that get updated in place.
+    """
+
+    LINE_H = 12
+    CHAR_W = 6  # seems to work with my font
+
+    def __init__(self, client, stats, max_msgs=100, log_file=None):
+        self.client = client
+        self.stats = stats
+        self.log_msgs = deque(maxlen=max_msgs)
+        self.status_msgs = OrderedDict()  # key -> msg, shown below the log
+        self.file_logger = open_log_file(log_file) if log_file else None
+
+        # wrapped lines, only rebuilt when messages or width change
+        self.log_version = self.status_version = 0
+        self.wrapped_key = None
+        self.wrapped = []
+        self.layer = Layer()
+
+    def on_log_msg(self, msg, update=0, tag='[LOG]'):
+        """
+        Updates last `update` msgs with new data.
+        Compares first 5 chars or up to first space.
+        Set update=0 for no updating.
+        """
+        first_space = msg.index(' ') if ' ' in msg else 5
+        log_msgs = self.log_msgs
+        for i in range(1, min(update, len(log_msgs)) + 1):
+            if msg[:first_space] == log_msgs[-i][:first_space]:
+                log_msgs[-i] = msg
+                break
+        else:
+            log_msgs.append(msg)
+            try:
+                print(tag, msg)
+            except UnicodeEncodeError:
+                pass
+            if self.file_logger:
+                self.file_logger.info('%s %s', tag, msg)
+        self.log_version += 1
+
+    def on_update_msg(self, msg, update=9):
+        self.on_log_msg(msg=msg, update=update)
+
+    def on_status_msg(self, key, msg):
+        """
+        Sets the status line `key` to `msg`, or removes it if `msg` is None.
+        Status lines are shown below the log and are not printed again
+        when they change, so they can be updated on every world update.
+        """
+        if msg is None:
+            if self.status_msgs.pop(key, None) is not None:
+                self.status_version += 1
+            return
+        if self.status_msgs.get(key) == msg:
+            return
+        if key not in self.status_msgs:
+            try:
+                print('[LOG]', msg)
+            except UnicodeEncodeError:
+                pass
+        self.status_msgs[key] = msg
+        self.status_version += 1
+
+    def on_connect_error(self, msg):
+        self.on_log_msg(msg, tag='[ERROR]')
+
+    on_message_error = on_connect_error
+
+    def on_sock_open(self):
+        self.on_update_msg('Connected to %s' % self.client.address)
+        self.on_update_msg('Token: %s' % self.client.server_token)
+
+    def on_world_rect(self, **kwargs):
+        self.on_update_msg('World is from %(left)i:%(top)i to %(right)i:%(bottom)i' % kwargs)
+
+    def on_server_version(self, number, text):
+        self.on_log_msg('Server version %s from %s' % (number, text))
+
+    def on_cell_eaten(self, eater_id, eaten_id):
+        player = self.client.player
+        if eaten_id in player.own_ids:
+            name = 'Someone'
+            if eater_id in player.world.cells:
+                name = '"%s"' % player.world.cells[eater_id].name
+            what = 'killed' if len(player.own_ids) <= 1 else 'ate'
+            msg = '%s %s me!' % (name, what)
+            self.on_update_msg(msg)
+
+    def on_world_update_post(self):
+        x, y = self.client.player.center
+        self.on_status_msg('mass', 'Mass: %i Pos: (%.2f %.2f)' % (self.stats.total_mass, x, y))
+
+    def on_own_id(self, cid):
+        if len(self.client.player.own_ids) == 1:
+            self.on_log_msg('Respawned as %s' % self.client.player.nick)
+            self.on_status_msg('split', None)
+        else:
+            self.on_status_msg('split', 'Split into %i cells' % len(self.client.player.own_ids))
+
+    def on_leaderboard_names(self, leaderboard):
+        # subscribed after the stats, which got the new leaderboard already
+        if self.stats.rank is not None:
+            msg = 'Leaderboard: %i. (best: %i.)' % (self.stats.rank, self.stats.best_rank)
+            self.on_status_msg('leaderboard', msg)
+
+    def wrapped_lines(self, width, num_lines):
+        """Last `num_lines` lines of the log, wrapped at `width` chars."""
+        key = (self.log_version, self.status_version, width, num_lines)
+        if key != self.wrapped_key:
+            lines = list(format_log(self.status_msgs.values(), width))
+            # wrap only as many of the newest messages as can be shown
+            for msg in reversed(self.log_msgs):
+                if len(lines) >= num_lines:
+                    break
+                lines[:0] = format_log((msg,), width)
+            self.wrapped = lines[-num_lines:]
+            self.wrapped_key = key
+        return self.wrapped
+
+    def on_draw_hud(self, c, w):
+        # scrolling log
+        log = self.wrapped_lines(int(w.INFO_SIZE / self.CHAR_W),
+                                 int(w.INFO_SIZE / self.LINE_H))
+        height = len(log) * self.LINE_H
+        rect = (0, w.win_size.y - height, w.INFO_SIZE, height)
+        self.layer.draw(c, (self.wrapped_key, rect), rect, lambda c: self.draw(c, w, log))
+
+    def draw(self, c, w, log):
+        log_line_h = self.LINE_H
+        num_log_lines = len(log)
+
+        y_start = w.win_size.y - num_log_lines*log_line_h + 9
+
+        c.fill_rect((0, w.win_size.y - num_log_lines*log_line_h),
+                    size=(w.INFO_SIZE, num_log_lines*log_line_h),
+                    color=to_rgba(BLACK, .3))
+
+        for i, text in enumerate(log):
+            c.draw_text((0, y_start + i*log_line_h), text,
+                        align='left', size=10, face='monospace')
@@ -1,304 +1,30 @@
-import random
+"""
+Entry point. Only imports what the chosen mode needs, GTK included.
+"""
 import sys
 
-import gi
-gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, GLib, Gdk
-
-from agarnet.client import Client
-from agarnet.utils import special_names, get_party_address, find_server
-from tagar.client import TagarClient
-from .draw_hud import *
-from .draw_cells import *
-from .draw_background import *
-from .drawutils import *
-from .skins import CellSkins
-from .subscriber import MultiSubscriber, Subscriber
-from .team_overlay import TeamOverlay
-from .window import WorldViewer
-from socket import gaierror
-
-
-class NativeControl(Subscriber):
-    def __init__(self, client):
-        self.client = client
-        self.movement_delta = Vec()
-        self.sending_mouse = True
-
-    def toggle_sending_mouse(self):
-        self.sending_mouse = not self.sending_mouse
-
-    def send_mouse(self):
-        target = self.client.player.center + self.movement_delta
-        self.client.send_target(*target)
-
-    def on_world_update_post(self):
-        # keep cells moving even when mouse stands still
-        if self.sending_mouse:
-            self.send_mouse()
-
-    def on_mouse_moved(self, pos, pos_world):
-        self.movement_delta = pos_world - self.client.player.center
-        if self.sending_mouse:
-            self.send_mouse()
-
-    def on_mouse_pressed(self, button):
-        if button == 2: # Middle click
-            self.send_mouse()
-            self.client.send_shoot()
-        elif button == 3: # Right click
-            self.send_mouse()
-            self.client.send_split()
-
-    def on_key_pressed(self, val, char):
-        if char == 's':
-            self.client.send_spectate()
-        elif char == 'q':
-            self.client.send_spectate_toggle()
-        elif char == 'r' or val == Gdk.KEY_Return:
-            self.client.send_respawn()
-        elif char == 'w':
-            self.send_mouse()
-            self.client.send_shoot()
-        elif val == Gdk.KEY_space:
-            self.send_mouse()
-            self.client.send_split()
-        elif char == 'k':
-            self.client.send_explode()
-
-
-def format_log(lines, width, indent='  '):
-    width = int(width)
-    for l in lines:
-        ind = ''
-        while len(l) > len(ind):
-            yield l[:width]
-            ind = indent
-            l = ind + l[width:]
-
-
-class Logger(Subscriber):
-    def __init__(self, client):
-        self.client = client
-        self.log_msgs = []
-        self.leader_best = 11 # outside leaderboard, to show first msg on >=10
-
-    def on_log_msg(self, msg, update=0, tag='[LOG]'):
-        """
-        Updates last `update` msgs with new data.
-        Compares first 5 chars or up to first space.
-        Set update=0 for no updating.
-        """
-        first_space = msg.index(' ') if ' ' in msg else 5
-        for i, log_msg in enumerate(reversed(
-                self.log_msgs[-update:] if update else [])):
-            if msg[:first_space] == log_msg[:first_space]:
-                self.log_msgs[-i - 1] = msg
-                break
-        else:
-            self.log_msgs.append(msg)
-            try:
-                print(tag, msg)
-            except UnicodeEncodeError:
-                pass
-
-    def on_update_msg(self, msg, update=9):
-        self.on_log_msg(msg=msg, update=update)
-
-    def on_connect_error(self, msg):
-        self.on_log_msg(msg, tag='[ERROR]')
-
-    on_message_error = on_connect_error
-
-    def on_sock_open(self):
-        self.on_update_msg('Connected to %s' % self.client.address)
-        self.on_update_msg('Token: %s' % self.client.server_token)
-
-    def on_world_rect(self, **kwargs):
-        self.on_update_msg('World is from %(left)i:%(top)i to %(right)i:%(bottom)i' % kwargs)
-
-    def on_server_version(self, number, text):
-        self.on_log_msg('Server version %s from %s' % (number, text))
-
-    def on_cell_eaten(self, eater_id, eaten_id):
-        player = self.client.player
-        if eaten_id in player.own_ids:
-            name = 'Someone'
-            if eater_id in player.world.cells:
-                name = '"%s"' % player.world.cells[eater_id].name
-            what = 'killed' if len(player.own_ids) <= 1 else 'ate'
-            msg = '%s %s me!' % (name, what)
-            self.on_update_msg(msg)
-
-    def on_world_update_post(self):
-        player = self.client.player
-        x, y = player.center
-        self.on_update_msg('Mass: %i Pos: (%.2f %.2f)' % (player.total_mass, x, y))
-
-    def on_own_id(self, cid):
-        if len(self.client.player.own_ids) == 1:
-            self.on_log_msg('Respawned as %s' % self.client.player.nick)
-        else:
-            self.on_update_msg('Split into %i cells' % len(self.client.player.own_ids))
-
-    def on_leaderboard_names(self, leaderboard):
-        if not self.client.player.own_ids:
-            return
-        our_cid = min(c.cid for c in self.client.player.own_cells)
-        for rank, (cid, name) in enumerate(leaderboard):
-            if cid == our_cid:
-                rank += 1  # start at rank 1
-                self.leader_best = min(rank, self.leader_best)
-                msg = 'Leaderboard: %i. (best: %i.)' % (rank, self.leader_best)
-                self.on_update_msg(msg)
-
-    def on_draw_hud(self, c, w):
-        # scrolling log
-        log_line_h = 12
-        log_char_w = 6  # seems to work with my font
-
-        log = list(format_log(self.log_msgs, w.INFO_SIZE / log_char_w))
-        num_log_lines = min(len(log), int(w.INFO_SIZE / log_line_h))
-
-        y_start = w.win_size.y - num_log_lines*log_line_h + 9
-
-        c.fill_rect((0, w.win_size.y - num_log_lines*log_line_h),
-                    size=(w.INFO_SIZE, num_log_lines*log_line_h),
-                    color=to_rgba(BLACK, .3))
-
-        for i, text in enumerate(log[-num_log_lines:]):
-            c.draw_text((0, y_start + i*log_line_h), text,
-                        align='left', size=10, face='monospace')
-
-
-def gtk_watch_client(client):
-    # watch client's websocket in GTK main loop
-    # `or True` is for always returning True to keep watching
-    GLib.io_add_watch(client.ws, GLib.IO_IN, lambda ws, _: client.on_message() or True)
-    GLib.io_add_watch(client.ws, GLib.IO_ERR, lambda ws, _: client.subscriber.on_sock_error() or True)
-    GLib.io_add_watch(client.ws, GLib.IO_HUP, lambda ws, _: client.disconnect() or True)
-
-
-def gtk_main_loop():
-    # Gtk.main() swallows exceptions, get them back
-    sys.excepthook = lambda *args: sys.__excepthook__(*args) or sys.exit()
-
-    Gtk.main()
-
-
-class KeyToggler(MultiSubscriber):
-    def __init__(self, key, *subs, disabled=False):
-        super(KeyToggler, self).__init__(*subs)
-        self.toggle_key = key
-        self.enabled = not disabled
-
-    def __getattr__(self, func_name):
-        if self.enabled and func_name[:3] == 'on_':
-            return MultiSubscriber.__getattr__(self, func_name)
-        return lambda *_, **__: None
-
-    def on_key_pressed(self, val, char):
-        if val == self.toggle_key:
-            self.enabled = not self.enabled
-        self.__getattr__('on_key_pressed')(val, char)
-
-
-class GtkControl(Subscriber):
-    def __init__(self, address, token=None, nick=None):
-        if nick is None:
-            nick = random.choice(special_names)
-
-        # connect the subscribers
-        # order is important, first subscriber gets called first
-
-        self.multi_sub = MultiSubscriber(self)
-        def key(keycode, *subs, disabled=False):
-            # subscribe all these subscribers, toggle them when key is pressed
-            if isinstance(keycode, str):
-                keycode = ord(keycode)
-            self.multi_sub.sub(KeyToggler(keycode, *subs, disabled=disabled))
-
-        self.client = client = Client(self.multi_sub)
-        self.tagar_client = tagar_client = TagarClient(client)
-
-        self.native_control = NativeControl(client)
-        self.multi_sub.sub(self.native_control)
-
-        # background
-        key(Gdk.KEY_F2, SolidBackground())
-        key(Gdk.KEY_F2, SolidBackground(WHITE), disabled=True)
-        key('b', WorldBorderDrawer(), FieldOfView())
-        key('g', GridDrawer())
-
-        self.multi_sub.sub(CellsDrawer())
-
-        # cell overlay
-        key('k', CellSkins())
-        key('n', CellNames())
-        key('i',
-            CellHostility(),
-            CellMasses(),
-            RemergeTimes(),
-            ForceFields(),
-            )
-        key('m', MovementLines())
-
-        # HUD
-        key(Gdk.KEY_F1,
-            SplitCounter(),
-            Minimap(),
-            Leaderboard(),
-            ExperienceMeter(),
-            Logger(client),
-            MassGraph(client),
-            )
-
-        # Team Overlay
-        key('t', TeamOverlay(tagar_client))
-
-        key(Gdk.KEY_F3, FpsMeter(50), disabled=True)
-
-        client.player.nick = nick
-
-        connected = False
-        while not connected:
-            try:
-                client.connect(address, token)
-            except ConnectionResetError as e:
-                print("Error while connecting:", e)
-                print("Trying again...")
-                client.disconnect()
-                continue
-            except gaierror as e:
-                print("Can't connect to agario.io:", e)
-                print("Trying again...")
-                client.disconnect()
-                continue
-            connected = True
-
-        gtk_watch_client(client)
-
-        self.world_viewer = wv = WorldViewer(client.world)
-        wv.button_subscriber = wv.draw_subscriber = wv.input_subscriber = self.multi_sub
-        wv.focus_player(client.player)
-
-    def on_world_update_post(self):
-        self.world_viewer.drawing_area.queue_draw()
-
-    def on_key_pressed(self, val, char):
-        if val == Gdk.KEY_Tab:
-            self.native_control.toggle_sending_mouse()
-        if val == Gdk.KEY_Escape:
-            self.client.disconnect()
-            Gtk.main_quit()
-        elif char == 'c':  # reconnect to any server
-            self.client.disconnect()
-            address, token, *_ = find_server()
-            self.client.connect(address, token)
-            self.world_viewer.focus_player(self.client.player)
+from . import startup
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'export':
+        # stdout may be the video pipe, do not print anything there
+        from .export import main as export_main
+        export_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench-tiles':
+        from .tiles import main as bench_main
+        bench_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench-alloc':
+        from .allocations import main as bench_main
+        bench_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench-calls':
+        from .callcount import main as bench_main
+        bench_main(sys.argv[2:])
+        return
+
     print("Copyright (C) 2015  Gjum  <code.gjum@gmail.com>\n"
           "This program comes with ABSOLUTELY NO WARRANTY.\n"
           "This is free software, and you are welcome to redistribute it\n"
@@ -306,23 +32,85 @@ def main():
           "Project homepage: https://github.com/Gjum/gagar\n"
           "Version: 0.1.1\n")
 
-    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
-        print("Usage: %s [nick]" % sys.argv[0])
-        print("       %s party <token> [nick]" % sys.argv[0])
-        print("       %s <IP:port> <token> [nick]" % sys.argv[0])
+    # --name=value options may be given anywhere
+    options = dict(arg[2:].split('=', 1) if '=' in arg else (arg[2:], True)
+                   for arg in sys.argv[1:] if arg[:2] == '--')
+    args = [arg for arg in sys.argv[1:] if arg[:2] != '--']
+
+    if 'profile-startup' in options:
+        startup.enable()
+    if 'diagnostics' in options:
+        from . import diagnostics
+        diagnostics.enable()
+    from .plugins import DEFAULT_CONFIG
+
+    if 'help' in options or args[:1] == ['-h']:
+        print("Usage: %s [options] [nick]" % sys.argv[0])
+        print("       %s [options] party <token> [nick]" % sys.argv[0])
+        print("       %s [options] <IP:port> <token> [nick]" % sys.argv[0])
+        print("       %s --headless [--bots=N] [options] [nick]" % sys.argv[0])
+        print("       %s replay <file>" % sys.argv[0])
+        print("       %s export <replay> <out dir|file.raw|-> [fps] [WIDTHxHEIGHT] [processes]" % sys.argv[0])
+        print("       %s bench-tiles [cells] [WIDTHxHEIGHT] [frames]" % sys.argv[0])
+        print("       %s bench-alloc [cells] [frames]" % sys.argv[0])
+        print("       %s bench-calls [cells|replay] [frames]" % sys.argv[0])
+        print("Options:")
+        print("  --metrics-port=PORT  serve Prometheus metrics on localhost:PORT")
+        print("  --metrics-file=FILE  append metrics to FILE as JSON lines every second")
+        print("  --reload             reload subscribers when their source file changes")
+        print("  --team-sync=[ADDR:]PORT,HOST:PORT,...")
+        print("                       exchange seen cells with teammates over UDP, listening on")
+        print("                       ADDR (default: the interface reaching the first HOST)")
+        print("  --team-sync-key=KEY  shared key signing the team sync messages, required")
+        print("  --target-rate=HZ     max. mouse target packets per second (default 25)")
+        print("  --latency-log=FILE   log input-to-screen latencies as JSON lines")
+        print("  --plugins=FILE       plugin config (default %s)" % DEFAULT_CONFIG)
+        print("  --profile=NAME       performance profile: default, kiosk-low, competitive,")
+        print("                       headless-bot (default with --headless), recording")
+        print("  --profile-startup    print import and initialization times")
+        print("  --diagnostics        log exceptions caught while drawing, with tracebacks")
+        print("  --headless           run without window, e.g. for bot plugins")
+        print("  --bots=N             with --headless, run N clients (default 1)")
+        return
+
+    if 'headless' in options:
+        from .headless import run_headless
+        address, token, nick, *_ = args + ([None] * 3)
+        if token is None:
+            nick = address
+            address = None
+        run_headless(address, token, nick,
+                     num_bots=int(options.get('bots', 1)),
+                     metrics_port=options.get('metrics-port'),
+                     metrics_file=options.get('metrics-file'),
+                     target_rate=float(options.get('target-rate', 25)),
+                     plugin_config=options.get('plugins', DEFAULT_CONFIG),
+                     profile=options.get('profile', 'headless-bot'))
+        return
+
+    from .gtk_control import GtkControl, ReplayControl, gtk_main_loop
+    startup.mark('GTK imported')
+
+    if len(args) > 1 and args[0] == 'replay':
+        ReplayControl(args[1])
+        gtk_main_loop()
         return
 
-    address, token, nick, *_ = sys.argv[1:] + ([None] * 3)
+    address, token, nick, *_ = args + ([None] * 3)
 
     if token is None:
         nick = address
         address = None
 
-    if address and address[0] in 'Pp':
-        address = get_party_address(token)
-
-    if not address:
-        address, token, *_ = find_server()
-
-    GtkControl(address, token, nick)
+    # server/party address is looked up while the window is already open
+    GtkControl(address, token, nick,
+               metrics_port=options.get('metrics-port'),
+               metrics_file=options.get('metrics-file'),
+               auto_reload='reload' in options,
+               team_sync=options.get('team-sync'),
+               team_sync_key=options.get('team-sync-key'),
+               target_rate=float(options.get('target-rate', 25)),
+               latency_log=options.get('latency-log'),
+               plugin_config=options.get('plugins', DEFAULT_CONFIG),
+               profile=options.get('profile', 'default'))
     gtk_main_loop()
@@ -0,0 +1,342 @@
+"""
+Plugins are subscribers that are only imported when first enabled.
+
+A plugin is declared with the events it handles and the key that toggles it,
+so it can be subscribed without importing its module:
+
+    plugin = Plugin('bot', 'mybot.gagar:Bot', key='F6',
+                    events=('on_world_update_post', 'on_draw_hud'),
+                    args=('client',), disabled=True)
+
+Installed packages provide plugins through the `gagar.plugins` entry point
+group, pointing to such a declaration (or to a subscriber class, which is
+then imported at startup and gets all events).
+
+The config file (default ~/.config/gagar/plugins.cfg) switches plugins on,
+off (subscribed, but disabled until their key is pressed) or never
+(not even subscribed), changes keys, and declares more plugins:
+
+    [plugins]
+    grid = never
+    fps_meter = on
+
+    [plugin:bot]
+    target = mybot.gagar:Bot
+    events = on_world_update_post on_draw_hud
+    args = client
+    kwargs = aggressive=True max_mass=5000
+    key = F6
+    disabled = yes
+"""
+import ast
+import configparser
+import copy
+import importlib
+import os
+
+from .drawutils import WHITE
+from .spatial import CellIndex
+from .stats import PlayerStats
+from .subscriber import Subscriber, ignore
+from .threats import ThreatIndex
+
+ENTRY_POINT_GROUP = 'gagar.plugins'
+DEFAULT_CONFIG = os.path.expanduser('~/.config/gagar/plugins.cfg')
+
+GDK_KEY_F1 = 0xffbe  # Gdk.KEY_F1, F2 etc. follow
+
+
+def key_code(name):
+    """Gdk key value of a key name like 'i', 'F3' or 'Tab'."""
+    if name is None or isinstance(name, int):
+        return name
+    if len(name) == 1:
+        return ord(name)
+    if name[0] == 'F' and name[1:].isdigit():
+        return GDK_KEY_F1 + int(name[1:]) - 1
+    from gi.repository import Gdk
+    return Gdk.keyval_from_name(name)
+
+
+def import_target(target):
+    """Imports 'package.module:attribute', or returns `target` itself."""
+    if not isinstance(target, str):
+        return target
+    module_name, _, attr = target.partition(':')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+class Plugin(object):
+    """
+    Declares a subscriber: which class (as 'module:Class') to create
+    with which context `args` (e.g. 'client') and `kwargs`,
+    which `events` it handles (None: all, needs importing first),
+    and which `key` toggles it.
+    """
+
+    def __init__(self, name, target, events=None, key=None, args=(),
+                 kwargs=None, disabled=False):
+        self.name = name
+        self.target = target
+        self.events = frozenset(events) if events is not None else None
+        self.key = key
+        self.args = tuple(args)
+        self.kwargs = kwargs or {}
+        self.disabled = disabled
+
+    def create(self, context):
+        cls = import_target(self.target)
+        instance = cls(*(context.get(arg[:-1]) if arg[-1:] == '?' else context[arg]
+                         for arg in self.args), **self.kwargs)
+        handled = set(name for name in dir(instance) if name[:3] == 'on_')
+        if self.events is not None and not handled <= self.events:
+            print('[PLUGIN] %s does not declare %s'
+                  % (self.name, ', '.join(sorted(handled - self.events))))
+        return instance
+
+
+class PluginSlot(Subscriber):
+    """
+    Subscribed in place of a plugin: creates it when first enabled
+    (or, if `lazy`, when it first gets an event), toggles it with its key,
+    forwards only its declared events.
+    """
+
+    def __init__(self, plugin, context, lazy=False):
+        self.plugin = plugin
+        self.context = context
+        self.lazy = lazy
+        self.toggle_key = key_code(plugin.key)
+        self.instance = None
+        self.enabled = False
+        if not plugin.disabled:
+            self.enable()
+
+    @property
+    def subs(self):
+        # lets the ReloadWatcher find the plugin instance
+        return [self.instance] if self.instance is not None else []
+
+    def enable(self):
+        if self.instance is None and not self.lazy:
+            self.load()
+        self.enabled = True
+
+    def load(self):
+        self.instance = self.plugin.create(self.context)
+        return self.instance
+
+    def on_key_pressed(self, val, char):
+        if val == self.toggle_key:
+            if self.enabled:
+                self.enabled = False
+            else:
+                self.enable()
+        if self.enabled and self.handles('on_key_pressed'):
+            (self.instance or self.load()).on_key_pressed(val, char)
+
+    def on_profile_changed(self, settings):
+        state = settings.plugins.get(self.plugin.name)
+        if state is None:  # back to how it is configured
+            state = 'off' if self.plugin.disabled else 'on'
+        if state == 'on':
+            self.enable()
+        else:
+            self.enabled = False
+        # plugins not loaded yet read the shared settings when created
+        if self.enabled and self.instance is not None and self.handles('on_profile_changed'):
+            self.instance.on_profile_changed(settings)
+
+    def handles(self, func_name):
+        events = self.plugin.events
+        return events is None or func_name in events
+
+    def __getattr__(self, func_name):
+        super(PluginSlot, self).__getattr__(func_name)
+        if not self.handles(func_name):
+            return ignore
+
+        # the handler gets cached, so check for `enabled` when it is called
+        def toggled(*args, **kwargs):
+            if self.enabled:
+                getattr(self.instance or self.load(), func_name)(*args, **kwargs)
+
+        return toggled
+
+
+DRAW_BACKGROUND = ('on_draw_background',)
+DRAW_CELLS = ('on_draw_cells',)
+DRAW_HUD = ('on_draw_hud',)
+
+# in drawing order, first subscriber gets called first
+BUILTIN_PLUGINS = [
+    # background
+    Plugin('background', 'gagar.draw_background:SolidBackground', DRAW_BACKGROUND, 'F2'),
+    Plugin('background_white', 'gagar.draw_background:SolidBackground', DRAW_BACKGROUND, 'F2',
+           kwargs={'color': WHITE}, disabled=True),
+    Plugin('world_border', 'gagar.draw_background:WorldBorderDrawer', DRAW_BACKGROUND, 'b'),
+    Plugin('field_of_view', 'gagar.draw_hud:FieldOfView', DRAW_HUD, 'b'),
+    Plugin('grid', 'gagar.draw_background:GridDrawer', DRAW_BACKGROUND, 'g',
+           args=('settings?',)),
+
+    Plugin('cells', 'gagar.draw_cells:CellsDrawer', DRAW_CELLS,
+           args=('cell_index', 'settings?')),
+
+    # cell overlay
+    Plugin('skins', 'gagar.skins:CellSkins', DRAW_CELLS, 'k', args=('cell_index', 'settings?')),
+    Plugin('skin_prefetch', 'gagar.skins:SkinPrefetcher',
+           ('on_leaderboard_names', 'on_world_update_post'), 'k',
+           args=('client', 'tagar_client?', 'settings?')),
+    Plugin('names', 'gagar.draw_cells:CellNames', DRAW_CELLS, 'n',
+           args=('cell_index', 'settings?')),
+    Plugin('hostility', 'gagar.draw_cells:CellHostility', DRAW_CELLS, 'i',
+           args=('cell_index', 'threats')),
+    Plugin('masses', 'gagar.draw_cells:CellMasses', DRAW_CELLS, 'i', args=('cell_index',)),
+    Plugin('remerge_times', 'gagar.draw_cells:RemergeTimes', DRAW_CELLS, 'i', args=('stats',)),
+    Plugin('force_fields', 'gagar.draw_cells:ForceFields', DRAW_CELLS, 'i',
+           args=('threats', 'stats')),
+    Plugin('movement_lines', 'gagar.draw_cells:MovementLines', DRAW_CELLS, 'm'),
+
+    # HUD
+    Plugin('split_counter', 'gagar.draw_hud:SplitCounter', DRAW_HUD, 'F1', args=('stats',)),
+    Plugin('minimap', 'gagar.draw_hud:Minimap', ('on_draw_minimap',), 'F1'),
+    Plugin('leaderboard', 'gagar.draw_hud:Leaderboard',
+           ('on_leaderboard_names', 'on_draw_hud'), 'F1', args=('stats',)),
+    Plugin('experience', 'gagar.draw_hud:ExperienceMeter',
+           ('on_experience_info', 'on_draw_hud'), 'F1'),
+    Plugin('logger', 'gagar.logger:Logger',
+           ('on_log_msg', 'on_update_msg', 'on_status_msg', 'on_connect_error',
+            'on_message_error', 'on_sock_open', 'on_world_rect', 'on_server_version',
+            'on_cell_eaten', 'on_world_update_post', 'on_own_id',
+            'on_leaderboard_names', 'on_draw_hud'), 'F1', args=('client', 'stats')),
+    Plugin('mass_graph', 'gagar.draw_hud:MassGraph',
+           ('on_respawn', 'on_world_update_post', 'on_draw_hud'), 'F1',
+           args=('client', 'stats')),
+
+    Plugin('team_overlay', 'gagar.team_overlay:TeamOverlay',
+           ('on_team_update', 'on_world_update_post', 'on_clear_cells', 'on_draw_cells',
+            'on_draw_minimap', 'on_draw_hud', 'on_button_pressed'),
+           't', args=('tagar_client', 'cell_index', 'stats')),
+
+    Plugin('fps_meter', 'gagar.draw_hud:FpsMeter', ('on_world_update_post', 'on_draw_hud'),
+           'F3', args=('settings?',), disabled=True),
+    Plugin('latency_meter', 'gagar.latency:LatencyMeter', DRAW_HUD, 'F4',
+           args=('latency_tracker',), disabled=True),
+]
+
+
+def entry_point_plugins():
+    """Plugins declared by installed packages."""
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # before Python 3.8
+        return []
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        eps = eps.get(ENTRY_POINT_GROUP, ())
+
+    plugins = []
+    for ep in eps:
+        try:
+            declared = ep.load()
+        except Exception as e:
+            print('[PLUGIN] Could not load %s: %s' % (ep.name, e))
+            continue
+        if not isinstance(declared, Plugin):
+            declared = Plugin(ep.name, declared)
+        plugins.append(declared)
+    return plugins
+
+
+def parse_kwargs(text):
+    """'a=1 b=yes c=text' -> {'a': 1, 'b': 'yes', 'c': 'text'}"""
+    kwargs = {}
+    for item in text.split():
+        name, _, value = item.partition('=')
+        try:
+            kwargs[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            kwargs[name] = value  # plain string
+    return kwargs
+
+
+def configure_plugins(plugins, path):
+    """
+    Applies the config file at `path` to the `plugins` list,
+    returns the list of plugins to subscribe.
+    """
+    config = configparser.ConfigParser()
+    config.read(path)
+    plugins = [copy.copy(p) for p in plugins]  # keep the declarations unchanged
+    by_name = {p.name: p for p in plugins}
+
+    for section in config.sections():
+        if section[:7] != 'plugin:':
+            continue
+        options = config[section]
+        name = section[7:]
+        plugin = by_name.get(name)
+        if plugin is None:
+            plugin = by_name[name] = Plugin(name, options['target'])
+            plugins.append(plugin)
+        if 'target' in options:
+            plugin.target = options['target']
+        if 'events' in options:
+            plugin.events = frozenset(options['events'].split())
+        if 'args' in options:
+            plugin.args = tuple(options['args'].split())
+        if 'kwargs' in options:
+            plugin.kwargs = dict(plugin.kwargs, **parse_kwargs(options['kwargs']))
+        if 'key' in options:
+            plugin.key = options['key'] or None
+        if 'disabled' in options:
+            plugin.disabled = options.getboolean('disabled')
+
+    never = set()
+    if config.has_section('plugins'):
+        for name, state in config['plugins'].items():
+            if name not in by_name:
+                print('[PLUGIN] Unknown plugin in %s: %s' % (path, name))
+            elif state == 'never':
+                never.add(name)
+            else:
+                by_name[name].disabled = state == 'off'
+    return [p for p in plugins if p.name not in never]
+
+
+def subscribe_plugins(multi_sub, plugins, context, config_path=DEFAULT_CONFIG, lazy=False):
+    """
+    Subscribes the `plugins`, followed by installed and configured plugins.
+    Plugins whose args are not in the `context` (e.g. no Tagar client) are skipped,
+    unless the arg is optional ('tagar_client?'), then they get None.
+    With `lazy`, even enabled plugins are only imported on their first event.
+    """
+    plugins = plugins + entry_point_plugins()
+    if config_path and os.path.exists(config_path):
+        plugins = configure_plugins(plugins, config_path)
+
+    slots = []
+    for plugin in plugins:
+        if all(context.get(arg) is not None for arg in plugin.args if arg[-1:] != '?'):
+            slots.append(multi_sub.sub(PluginSlot(plugin, context, lazy)))
+    return slots
+
+
+def subscribe_drawers(multi_sub, client, tagar_client=None, latency_tracker=None,
+                      config_path=DEFAULT_CONFIG, lazy=False, settings=None):
+    """
+    Subscribes everything that draws the world and the HUD, as plugins
+    toggleable via key bindings, followed by installed and configured plugins.
+    """
+    # which cells are visible, shared by all cell drawers
+    cell_index = multi_sub.sub(CellIndex(client))
+    # own mass, remerge times, rank etc., read by the HUD elements
+    stats = multi_sub.sub(PlayerStats(client))
+    # who can eat whom, shared by the overlays and bot plugins
+    threats = multi_sub.sub(ThreatIndex(client, cell_index, stats))
+    context = {'client': client, 'tagar_client': tagar_client, 'cell_index': cell_index,
+               'stats': stats, 'threats': threats, 'latency_tracker': latency_tracker,
+               'settings': settings}
+    return subscribe_plugins(multi_sub, BUILTIN_PLUGINS, context, config_path, lazy)
@@ -0,0 +1,152 @@
+"""
+Dead reckoning for positions that are only updated now and then,
+like team cells and teammate positions received through Tagar.
+
+Each tracked position gets a velocity from its successive updates and is
+extrapolated on every frame. When an update disagrees with the
+prediction, the error is blended out over `correction_time` instead of
+jumping, unless it exceeds `max_error` (e.g. a split), then it snaps.
+Without a move for `max_extrapolation` seconds, the prediction returns
+to the last known position over `correction_time`, as the thing stopped.
+"""
+from time import monotonic
+
+from agarnet.vec import Vec
+
+from .subscriber import Subscriber
+
+
+class Track(object):
+    """Last known position of something, and how fast it moved."""
+
+    def __init__(self, x, y, now):
+        self.x = x
+        self.y = y
+        self.time = now
+        self.vx = 0.0
+        self.vy = 0.0
+        self.error_x = 0.0  # prediction minus observation, blended out
+        self.error_y = 0.0
+        self.error_time = now
+
+
+class MotionPredictor(Subscriber):
+    """
+    Predicts positions of team cells (from on_team_update or a CellIndex)
+    and of Tagar teammates, keyed by cell id or ('player', player id).
+    """
+
+    def __init__(self, tagar_client=None, cell_index=None, smoothing=0.5,
+                 max_extrapolation=0.5, correction_time=0.15, max_error=300):
+        self.tagar_client = tagar_client
+        self.cell_index = cell_index
+        self.smoothing = smoothing  # weight of the newest velocity sample
+        self.max_extrapolation = max_extrapolation  # seconds, stale tracks stop
+        self.correction_time = correction_time
+        self.max_error = max_error  # world units, snap instead of blending
+        self.tracks = {}  # key -> Track
+        self.player_keys = set()
+        self.incremental = False
+
+    def observe(self, key, x, y, now=None):
+        """Feeds a (possibly unchanged) position."""
+        if now is None:
+            now = monotonic()
+        track = self.tracks.get(key)
+        if track is None:
+            self.tracks[key] = Track(x, y, now)
+            return
+        if x == track.x and y == track.y:
+            if now - track.time > self.max_extrapolation and (track.vx or track.vy):
+                self.stop(track, now)
+            return  # no new information, keep extrapolating
+
+        px, py = self.predict_xy(track, now)
+        dt = now - track.time
+        if dt > 0:
+            s = self.smoothing
+            if dt > self.max_extrapolation:
+                s = 1.0  # old velocity is meaningless by now
+            track.vx += ((x - track.x) / dt - track.vx) * s
+            track.vy += ((y - track.y) / dt - track.vy) * s
+
+        error_x, error_y = px - x, py - y
+        if error_x * error_x + error_y * error_y > self.max_error * self.max_error:
+            error_x = error_y = 0.0
+            track.vx = track.vy = 0.0
+        track.x, track.y, track.time = x, y, now
+        track.error_x, track.error_y, track.error_time = error_x, error_y, now
+
+    def stop(self, track, now):
+        """Drops the velocity, blending from the prediction to the last position."""
+        px, py = self.predict_xy(track, now)
+        track.vx = track.vy = 0.0
+        track.error_x, track.error_y, track.error_time = px - track.x, py - track.y, now
+
+    def forget(self, key):
+        self.tracks.pop(key, None)
+
+    def predict_xy(self, track, now):
+        dt = now - track.time
+        # fade out the extrapolation of tracks that were not updated for too long
+        fade = 1.0 - max(0.0, dt - self.max_extrapolation) / self.correction_time
+        dt = min(dt, self.max_extrapolation) * max(0.0, fade)
+        x = track.x + track.vx * dt
+        y = track.y + track.vy * dt
+        blend = 1.0 - (now - track.error_time) / self.correction_time
+        if blend > 0:
+            x += track.error_x * blend
+            y += track.error_y * blend
+        return x, y
+
+    def predict(self, key, x, y, now=None):
+        """Predicted position as Vec, or Vec(x, y) if `key` is not tracked."""
+        track = self.tracks.get(key)
+        if track is None:
+            return Vec(x, y)
+        return Vec(*self.predict_xy(track, monotonic() if now is None else now))
+
+    def predict_cell(self, cell, now=None):
+        return self.predict(cell.cid, cell.pos.x, cell.pos.y, now)
+
+    def predict_player(self, pid, player, now=None):
+        return self.predict(('player', pid), player.position_x, player.position_y, now)
+
+    def on_team_update(self, world, changed, removed):
+        if not self.incremental:  # forget the cells tracked from Tagar
+            for cid in [key for key in self.tracks
+                        if key not in world.cells and key not in self.player_keys]:
+                self.forget(cid)
+        self.incremental = True
+        now = monotonic()
+        for cid in removed:
+            self.forget(cid)
+        for cid in changed:
+            cell = world.cells.get(cid)
+            if cell is not None:
+                self.observe(cid, cell.pos.x, cell.pos.y, now)
+
+    def on_world_update_post(self):
+        now = monotonic()
+        if self.cell_index and not self.incremental:
+            # team cells copied from Tagar, only moved ones are new samples
+            team_only = self.cell_index.team_only
+            for cid in [key for key in self.tracks
+                        if key not in team_only and key not in self.player_keys]:
+                self.forget(cid)
+            for cid, cell in team_only.items():
+                self.observe(cid, cell.pos.x, cell.pos.y, now)
+
+        if self.tagar_client:
+            player_keys = set()
+            for pid, player in list(self.tagar_client.player_list.items()):
+                key = ('player', pid)
+                player_keys.add(key)
+                self.observe(key, player.position_x, player.position_y, now)
+            for key in self.player_keys - player_keys:
+                self.forget(key)
+            self.player_keys = player_keys
+
+    def on_clear_cells(self):
+        for key in [key for key in self.tracks if key not in self.player_keys]:
+            self.forget(key)
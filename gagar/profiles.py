@@ -0,0 +1,173 @@
+"""
+Named sets of the settings that trade looks for speed, chosen at startup
+with `gagar --profile=NAME` and switched at runtime with F6.
+
+All subscribers share one `Settings` object (plugins get it as their
+`settings` argument) and read it where they use a value, so a switch takes
+effect with the next frame. Switching also calls
+`on_profile_changed(settings)`, e.g. to enable or disable plugins.
+
+More profiles can be declared in the plugin config file
+(default ~/.config/gagar/plugins.cfg), based on another one:
+
+    [profile:laptop]
+    base = competitive
+    frame_rate = 30
+    skin_cache_mb = 8
+    plugins = skins=off grid=off
+"""
+from collections import OrderedDict
+import configparser
+import os
+
+
+class Option(object):
+    def __init__(self, name, type, default, help=''):
+        self.name = name
+        self.type = type
+        self.default = default
+        self.help = help
+
+    def convert(self, value):
+        """`value` (or its config text) as `type`, raises ValueError if it is not one."""
+        if self.type is dict:
+            if isinstance(value, str):  # 'skins=off grid=on'
+                value = dict(item.split('=', 1) for item in value.split())
+            for state in value.values():
+                if state not in ('on', 'off'):
+                    raise ValueError('expected on/off, got %r' % state)
+            return dict(value)
+        value = self.type(value)
+        if value < 0:
+            raise ValueError('expected a value >= 0, got %r' % value)
+        return value
+
+
+OPTIONS = [
+    Option('frame_rate', float, 0, 'max. frames per second, 0 draws every world update'),
+    Option('unfocused_frame_rate', float, 5,
+           'max. frames per second while the window is not focused, 0 for no extra limit'),
+    Option('zoom_smoothing', float, .1, 'how fast the zoom follows, 1 = instantly'),
+    Option('follow_smoothing', float, .3, 'how fast the view follows the own cells'),
+    Option('spectate_smoothing', float, .1, 'how fast the view follows while spectating'),
+    Option('min_zoom', float, .075, 'min. mouse wheel zoom'),
+    Option('max_zoom', float, 1, 'max. mouse wheel zoom'),
+    Option('minimap_size', float, .2, 'minimap width, relative to the window width'),
+    Option('grid_spacing', float, 50, 'world units between grid lines, 0 hides the grid'),
+    Option('name_min_radius', float, 0, 'cells smaller than this on screen (pixels) get no name'),
+    Option('tiled_cells', int, 500, 'min. visible cells to draw on threads, see tiles.py'),
+    Option('skin_cache_mb', float, 32, 'memory for cached skins'),
+    Option('team_sync_interval', float, .04, 'min. seconds between team sync packets'),
+    Option('fps_history', int, 50, 'frames shown by the FPS meter'),
+    Option('plugins', dict, {}, 'plugins switched on or off, e.g. skins=off'),
+]
+
+# values different from the defaults
+BUILTIN_PROFILES = OrderedDict([
+    ('default', {}),
+    ('kiosk-low', {
+        'frame_rate': 15, 'unfocused_frame_rate': 2, 'minimap_size': .15, 'name_min_radius': 20,
+        'skin_cache_mb': 4, 'fps_history': 25,
+        'plugins': {'grid': 'off', 'skins': 'off', 'skin_prefetch': 'off',
+                    'movement_lines': 'off', 'mass_graph': 'off'},
+    }),
+    ('competitive', {
+        'zoom_smoothing': .2, 'follow_smoothing': .5, 'spectate_smoothing': .2,
+        'unfocused_frame_rate': 10, 'team_sync_interval': .02,
+        'plugins': {'hostility': 'on', 'masses': 'on', 'remerge_times': 'on',
+                    'force_fields': 'on', 'latency_meter': 'on'},
+    }),
+    ('headless-bot', {
+        'skin_cache_mb': 0, 'team_sync_interval': .02,
+        'plugins': {'mass_graph': 'off'},
+    }),
+    ('recording', {
+        'frame_rate': 25, 'unfocused_frame_rate': 25, 'zoom_smoothing': .05, 'follow_smoothing': .15,
+        'plugins': {'fps_meter': 'off', 'latency_meter': 'off'},
+    }),
+])
+
+
+class Profile(object):
+    def __init__(self, name, values=None, base=None):
+        """Raises ValueError if a value is unknown or of the wrong type."""
+        self.name = name
+        options = {o.name: o for o in OPTIONS}
+        self.values = dict(base.values) if base else {o.name: o.convert(o.default) for o in OPTIONS}
+        for key, value in (values or {}).items():
+            option = options.get(key)
+            if option is None:
+                raise ValueError('unknown setting %s' % key)
+            try:
+                value = option.convert(value)
+            except (TypeError, ValueError) as e:
+                raise ValueError('%s: %s' % (key, e))
+            if option.type is dict:  # switch more plugins than the base
+                value = dict(self.values[key], **value)
+            self.values[key] = value
+
+
+class Settings(object):
+    """The values of the current profile, as attributes."""
+
+    def __init__(self, profile=None):
+        self.apply(profile or Profile('default'))
+
+    def apply(self, profile):
+        self.profile = profile.name
+        for key, value in profile.values.items():
+            setattr(self, key, value)
+
+
+def load_profiles(config_path=None):
+    """The built-in profiles, followed by those in the config file."""
+    profiles = OrderedDict()
+    for name, values in BUILTIN_PROFILES.items():
+        profiles[name] = Profile(name, values)
+    if not config_path or not os.path.exists(config_path):
+        return profiles
+
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    for section in config.sections():
+        if section[:8] != 'profile:':
+            continue
+        name = section[8:]
+        values = dict(config[section])
+        base_name = values.pop('base', 'default')
+        base = profiles.get(base_name)
+        if base is None:
+            print('[PROFILE] %s: unknown base profile %s' % (name, base_name))
+            continue
+        try:
+            profiles[name] = Profile(name, values, base)
+        except ValueError as e:
+            print('[PROFILE] %s: %s' % (name, e))
+    return profiles
+
+
+class ProfileSwitcher(object):
+    """Applies profiles to the shared `settings` and tells the subscribers."""
+
+    def __init__(self, subscriber, settings, profiles):
+        self.subscriber = subscriber
+        self.settings = settings
+        self.profiles = profiles
+
+    def select(self, name):
+        profile = self.profiles.get(name)
+        if profile is None:
+            print('[PROFILE] Unknown profile %s, known: %s'
+                  % (name, ', '.join(self.profiles)))
+            return False
+        self.settings.apply(profile)
+        self.subscriber.on_profile_changed(settings=self.settings)
+        return True
+
+    def cycle(self):
+        """Selects the next profile."""
+        names = list(self.profiles)
+        current = names.index(self.settings.profile) if self.settings.profile in names else -1
+        name = names[(current + 1) % len(names)]
+        self.select(name)
+        self.subscriber.on_log_msg('Profile: %s' % name)
@@ -8,9 +8,7 @@ Minimal example:
 Reload when '.' key is pressed.
 
     class Leaderboard(Subscriber, Reloadable):
-        # There is no __init__() with args and no state, so
-        # neither capture_args() nor _persistent_attributes
-        # are needed.
+        # There is no __init__() with args, so capture_args() is not needed.
 
         # We want to reload somehow, so we use a key press event for this
         def on_key_pressed(self, val, char):
@@ -21,44 +19,135 @@ Reload when '.' key is pressed.
             # ...
 
 Complex example:
-Auto-reload every second, keeping init args and instance state.
+Keep init args and instance state, re-initialize some attributes.
 
     class MassGraph(Subscriber, Reloadable):
-        _persistent_attributes = ['graph']  # restore graph after reload
+        # All instance attributes are kept when reloading.
+        # New attributes introduced by the new __init__() get added,
+        # these ones get re-initialized:
+        _reset_attributes = ['colors']
 
         def __init__(self, client):
-            # restore client after reload
-            # (when calling __init__, client is supplied as argument)
+            # new attributes are initialized by calling __init__ on a
+            # scratch instance, with the same args as the original one
             self.capture_args(locals())
 
-            self.reload_timer = 0  # used below
+            self.client = client
+            self.graph = []  # kept between reloads
+            self.colors = [BLUE, GREEN]  # re-initialized on reload
 
-            self.client = client  # set via init arg
-            self.graph = []  # should be kept between reloads
-
-        def on_respawn(self):
+        def on_draw_hud(self, c, w):
             # ...
 
-        def on_world_update_post(self):
-            # ...
+Auto-reload:
+Watch the source files of all subscribers and reload them on change.
+Works with any subscriber, not only Reloadable ones.
 
-            self.reload_timer += 1
-            if self.reload_timer > 25:  # world updates occur 25x per second
-                # Do not crash if the reload fails.
-                # Note that this does not catch all syntax errors
-                # and still no runtime errors.
-                self.try_reload()
+    watcher = ReloadWatcher()
+    watcher.watch_subscribers(multi_sub)
+    multi_sub.sub(watcher)  # reloads on the next world update
 
-        def on_draw_hud(self, c, w):
-            # ...
+The watcher thread polls the file modification times and compiles the
+changed sources, so the main loop only has to run the module code,
+which usually just defines some functions and classes.
+Module-level objects named in the module's `_persistent_globals`
+(e.g. caches) survive reloading.
 """
-import importlib, sys, types
+import importlib
+import os
+import queue
+import sys
+import threading
+import time
+import types
+import weakref
+
+from .subscriber import Subscriber, invalidate_dispatch
+
+
+def compile_module(module):
+    """Compiles the current source of the module, without running it."""
+    path = module.__file__
+    with open(path, 'rb') as f:
+        source = f.read()
+    return compile(source, path, 'exec', dont_inherit=True)
+
+
+def reload_module(module, code=None):
+    """
+    Runs the (new) code of the module in its existing namespace,
+    then points all names in other modules that referred to the
+    old functions and classes to the new ones.
+    Returns the module.
+    """
+    if code is None:
+        if module.__spec__ is None or module.__file__ is None:
+            return importlib.reload(module)
+        code = compile_module(module)
+
+    old_globals = dict(module.__dict__)
+    exec(code, module.__dict__)
+
+    for name in getattr(module, '_persistent_globals', ()):
+        if name in old_globals:
+            module.__dict__[name] = old_globals[name]
+
+    # e.g. `from .drawutils import *` copied the old objects
+    replaced = {}
+    for name, old in old_globals.items():
+        new = module.__dict__.get(name, old)
+        if new is not old and isinstance(old, (type, types.FunctionType)):
+            replaced[id(old)] = new
+    if replaced:
+        for other in list(sys.modules.values()):
+            if other is module or getattr(other, '__package__', None) != module.__package__:
+                continue
+            namespace = other.__dict__
+            for name, value in list(namespace.items()):
+                new = replaced.get(id(value))
+                if new is not None and value is old_globals.get(name):
+                    namespace[name] = new
+
+    invalidate_dispatch()
+    return module
+
+
+def reload_instance(instance, new_module, init_args=None, reset_attributes=()):
+    """
+    Swaps the class of `instance` for the one of the same name in `new_module`.
+    Keeps the instance state, adds attributes that the new __init__() sets
+    but the instance does not have yet, and re-initializes `reset_attributes`.
+    """
+    new_class = getattr(new_module, instance.__class__.__name__)
+    state = instance.__dict__
+
+    # methods bound per instance (by older reloaders) would shadow the new class
+    for name, value in list(state.items()):
+        if isinstance(value, types.MethodType) and value.__self__ is instance:
+            del state[name]
+
+    instance.__class__ = new_class
+
+    if init_args is not None or reset_attributes:
+        scratch = new_class.__new__(new_class)
+        try:
+            new_class.__init__(scratch, **(init_args or {}))
+        except TypeError:
+            pass  # __init__ needs args that were not captured
+        else:
+            for name, value in scratch.__dict__.items():
+                if name not in state or name in reset_attributes:
+                    state[name] = value
+
+    invalidate_dispatch()
+    return instance
 
 
 class Reloadable(object):
     """Makes inheriting class instances reloadable."""
 
-    _persistent_attributes = []  # will be kept when reloading
+    _persistent_attributes = []  # all attributes are kept, only kept for compatibility
+    _reset_attributes = []  # will be re-initialized by the new __init__ when reloading
 
     def capture_args(self, init_args):
         """
@@ -81,27 +170,13 @@ class Reloadable(object):
 
     def reload(self, new_module=None):
         """
-        Reloads the containing module and replaces all instance attributes
-        (monkey-patching, see https://filippo.io/instance-monkey-patching-in-python/ )
-        while keeping the attributes in _persistent_attributes.
+        Reloads the containing module and swaps the class of this instance
+        for the reloaded one, keeping all instance attributes.
         """
         if not new_module:
-            new_module = importlib.reload(sys.modules[self.__module__])
-        new_class = getattr(new_module, self.__class__.__name__)
-        persistent = {k: getattr(self, k) for k in self._persistent_attributes}
-        for new_attr_name in dir(new_class):
-            if new_attr_name in ('__class__', '__dict__', '__weakref__'):
-                continue  # do not copy '__dict__', '__weakref__'; copy '__class__' below
-            new_attr = getattr(new_class, new_attr_name)
-            try:  # some attributes are instance methods, bind them to `self`
-                new_attr = types.MethodType(new_attr, self)
-            except TypeError:
-                pass
-            setattr(self, new_attr_name, new_attr)
-        setattr(self, '__class__', new_class)
-        new_class.__init__(self, **getattr(self, '_init_args', {}))
-        for k, v in persistent.items():
-            setattr(self, k, v)
+            new_module = reload_module(sys.modules[self.__module__])
+        reload_instance(self, new_module, getattr(self, '_init_args', {}),
+                        self._reset_attributes)
 
     def try_reload(self):
         """
@@ -115,3 +190,75 @@ class Reloadable(object):
             self.reload()
         except Exception as e:
             return e
+
+
+class ReloadWatcher(Subscriber):
+    """
+    Polls the source files of the watched instances in a background thread
+    and reloads changed modules on the next world update.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.instances = weakref.WeakSet()
+        self.mtimes = {}  # module name -> mtime
+        self.compiled = queue.Queue()  # (module, code or exception)
+        self.errors = []
+
+        thread = threading.Thread(target=self.poll)
+        thread.daemon = True
+        thread.start()
+
+    def watch(self, instance):
+        self.instances.add(instance)
+        module = sys.modules.get(type(instance).__module__)
+        path = getattr(module, '__file__', None)
+        if path and module.__name__ not in self.mtimes:
+            self.mtimes[module.__name__] = os.stat(path).st_mtime
+
+    def watch_subscribers(self, sub):
+        """Watches the subscriber and, recursively, all of its subscribers."""
+        self.watch(sub)
+        # MultiSubscribers and plugin slots
+        for s in getattr(sub, 'subs', ()):
+            self.watch_subscribers(s)
+
+    def poll(self):
+        while True:
+            time.sleep(self.interval)
+            for name, mtime in list(self.mtimes.items()):
+                module = sys.modules.get(name)
+                try:
+                    new_mtime = os.stat(module.__file__).st_mtime
+                    if new_mtime == mtime:
+                        continue
+                    self.mtimes[name] = new_mtime
+                    self.compiled.put((module, compile_module(module)))
+                except Exception as e:  # syntax error, file vanished, ...
+                    self.compiled.put((module, e))
+
+    def reload_changed(self):
+        """Reloads the modules that were compiled since the last call."""
+        while True:
+            try:
+                module, code = self.compiled.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(code, Exception):
+                self.errors.append(code)
+                print('[RELOAD] Could not compile %s: %s' % (module.__name__, code))
+                continue
+            try:
+                reload_module(module, code)
+                for instance in list(self.instances):
+                    if type(instance).__module__ == module.__name__:
+                        reload_instance(instance, module,
+                                        getattr(instance, '_init_args', None),
+                                        getattr(instance, '_reset_attributes', ()))
+                print('[RELOAD] Reloaded %s' % module.__name__)
+            except Exception as e:
+                self.errors.append(e)
+                print('[RELOAD] Could not reload %s: %s' % (module.__name__, e))
+
+    def on_world_update_post(self):
+        self.reload_changed()
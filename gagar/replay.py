@@ -0,0 +1,431 @@
+"""
+Recording and seekable playback of gagar sessions.
+
+A replay file is a header, followed by a stream of records, followed by
+an index footer.
+
+Every record is either a keyframe (the full world: cells, player state,
+leaderboard and world rect) or a delta (cells that changed or got removed
+since the previous record, plus the player/leaderboard/rect if changed).
+A keyframe is written every `keyframe_interval` seconds, so seeking never
+has to apply more than that many seconds of deltas.
+
+The footer maps keyframe timestamps to file offsets. If it is missing
+(e.g. gagar crashed while recording), it is rebuilt by scanning the file.
+Files are memory-mapped when reading, so seeking is just a bisect
+and some struct unpacking.
+"""
+from bisect import bisect_right
+import mmap
+import struct
+import time
+
+from agarnet.world import Player
+from .subscriber import Subscriber
+
+MAGIC = b'GAGARREC'
+INDEX_MAGIC = b'GAGARIDX'
+VERSION = 1
+
+KEYFRAME = 1
+DELTA = 2
+
+# delta flags
+OWN_CHANGED = 1
+LEADERBOARD_CHANGED = 2
+RECT_CHANGED = 4
+
+header_struct = struct.Struct('<8sHd')  # magic, version, start time (epoch)
+record_struct = struct.Struct('<BdI')  # kind, time since start, payload length
+cell_struct = struct.Struct('<IffHBBBB')  # cid, x, y, size, r, g, b, flags
+rect_struct = struct.Struct('<dddd')
+index_entry_struct = struct.Struct('<dQ')  # time, offset
+trailer_struct = struct.Struct('<QI8s')  # index offset, entries, magic
+count_struct = struct.Struct('<I')
+str_len_struct = struct.Struct('<H')
+
+CELL_VIRUS = 1
+CELL_AGITATED = 2
+
+
+def pack_str(s):
+    data = (s or '').encode('utf-8')[:0xffff]
+    return str_len_struct.pack(len(data)) + data
+
+
+def unpack_str(buf, offset):
+    length, = str_len_struct.unpack_from(buf, offset)
+    offset += str_len_struct.size
+    return bytes(buf[offset:offset + length]).decode('utf-8', 'replace'), offset + length
+
+
+def pack_cell(cell):
+    r, g, b = (int(round(c * 255)) for c in cell.color)
+    flags = (CELL_VIRUS if cell.is_virus else 0) \
+        | (CELL_AGITATED if cell.is_agitated else 0)
+    return cell_struct.pack(cell.cid, cell.pos.x, cell.pos.y, int(cell.size),
+                            r, g, b, flags) + pack_str(cell.name)
+
+
+def pack_ids(ids):
+    ids = sorted(ids)
+    return count_struct.pack(len(ids)) + struct.pack('<%iI' % len(ids), *ids)
+
+
+def unpack_ids(buf, offset):
+    n, = count_struct.unpack_from(buf, offset)
+    offset += count_struct.size
+    ids = struct.unpack_from('<%iI' % n, buf, offset)
+    return ids, offset + 4 * n
+
+
+def pack_player(player):
+    return pack_str(player.nick) + pack_ids(player.own_ids)
+
+
+def pack_leaderboard(leaderboard):
+    return count_struct.pack(len(leaderboard)) + b''.join(
+        count_struct.pack(cid) + pack_str(name) for cid, name in leaderboard)
+
+
+def pack_rect(world):
+    return rect_struct.pack(world.top_left.x, world.top_left.y,
+                            world.bottom_right.x, world.bottom_right.y)
+
+
+class ReplayRecorder(Subscriber):
+    """
+    Records the world of `client.player` on every world update.
+    Call start() with a path to begin recording, stop() to finish the file.
+    """
+
+    def __init__(self, client, keyframe_interval=10.0):
+        self.client = client
+        self.keyframe_interval = keyframe_interval
+        self.file = None
+        self.path = None
+        self.index = []
+        self.start_time = 0
+        self.last_keyframe = 0
+        self.last_cells = {}  # cid -> packed cell, as of the last record
+        self.last_player = self.last_leaderboard = self.last_rect = b''
+
+    @property
+    def recording(self):
+        return self.file is not None
+
+    def start(self, path=None):
+        if self.recording:
+            self.stop()
+        self.path = path or time.strftime('gagar-%Y%m%d-%H%M%S.replay')
+        self.file = open(self.path, 'wb')
+        self.file.write(header_struct.pack(MAGIC, VERSION, time.time()))
+        self.index = []
+        self.start_time = time.monotonic()
+        self.last_keyframe = -self.keyframe_interval  # first record is a keyframe
+        self.client.subscriber.on_update_msg('Recording to %s' % self.path)
+        return self.path
+
+    def stop(self):
+        if not self.recording:
+            return
+        index_offset = self.file.tell()
+        for t, offset in self.index:
+            self.file.write(index_entry_struct.pack(t, offset))
+        self.file.write(trailer_struct.pack(index_offset, len(self.index), INDEX_MAGIC))
+        self.file.close()
+        self.file = None
+        self.last_cells = {}
+        self.client.subscriber.on_update_msg('Recording saved to %s' % self.path)
+
+    def toggle(self, path=None):
+        if self.recording:
+            self.stop()
+        else:
+            self.start(path)
+
+    def write_record(self, kind, t, payload):
+        offset = self.file.tell()
+        self.file.write(record_struct.pack(kind, t, len(payload)))
+        self.file.write(payload)
+        return offset
+
+    def on_world_update_post(self):
+        if not self.recording:
+            return
+        t = time.monotonic() - self.start_time
+        world = self.client.player.world
+        cells = {cid: pack_cell(cell) for cid, cell in world.cells.items()}
+        player = pack_player(self.client.player)
+        leaderboard = pack_leaderboard(world.leaderboard_names)
+        rect = pack_rect(world)
+
+        if t - self.last_keyframe >= self.keyframe_interval:
+            payload = b''.join((rect, player, leaderboard,
+                                count_struct.pack(len(cells)), b''.join(cells.values())))
+            self.index.append((t, self.write_record(KEYFRAME, t, payload)))
+            self.last_keyframe = t
+        else:
+            last_cells = self.last_cells
+            removed = [cid for cid in last_cells if cid not in cells]
+            changed = [data for cid, data in cells.items()
+                       if last_cells.get(cid) != data]
+            flags = (OWN_CHANGED if player != self.last_player else 0) \
+                | (LEADERBOARD_CHANGED if leaderboard != self.last_leaderboard else 0) \
+                | (RECT_CHANGED if rect != self.last_rect else 0)
+            parts = [bytes((flags,)), pack_ids(removed),
+                     count_struct.pack(len(changed))]
+            parts.extend(changed)
+            if flags & OWN_CHANGED:
+                parts.append(player)
+            if flags & LEADERBOARD_CHANGED:
+                parts.append(leaderboard)
+            if flags & RECT_CHANGED:
+                parts.append(rect)
+            self.write_record(DELTA, t, b''.join(parts))
+
+        self.last_cells = cells
+        self.last_player = player
+        self.last_leaderboard = leaderboard
+        self.last_rect = rect
+
+    def on_sock_closed(self):
+        # make sure the file stays readable, even when not reconnecting
+        if self.recording:
+            self.file.flush()
+
+
+class ReplayReader(object):
+    """
+    Random access to a replay file.
+    Decodes records into an agarnet `Player` (and its `world`).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self.buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.wall_start_time = header_struct.unpack_from(self.buf, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a gagar replay: %s' % path)
+        if version != VERSION:
+            raise ValueError('Unsupported replay version %i' % version)
+        self.data_end = len(self.buf)
+        self.index = self.read_index()
+        if not self.index:
+            raise ValueError('Replay contains no keyframes: %s' % path)
+        self.index_times = [t for t, _ in self.index]
+        self.end_time = self.scan_end_time()
+
+    def close(self):
+        self.buf.close()
+        self._file.close()
+
+    @property
+    def start_time(self):
+        return self.index_times[0]
+
+    @property
+    def duration(self):
+        return self.end_time - self.start_time
+
+    def read_index(self):
+        buf = self.buf
+        if len(buf) >= header_struct.size + trailer_struct.size:
+            index_offset, n, magic = trailer_struct.unpack_from(
+                buf, len(buf) - trailer_struct.size)
+            if magic == INDEX_MAGIC:
+                self.data_end = index_offset
+                return [index_entry_struct.unpack_from(
+                    buf, index_offset + i * index_entry_struct.size)
+                    for i in range(n)]
+        # no footer, recording was interrupted: rebuild by scanning
+        index = []
+        for kind, t, offset, _ in self.records(header_struct.size):
+            if kind == KEYFRAME:
+                index.append((t, offset))
+        return index
+
+    def scan_end_time(self):
+        end_time = self.index_times[-1]
+        for kind, t, _, _ in self.records(self.index[-1][1]):
+            end_time = t
+        return end_time
+
+    def records(self, offset):
+        """Yields (kind, time, record offset, payload offset) from `offset` on."""
+        buf = self.buf
+        end = self.data_end
+        last_t = float('-inf')
+        while offset + record_struct.size <= end:
+            kind, t, length = record_struct.unpack_from(buf, offset)
+            payload = offset + record_struct.size
+            if kind not in (KEYFRAME, DELTA) or not t >= last_t \
+                    or payload + length > end:
+                break  # truncated record, or garbage after it
+            last_t = t
+            yield kind, t, offset, payload
+            offset = payload + length
+
+    def keyframe_before(self, t):
+        """Returns (time, offset) of the last keyframe at or before `t`."""
+        i = max(0, bisect_right(self.index_times, t) - 1)
+        return self.index[i]
+
+    def apply(self, player, kind, payload):
+        """
+        Applies the record at `payload` to `player`.
+        Returns (own_ids_changed, leaderboard_changed).
+        """
+        if kind == KEYFRAME:
+            self.apply_keyframe(player, payload)
+            return True, True
+        return self.apply_delta(player, payload)
+
+    def apply_keyframe(self, player, offset):
+        buf = self.buf
+        world = player.world
+        world.reset()
+        offset = self.read_rect(world, offset)
+        offset = self.read_player(player, offset)
+        offset = self.read_leaderboard(world, offset)
+        n, = count_struct.unpack_from(buf, offset)
+        offset += count_struct.size
+        for _ in range(n):
+            offset = self.read_cell(world, offset)
+        player.cells_changed()
+
+    def apply_delta(self, player, offset):
+        buf = self.buf
+        world = player.world
+        flags = buf[offset]
+        removed, offset = unpack_ids(buf, offset + 1)
+        for cid in removed:
+            world.cells.pop(cid, None)
+        n, = count_struct.unpack_from(buf, offset)
+        offset += count_struct.size
+        for _ in range(n):
+            offset = self.read_cell(world, offset)
+        if flags & OWN_CHANGED:
+            offset = self.read_player(player, offset)
+        if flags & LEADERBOARD_CHANGED:
+            offset = self.read_leaderboard(world, offset)
+        if flags & RECT_CHANGED:
+            offset = self.read_rect(world, offset)
+        player.own_ids.intersection_update(world.cells)
+        player.cells_changed()
+        return bool(flags & OWN_CHANGED), bool(flags & LEADERBOARD_CHANGED)
+
+    def read_cell(self, world, offset):
+        cid, x, y, size, r, g, b, flags = cell_struct.unpack_from(self.buf, offset)
+        name, offset = unpack_str(self.buf, offset + cell_struct.size)
+        if cid not in world.cells:
+            world.create_cell(cid)
+        world.cells[cid].update(cid=cid, x=x, y=y, size=size, name=name,
+                                color=(r, g, b),
+                                is_virus=bool(flags & CELL_VIRUS),
+                                is_agitated=bool(flags & CELL_AGITATED))
+        return offset
+
+    def read_player(self, player, offset):
+        player.nick, offset = unpack_str(self.buf, offset)
+        own_ids, offset = unpack_ids(self.buf, offset)
+        player.own_ids.clear()
+        player.own_ids.update(own_ids)
+        return offset
+
+    def read_leaderboard(self, world, offset):
+        n, = count_struct.unpack_from(self.buf, offset)
+        offset += count_struct.size
+        world.leaderboard_names.clear()
+        for _ in range(n):
+            cid, = count_struct.unpack_from(self.buf, offset)
+            name, offset = unpack_str(self.buf, offset + count_struct.size)
+            world.leaderboard_names.append((cid, name))
+        return offset
+
+    def read_rect(self, world, offset):
+        left, top, right, bottom = rect_struct.unpack_from(self.buf, offset)
+        world.top_left.set(left, top)
+        world.bottom_right.set(right, bottom)
+        return offset + rect_struct.size
+
+
+class ReplayClient(object):
+    """
+    Stands in for an agarnet `Client` while playing back a replay,
+    calling the same subscriber events as a live connection would.
+    """
+
+    def __init__(self, subscriber, path):
+        self.subscriber = subscriber
+        self.reader = ReplayReader(path)
+        self.player = Player()
+        self.address = path
+        self.server_token = ''
+        self.ingame = True
+        self.time = None  # replay time of the last applied record
+        self._next = None  # offset of the next record to apply
+
+    @property
+    def world(self):
+        return self.player.world
+
+    @property
+    def connected(self):
+        return False
+
+    def disconnect(self):
+        self.reader.close()
+        self.subscriber.on_sock_closed()
+
+    def seek(self, t):
+        """Jumps to replay time `t` via the nearest keyframe before it."""
+        t = min(max(t, self.reader.start_time), self.reader.end_time)
+        key_t, offset = self.reader.keyframe_before(t)
+        self.subscriber.on_clear_cells()
+        self.time = None
+        self._next = offset
+        self.advance(t, notify=False)
+        self.subscriber.on_world_update_post()
+        self.subscriber.on_leaderboard_names(leaderboard=self.world.leaderboard_names)
+
+    def advance(self, t, notify=True):
+        """
+        Applies all records up to replay time `t`.
+        Returns False when the end of the replay was reached.
+        """
+        if self._next is None:
+            self.seek(t)
+            return True
+        sub = self.subscriber
+        for kind, rec_t, offset, payload in self.reader.records(self._next):
+            if rec_t > t:
+                self._next = offset
+                return True
+            was_alive = self.player.is_alive
+            old_ids = set(self.player.own_ids)
+            if notify:
+                sub.on_world_update_pre()
+            own_changed, leaderboard_changed = self.reader.apply(self.player, kind, payload)
+            self.time = rec_t
+            if notify:
+                if own_changed:
+                    if not was_alive and self.player.is_alive:
+                        sub.on_respawn()
+                    for cid in self.player.own_ids - old_ids:
+                        sub.on_own_id(cid=cid)
+                    if was_alive and not self.player.is_alive:
+                        sub.on_death()
+                if leaderboard_changed:
+                    sub.on_leaderboard_names(leaderboard=self.world.leaderboard_names)
+                sub.on_world_update_post()
+        self._next = self.reader.data_end
+        return False
+
+    def __getattr__(self, func_name):
+        # replays are read-only, ignore any send_*() commands
+        if 'send_' != func_name[:5]:
+            raise AttributeError("'%s' object has no attribute '%s'"
+                                 % (self.__class__.__name__, func_name))
+        return lambda *args, **kwargs: None
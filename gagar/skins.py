@@ -1,52 +1,210 @@
+from collections import OrderedDict, deque
 import io
-from threading import Thread
+from threading import Event, Lock, Thread
+from time import sleep, time
 import urllib.request
 
 import cairo
 
 from agarnet.utils import default_headers, special_names
+from .diagnostics import swallowed
 from .drawutils import TWOPI
+from .spatial import visible_cells
 from .subscriber import Subscriber
 
+MAX_CACHE_BYTES = 32 * 1024 * 1024  # PNG data and decoded surfaces, by default
+PREFETCH_FILL = 0.75  # stop prefetching when the cache is this full
+MAX_MISSING = 2000  # names remembered to have no skin
+MISSING_RETRY = 600  # seconds until a missing skin is looked up again
 
-skin_cache = {}  # raw PNG data
+skin_cache = OrderedDict()  # raw PNG data, least recently used first
 skin_surface_cache = {}  # images in cairo format
+skin_stats = {'hits': 0, 'misses': 0, 'prefetched': 0, 'bytes': 0}
+skin_lock = Lock()  # skins are loaded in other threads
+skin_poisoned = set()  # names whose skin failed to decode or draw, not tried again
+skin_missing = OrderedDict()  # name -> time its download failed, oldest first
+max_cache_bytes = MAX_CACHE_BYTES  # set from the profile, see set_cache_limit()
+
+_persistent_globals = ['skin_cache', 'skin_surface_cache', 'skin_stats', 'skin_lock',
+                       'skin_poisoned', 'skin_missing', 'max_cache_bytes']  # keep on reload
+
+
+def skin_url(name):
+    if name[0] == '%': # new gen skins from official agario server
+        return 'http://agar.io/skins/premium/%s.png' % urllib.request.quote(name[1].upper() + name[2:])
+    elif name in special_names: # old default skins from agario server
+        return 'http://agar.io/skins/%s.png' % urllib.request.quote(name)
+        #TODO: some premium skins have different url
+    else: # try agariomods
+        return 'http://skins.agariomods.com/i/c/%s.png' % urllib.request.quote(name + " (Custom)")
+
+
+def download_skin(name):
+    """The PNG data of the skin `name`, or None if it does not exist."""
+    try:
+        opener = urllib.request.build_opener()
+        opener.addheaders = default_headers
+        return opener.open(skin_url(name)).read()
+    except UnicodeEncodeError:  # tried lookup invalid chars
+        return None
+    except (urllib.error.URLError, OSError):  # no such skin, or no network
+        return None
+
+
+def surface_bytes(surface):
+    return surface.get_stride() * surface.get_height()
+
+
+def store_skin(name, data):
+    with skin_lock:
+        if data is None:  # remembered apart, not to fill the cache with empty entries
+            skin_cache.pop(name, None)
+            skin_missing[name] = time()
+            while len(skin_missing) > MAX_MISSING:
+                skin_missing.popitem(last=False)
+            return
+        skin_cache[name] = data
+        skin_stats['bytes'] += len(data)
+        evict_skins()
+
+
+def is_missing(name):
+    """If `name` recently had no skin. Call with skin_lock held."""
+    failed_at = skin_missing.get(name)
+    if failed_at is None:
+        return False
+    if time() - failed_at < MISSING_RETRY:
+        return True
+    del skin_missing[name]  # try again
+    return False
+
+
+def evict_skins():
+    """Drops the least recently used skins until the cache fits. Call with skin_lock held."""
+    while skin_stats['bytes'] > max_cache_bytes and len(skin_cache) > 1:
+        name, data = skin_cache.popitem(last=False)
+        skin_stats['bytes'] -= len(data or b'')
+        surface = skin_surface_cache.pop(name, None)
+        if surface is not None:
+            skin_stats['bytes'] -= surface_bytes(surface)
+
+
+def set_cache_limit(settings):
+    """Applies the skin cache budget of the `settings` profile."""
+    global max_cache_bytes
+    max_bytes = int(settings.skin_cache_mb * 1024 * 1024)
+    if max_bytes != max_cache_bytes:
+        with skin_lock:
+            max_cache_bytes = max_bytes
+            evict_skins()
 
 
 def get_skin(name):
-    if name not in skin_cache:
+    with skin_lock:
+        if name in skin_cache:
+            skin_stats['hits'] += 1
+            skin_cache.move_to_end(name)
+            return skin_cache[name]
+        if is_missing(name):
+            return None
+        skin_stats['misses'] += 1
         # load in separate thread, return None for now
         skin_cache[name] = None
 
-        def loader():
-            try:
-                if name[0] is '%': # new gen skins from official agario server
-                    skin_url = 'http://agar.io/skins/premium/%s.png' % urllib.request.quote(name[1].upper() + name[2:])
-                elif name in special_names: # old default skins from agario server
-                    skin_url = 'http://agar.io/skins/%s.png' % urllib.request.quote(name)
-                    #TODO: some premium skins have different url
-                else: # try agariomods
-                    skin_url = 'http://skins.agariomods.com/i/c/%s.png' % urllib.request.quote(name + " (Custom)")
-                opener = urllib.request.build_opener()
-                opener.addheaders = default_headers
-
-                skin_cache[name] = opener.open(skin_url).read()
-            except UnicodeEncodeError:  # tried lookup invalid chars
-                pass
-            except urllib.error.HTTPError as e:
-                #print("Error while loading skin from: " + skin_url)
-                #print(e)
-                pass
-
-        t = Thread(target=loader)
-        t.setDaemon(True)
-        t.start()
-    return skin_cache[name]
+    Thread(target=lambda: store_skin(name, download_skin(name)), daemon=True).start()
+    return None
+
+
+def get_skin_surface(name, skin_data):
+    surface = skin_surface_cache.get(name)
+    if surface is None:
+        surface = cairo.ImageSurface.create_from_png(io.BytesIO(skin_data))
+        with skin_lock:
+            skin_surface_cache[name] = surface
+            skin_stats['bytes'] += surface_bytes(surface)
+            evict_skins()
+    return surface
+
+
+class SkinPrefetcher(Subscriber):
+    """
+    Loads the skins of the leaderboard, the team and cells just outside
+    the view before they get drawn, one at a time on a background thread,
+    limited to `bandwidth` bytes per second.
+    """
+
+    def __init__(self, client, tagar_client=None, settings=None,
+                 bandwidth=64 * 1024, interval=1.0):
+        self.client = client
+        self.tagar_client = tagar_client
+        self.settings = settings
+        self.bandwidth = bandwidth
+        self.interval = interval  # seconds between looking for new names
+        self.next_scan = 0
+        self.queue = deque()
+        self.queued = set()
+        self.wake = Event()
+        self.thread = None
+
+    def request(self, name):
+        if not name:
+            return
+        name = name.lower()
+        if name in self.queued or name in skin_cache:
+            return
+        if name in skin_missing:
+            with skin_lock:
+                if is_missing(name):
+                    return
+        if skin_stats['bytes'] > max_cache_bytes * PREFETCH_FILL:
+            return  # leave the room to the skins on screen
+        self.queued.add(name)
+        self.queue.append(name)
+        if self.thread is None:
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.wake.set()
+
+    def on_leaderboard_names(self, leaderboard):
+        for cid, name in leaderboard:
+            self.request(name)
+
+    def on_world_update_post(self):
+        now = time()
+        if now < self.next_scan:
+            return
+        self.next_scan = now + self.interval
+        if self.settings:
+            set_cache_limit(self.settings)
+        if self.tagar_client:
+            for player in list(self.tagar_client.player_list.values()):
+                self.request(player.nick)
+        # the server also sends cells a bit outside the view
+        for cell in list(self.client.player.world.cells.values()):
+            self.request(cell.skin or cell.name)
+
+    def run(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            while self.queue:
+                name = self.queue.popleft()
+                with skin_lock:
+                    known = name in skin_cache or is_missing(name)
+                    if not known:
+                        skin_cache[name] = None  # get_skin() waits for us
+                if not known:
+                    data = download_skin(name)
+                    store_skin(name, data)
+                    skin_stats['prefetched'] += 1
+                    # stay below the bandwidth, and do not hammer the skin servers
+                    sleep(max(0.05, len(data or b'') / self.bandwidth))
+                self.queued.discard(name)
 
 
 class CellSkins(Subscriber):
     @staticmethod
-    def draw(c, w, cell):
+    def draw(c, w, cell, pos=None):
         c = c._cairo_context
 
         if cell.skin:
@@ -58,19 +216,23 @@ class CellSkins(Subscriber):
             return
 
         name = name.lower()
+        if name in skin_poisoned:
+            return
 
         skin_data = get_skin(name)
 
         if not skin_data:  # image is still being loaded or not available
             return  # TODO fancy loading circle animation
-        if name not in skin_surface_cache:
-            skin_surface_cache[name] = cairo.ImageSurface.create_from_png(io.BytesIO(skin_data))
-
-        skin_surface = skin_surface_cache[name]
+        try:
+            skin_surface = get_skin_surface(name, skin_data)
+        except (cairo.Error, MemoryError) as e:  # not a valid PNG
+            skin_poisoned.add(name)
+            swallowed('CellSkins.draw', e)
+            return
         skin_radius = skin_surface.get_width() / 2
+        c.save()
         try:
-            c.save()
-            c.translate(*w.world_to_screen_pos(cell.pos))
+            c.translate(*(pos or w.world_to_screen_pos(cell.pos)))
             scale = w.world_to_screen_size(cell.draw_size / skin_radius)
             c.scale(scale, scale)
             c.translate(-skin_radius, -skin_radius)
@@ -78,11 +240,18 @@ class CellSkins(Subscriber):
             c.new_sub_path()
             c.arc(skin_radius, skin_radius, skin_radius, 0, TWOPI)
             c.fill()
+        except SystemError as e:
+            skin_poisoned.add(name)
+            swallowed('CellSkins.draw', e)
+        finally:
             c.restore()
-        except SystemError:
-            print("Error while drawing skin: " + name)
-            pass
+
+    def __init__(self, cell_index=None, settings=None):
+        self.cell_index = cell_index
+        self.settings = settings
 
     def on_draw_cells(self, c, w):
-        for cell in w.world.cells.values():
+        if self.settings:
+            set_cache_limit(self.settings)
+        for cell in visible_cells(w, self.cell_index):
             self.draw(c, w, cell)
@@ -0,0 +1,172 @@
+from agarnet.vec import Vec
+from .subscriber import Subscriber
+
+VIEW_MARGIN = 100  # world units, covers cells growing/moving between updates
+
+
+class SpatialHash(object):
+    """
+    Uniform grid over the world, for finding items near a rectangle.
+    Items are stored in every bucket their bounding box touches.
+    """
+
+    def __init__(self, bucket_size=500):
+        self.bucket_size = bucket_size
+        self.buckets = {}  # (bx, by) -> {key: item}
+        self.item_buckets = {}  # key -> list of bucket coords
+
+    def __len__(self):
+        return len(self.item_buckets)
+
+    def __contains__(self, key):
+        return key in self.item_buckets
+
+    def clear(self):
+        self.buckets.clear()
+        self.item_buckets.clear()
+
+    def bucket_range(self, left, top, right, bottom):
+        s = self.bucket_size
+        for bx in range(int(left // s), int(right // s) + 1):
+            for by in range(int(top // s), int(bottom // s) + 1):
+                yield bx, by
+
+    def insert(self, key, item, x, y, radius=0):
+        if key in self.item_buckets:
+            self.remove(key)
+        coords = list(self.bucket_range(x - radius, y - radius, x + radius, y + radius))
+        buckets = self.buckets
+        for coord in coords:
+            bucket = buckets.get(coord)
+            if bucket is None:
+                bucket = buckets[coord] = {}
+            bucket[key] = item
+        self.item_buckets[key] = coords
+
+    def remove(self, key):
+        for coord in self.item_buckets.pop(key, ()):
+            bucket = self.buckets[coord]
+            del bucket[key]
+            if not bucket:
+                del self.buckets[coord]
+
+    def query_rect(self, left, top, right, bottom):
+        """Returns {key: item} of all items whose bucket touches the rect."""
+        found = {}
+        buckets = self.buckets
+        for coord in self.bucket_range(left, top, right, bottom):
+            bucket = buckets.get(coord)
+            if bucket:
+                found.update(bucket)
+        return found
+
+
+class CellIndex(Subscriber):
+    """
+    Spatial index over the cells of the client's world and the cells
+    only known through the team, updated once per world update.
+    Answers which of them are visible in a view, once per frame.
+    """
+
+    def __init__(self, client, bucket_size=500):
+        self.client = client
+        self.local = SpatialHash(bucket_size)
+        self.team = SpatialHash(bucket_size)
+        self.team_only = {}  # cid -> team cell that is not in the local world
+        self.team_positions = {}  # cid -> (x, y, size) when last indexed
+        self.version = 0
+        self.visible_key = None
+        self.visible_cells = []
+        self.visible_team_cells = []
+
+    def on_world_update_post(self):
+        local = self.local
+        local.clear()
+        cells = self.client.player.world.cells
+        for cid, cell in cells.items():
+            local.insert(cid, cell, cell.pos.x, cell.pos.y, cell.size)
+
+        # team cells that we now see ourselves
+        for cid in [cid for cid in self.team_only if cid in cells]:
+            self.remove_team_cell(cid)
+        self.version += 1
+
+    def on_clear_cells(self):
+        self.local.clear()
+        self.version += 1
+
+    def update_team(self, team_cells):
+        """
+        Merges the current team cells, only re-indexing changed ones.
+        `team_cells` is a {cid: cell} dict.
+        """
+        local_cells = self.client.player.world.cells
+        for cid in [cid for cid in self.team_only if cid not in team_cells]:
+            self.remove_team_cell(cid)
+        for cid, cell in team_cells.items():
+            if cid in local_cells:
+                if cid in self.team_only:
+                    self.remove_team_cell(cid)
+                continue
+            self.update_team_cell(cid, cell)
+        self.version += 1
+
+    def on_team_update(self, world, changed, removed):
+        local_cells = self.client.player.world.cells
+        for cid in removed:
+            self.remove_team_cell(cid)
+        for cid in changed:
+            cell = world.cells.get(cid)
+            if cell is None or cid in local_cells:
+                self.remove_team_cell(cid)
+            else:
+                self.update_team_cell(cid, cell)
+        self.version += 1
+
+    def update_team_cell(self, cid, cell):
+        pos = (cell.pos.x, cell.pos.y, cell.size)
+        if self.team_positions.get(cid) != pos:
+            self.team.insert(cid, cell, pos[0], pos[1], cell.size)
+            self.team_positions[cid] = pos
+        self.team_only[cid] = cell
+
+    def remove_team_cell(self, cid):
+        self.team.remove(cid)
+        self.team_positions.pop(cid, None)
+        self.team_only.pop(cid, None)
+
+    def view_rect(self, w):
+        top_left = w.screen_to_world_pos(Vec(0, 0))
+        bottom_right = w.screen_to_world_pos(w.win_size)
+        return (top_left.x - VIEW_MARGIN, top_left.y - VIEW_MARGIN,
+                bottom_right.x + VIEW_MARGIN, bottom_right.y + VIEW_MARGIN)
+
+    def update_visible(self, w):
+        key = (self.version, w.world_center.x, w.world_center.y,
+               w.screen_scale, w.win_size.x, w.win_size.y)
+        if key == self.visible_key:
+            return
+        self.visible_key = key
+        rect = self.view_rect(w)
+        # reverse to show small over large cells
+        self.visible_cells = sorted(self.local.query_rect(*rect).values(), reverse=True)
+        self.visible_team_cells = sorted(self.team.query_rect(*rect).values(), reverse=True)
+
+    def visible(self, w):
+        """Cells of the local world near the view of `w`, largest first."""
+        if w.world is not self.client.player.world:
+            return sorted(w.world.cells.values(), reverse=True)
+        self.update_visible(w)
+        return self.visible_cells
+
+    def visible_team(self, w):
+        """Cells only known through the team near the view of `w`, largest first."""
+        self.update_visible(w)
+        return self.visible_team_cells
+
+
+def visible_cells(w, cell_index=None):
+    """Cells to draw in `w`, largest first if culled through `cell_index`."""
+    if cell_index:
+        return cell_index.visible(w)
+    return w.world.cells.values()
@@ -0,0 +1,56 @@
+"""
+Startup profiling for `gagar --profile-startup`:
+times every module import and the startup steps marked via `mark()`,
+printed by `report()` once the first frame is on screen.
+"""
+import builtins
+import sys
+import time
+
+start_time = time.perf_counter()
+enabled = False
+marks = []  # (seconds since start, step)
+imports = []  # (seconds, module name), outermost imports only
+
+_original_import = builtins.__import__
+_depth = 0
+
+
+def _timed_import(name, *args, **kwargs):
+    global _depth
+    if name in sys.modules:
+        return _original_import(name, *args, **kwargs)
+    _depth += 1
+    num_modules = len(sys.modules)
+    t = time.perf_counter()
+    try:
+        return _original_import(name, *args, **kwargs)
+    finally:
+        _depth -= 1
+        # nested imports are included in the outermost one
+        if _depth == 0 and len(sys.modules) > num_modules:
+            imports.append((time.perf_counter() - t, name))
+
+
+def enable():
+    global enabled
+    enabled = True
+    builtins.__import__ = _timed_import
+
+
+def mark(step):
+    if enabled:
+        marks.append((time.perf_counter() - start_time, step))
+
+
+def report(num_imports=15):
+    """Prints the marked steps and the slowest imports."""
+    if not enabled:
+        return
+    print('[STARTUP] Steps (seconds since start):')
+    for t, step in marks:
+        print('[STARTUP] %8.3f  %s' % (t, step))
+    print('[STARTUP] Slowest imports:')
+    for t, name in sorted(imports, reverse=True)[:num_imports]:
+        print('[STARTUP] %8.3f  %s' % (t, name))
+    print('[STARTUP] %.3f s importing in total' % sum(t for t, _ in imports))
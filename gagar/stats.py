@@ -0,0 +1,119 @@
+"""
+Statistics about the own player, updated once per world update,
+so the HUD elements read them instead of each scanning the own cells.
+
+    stats = PlayerStats(client)
+    stats.total_mass, stats.own_min_mass, stats.own_max_mass
+    stats.next_remerge()     # (seconds, cid) until the next cell can remerge
+    stats.rank, stats.best_rank, stats.rank_history
+    stats.kills, stats.deaths, stats.events
+"""
+from collections import deque
+import heapq
+from time import time
+
+from .subscriber import Subscriber
+
+
+def remerge_time(cell):
+    """Seconds after splitting until `cell` can remerge, formula by HungryBlob."""
+    return max(30, cell.size // 5)
+
+
+class PlayerStats(Subscriber):
+    def __init__(self, client, history=100):
+        self.client = client
+        self.history = history
+        self.reset()
+        self.kills = self.deaths = 0
+        self.best_rank = None
+        self.rank_history = deque(maxlen=history)  # (time, rank or None)
+        self.events = deque(maxlen=history)  # (time, 'kill'/'death', name, mass)
+
+    def reset(self):
+        """Clears the values of the current tick."""
+        self.num_cells = 0
+        self.total_mass = 0
+        self.own_min_mass = self.own_max_mass = 0
+        self.own_max_size = 0
+        self.own_cid = -1  # lowest own cid, shown in the leaderboard
+        self.masses = []  # sorted (cid, mass) of the own cells
+        self.remerge_at = {}  # cid -> time when that cell can remerge
+        self.remerge_heap = []  # (remerge time, cid)
+        self.merge_deadlines = []  # sorted times when the split cells merge again
+        self.rank = None
+
+    def on_respawn(self):
+        self.reset()
+
+    def on_world_update_post(self):
+        player = self.client.player
+        masses = self.masses = sorted((c.cid, c.mass) for c in player.own_cells)
+        self.num_cells = len(masses)
+        self.total_mass = player.total_mass
+        if masses:
+            self.own_cid = masses[0][0]
+            self.own_min_mass = min(m for _, m in masses)
+            self.own_max_mass = max(m for _, m in masses)
+            self.own_max_size = max(c.size for c in player.own_cells)
+        else:
+            self.own_cid = -1
+            self.own_min_mass = self.own_max_mass = self.own_max_size = 0
+
+        remerge_at = self.remerge_at = {}
+        merge_deadlines = []
+        if len(masses) > 1:  # something to remerge with
+            merge_base = self.total_mass * 0.02 + 30  # formula by DebugMonkey
+            for cell in player.own_cells:
+                remerge_at[cell.cid] = cell.spawn_time + remerge_time(cell)
+                merge_deadlines.append(cell.spawn_time + merge_base)
+        self.remerge_heap = [(t, cid) for cid, t in remerge_at.items()]
+        heapq.heapify(self.remerge_heap)
+        self.merge_deadlines = sorted(merge_deadlines)
+
+    def next_remerge(self, now=None):
+        """(seconds, cid) until the next own cell can remerge, or None."""
+        now = now or time()
+        heap = self.remerge_heap
+        while heap and heap[0][0] <= now:
+            heapq.heappop(heap)  # can remerge already
+        if not heap:
+            return None
+        t, cid = heap[0]
+        return t - now, cid
+
+    def merge_times(self, now=None):
+        """(min, max) seconds until the split cells merge again, or None."""
+        now = now or time()
+        pending = [t for t in self.merge_deadlines if t > now]
+        if not pending:
+            return None
+        return pending[0] - now, pending[-1] - now
+
+    def on_cell_eaten(self, eater_id, eaten_id):
+        player = self.client.player
+        cells = player.world.cells
+        if eaten_id in player.own_ids:
+            if len(player.own_ids) <= 1:
+                eater = cells.get(eater_id)
+                self.deaths += 1
+                self.events.append((time(), 'death', eater.name if eater else '',
+                                    eater.mass if eater else 0))
+        elif eater_id in player.own_ids:
+            eaten = cells.get(eaten_id)
+            if eaten and not (eaten.is_food or eaten.is_ejected_mass or eaten.is_virus):
+                self.kills += 1
+                self.events.append((time(), 'kill', eaten.name, eaten.mass))
+
+    def on_leaderboard_names(self, leaderboard):
+        rank = None
+        if self.own_cid >= 0:
+            for i, (cid, name) in enumerate(leaderboard):
+                if cid == self.own_cid:
+                    rank = i + 1  # start at rank 1
+                    break
+        if rank is not None and (self.best_rank is None or rank < self.best_rank):
+            self.best_rank = rank
+        if rank != self.rank or not self.rank_history:
+            self.rank_history.append((time(), rank))
+        self.rank = rank
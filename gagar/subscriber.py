@@ -1,3 +1,8 @@
+def ignore(*args, **kwargs):
+    """Default handler, does nothing."""
+    pass
+
+
 class Subscriber(object):
     """Base class for event handlers via on_*() methods."""
 
@@ -6,26 +11,55 @@ class Subscriber(object):
         if 'on_' != func_name[:3]:
             raise AttributeError("'%s' object has no attribute '%s'"
                                  % (self.__class__.__name__, func_name))
-        return lambda *args, **kwargs: None  # default handler does nothing
+        return ignore
+
+
+def invalidate_dispatch():
+    """
+    Makes all MultiSubscribers look up their handlers again.
+    Call this when handlers change, e.g. after reloading a class.
+    """
+    MultiSubscriber.generation += 1
 
 
 class MultiSubscriber(Subscriber):
     """Distributes method calls to multiple subscribers."""
 
+    generation = 0  # dispatch tables from older generations are stale
+
     def __init__(self, *subs):
         self.subs = list(subs)
+        self.dispatch = {}  # func_name -> (generation, wrapper)
 
     def sub(self, subscriber):
         self.subs.append(subscriber)
+        invalidate_dispatch()  # also any MultiSubscriber containing this one
         return subscriber
 
     def __getattr__(self, func_name):
         super(MultiSubscriber, self).__getattr__(func_name)
 
-        def wrapper(*args, **kwargs):
-            for sub in self.subs:
-                handler = getattr(sub, func_name, None)
-                if handler:
+        # `dispatch` itself is looked up here while unpickling/copying
+        dispatch = self.__dict__.get('dispatch')
+        if dispatch is None:
+            raise AttributeError(func_name)
+
+        cached = dispatch.get(func_name)
+        if cached and cached[0] == MultiSubscriber.generation:
+            return cached[1]
+
+        handlers = []
+        for sub in self.subs:
+            handler = getattr(sub, func_name, None)
+            if handler and handler is not ignore:
+                handlers.append(handler)
+
+        if handlers:
+            def wrapper(*args, **kwargs):
+                for handler in handlers:
                     handler(*args, **kwargs)
+        else:
+            wrapper = ignore  # lets containing MultiSubscribers skip us
 
+        dispatch[func_name] = (MultiSubscriber.generation, wrapper)
         return wrapper
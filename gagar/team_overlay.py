@@ -1,47 +1,74 @@
-from agarnet.vec import Vec
 from agarnet.utils import get_party_address
 
+from .prediction import MotionPredictor
+from .spatial import CellIndex
 from .subscriber import Subscriber
 from .drawutils import *
+from .layers import Layer
 from .draw_cells import *
 from .skins import *
 
 TEAM_OVERLAY_PADDING = 50
+PANEL_WIDTH = 300
 INFO_SIZE = 14
 
 
 class TeamOverlay(Subscriber):
-    def __init__(self, tagar_client):
+    def __init__(self, tagar_client, cell_index=None, stats=None):
         self.tagar_client = tagar_client
-
-    def is_in_screen(self, w, screen_pos, radius=0.0):
-        if screen_pos.x < -radius or screen_pos.y < -radius:
-            return False
-        if screen_pos.x > w.win_size.x+radius or screen_pos.y > w.win_size.y+radius:
-            return False
-        return True
+        self.cell_index = cell_index or CellIndex(tagar_client.agar_client)
+        self.stats = stats  # own masses of the current tick
+        # smooths team cells and teammates between their updates
+        self.predictor = MotionPredictor(tagar_client, self.cell_index)
+
+        # static parts of the team panel, redrawn when the player list changes
+        self.panel_key = None
+        self.panel_layer = Layer()
+        self.buttons = {}  # player id -> JOIN button
+
+        # set when team cells arrive as deltas via on_team_update()
+        self.incremental = False
+
+    def on_team_update(self, world, changed, removed):
+        if not self.incremental:
+            # drop the cells merged from Tagar until now
+            self.cell_index.update_team(world.cells)
+        self.incremental = True  # CellIndex merges the deltas itself
+        self.predictor.on_team_update(world, changed, removed)
+
+    def on_world_update_post(self):
+        if not self.incremental:
+            # copy, Tagar updates the team world in another thread
+            self.cell_index.update_team(self.tagar_client.team_world.cells.copy())
+        self.predictor.on_world_update_post()
+
+    def on_clear_cells(self):
+        self.predictor.on_clear_cells()
+
+    def player_positions(self):
+        """(pid, player, predicted world position) of all teammates."""
+        predict = self.predictor.predict_player
+        return [(pid, player, predict(pid, player))
+                for pid, player in list(self.tagar_client.player_list.items())]
 
     def on_draw_cells(self, c, w):
-        def nick_size(cell, w):
-            return max(14, w.world_to_screen_size(.3 * cell.draw_size))
-
-        own_min_mass = min(c.mass for c in w.player.own_cells) if w.player.is_alive else 0
-        own_max_mass = max(c.mass for c in w.player.own_cells) if w.player.is_alive else 0
-
-        # reverse to show small over large cells
-        cells = [c for c in list(self.tagar_client.team_world.cells.values()) if c.cid not in self.tagar_client.player.world.cells]
-        for cell in sorted(cells, reverse=True):
-            pos = w.world_to_screen_pos(cell.pos)
-
-            # don't draw cells outside of visible area
-            if not self.is_in_screen(w, pos, cell.draw_size):
-                continue
+        if self.stats:
+            own_min_mass, own_max_mass = self.stats.own_min_mass, self.stats.own_max_mass
+        elif w.player.is_alive:
+            own_min_mass = min(c.mass for c in w.player.own_cells)
+            own_max_mass = max(c.mass for c in w.player.own_cells)
+        else:
+            own_min_mass = own_max_mass = 0
+
+        # only cells near the visible area, small ones over large ones
+        for cell in self.cell_index.visible_team(w):
+            pos = w.world_to_screen_pos(self.predictor.predict_cell(cell))
 
             # draw cell itself
             CellsDrawer.draw(c, w, cell, pos, 0.5)
 
             # draw cell skin
-            CellSkins.draw(c, w, cell)
+            CellSkins.draw(c, w, cell, pos)
 
             # draw names
             CellNames.draw(c, w, cell, pos)
@@ -54,51 +81,71 @@ class TeamOverlay(Subscriber):
 
     def on_draw_minimap(self, c, w):
         if w.world.size:
-            minimap_w = w.win_size.x / 5
-            minimap_size = Vec(minimap_w, minimap_w)
-            minimap_scale = minimap_size.x / w.world.size.x
-            minimap_offset = w.win_size - minimap_size
-
-            def world_to_map(world_pos):
-                pos_from_top_left = world_pos - w.world.top_left
-                return minimap_offset + pos_from_top_left * minimap_scale
+            world_to_map = w.minimap.pos
+            minimap_scale = w.minimap.scale
 
             # draw cells
-            cells = self.tagar_client.team_world.cells.copy()
-            for cell in cells.values():
-                if cell.cid not in w.world.cells:
-                    if cell.cid in self.tagar_client.team_cids:
-                        c.fill_circle(world_to_map(cell.pos),
-                                      cell.size * minimap_scale,
-                                      color=to_rgba(cell.color, 0.7))
-                    else:
-                        alpha = .66 if cell.mass > (self.tagar_client.player.total_mass * 0.66) else 0.33
-                        c.stroke_circle(world_to_map(cell.pos),
-                                        cell.size * minimap_scale,
-                                        color=to_rgba(cell.color, alpha))
+            predict = self.predictor.predict_cell
+            for cell in self.cell_index.team_only.values():
+                if cell.cid in self.tagar_client.team_cids:
+                    c.fill_circle(world_to_map(predict(cell)),
+                                  cell.size * minimap_scale,
+                                  color=to_rgba(cell.color, 0.7))
+                else:
+                    alpha = .66 if cell.mass > (self.tagar_client.player.total_mass * 0.66) else 0.33
+                    c.stroke_circle(world_to_map(predict(cell)),
+                                    cell.size * minimap_scale,
+                                    color=to_rgba(cell.color, alpha))
+
+            players = self.player_positions()
 
             # draw lines to team members
             if self.tagar_client.player.is_alive:
-                for i, player in enumerate(list(self.tagar_client.player_list.values())):
+                for pid, player, player_pos in players:
                     if player.is_alive:
                         c.draw_line(world_to_map(w.player.center),
-                                    world_to_map(Vec(player.position_x, player.position_y)),
+                                    world_to_map(player_pos),
                                     width=1, color=GREEN)
 
             # draw names
-            for i, player in enumerate(list(self.tagar_client.player_list.values())):
+            for pid, player, player_pos in players:
                 if player.is_alive:
-                    c.draw_text(world_to_map(Vec(player.position_x, player.position_y)), player.nick,
+                    c.draw_text(world_to_map(player_pos), player.nick,
                                 align='center', color=WHITE, outline=(BLACK, 2), size=8)
 
-    def on_draw_hud(self, c, w):
+    @staticmethod
+    def draw_panel(c, players):
+        """Draws title, nicks and tokens, which only change with the player list."""
         c.draw_text((10, 30), 'Team', align='left', color=WHITE, outline=(BLACK, 2), size=27)
-
-        # draw player position in main view
-        for i, player in enumerate(list(self.tagar_client.player_list.values())):
+        for i, player in enumerate(players):
             c.draw_text((10, 60 + TEAM_OVERLAY_PADDING * i), player.nick,
                         align='left', color=WHITE, outline=(BLACK, 2), size=18)
+            c.draw_text((10, 88 + TEAM_OVERLAY_PADDING * i), '#' + player.party_token,
+                        align='left', color=GRAY, outline=(BLACK, 2), size=12)
+
+    def on_draw_hud(self, c, w):
+        player_items = self.player_positions()
+        players = [player for _, player, _ in player_items]
+
+        panel_key = tuple((pid, player.nick, player.party_token)
+                          for pid, player, _ in player_items)
+        if panel_key != self.panel_key:
+            self.panel_key = panel_key
+            buttons = {pid: self.buttons.get(pid) or Button(
+                90, 75 - 12 + TEAM_OVERLAY_PADDING * i, 50, 25, "JOIN")
+                for i, (pid, _, _) in enumerate(player_items)}
+            for pid, button in self.buttons.items():
+                if pid not in buttons:
+                    w.widgets.remove(button)  # player left
+            for button in buttons.values():
+                if button not in w.widgets:
+                    w.register_button(button)
+            self.buttons = buttons
+        rect = (0, 0, PANEL_WIDTH, 60 + TEAM_OVERLAY_PADDING * len(players))
+        self.panel_layer.draw(c, panel_key, rect, lambda c: self.draw_panel(c, players))
 
+        # draw player position in main view
+        for i, (pid, player, player_pos) in enumerate(player_items):
             if player.total_mass > 0:
                 mass_color = GRAY
                 mass_text = 'Mass: ' + str('%.2f' % player.total_mass)
@@ -109,18 +156,15 @@ class TeamOverlay(Subscriber):
             c.draw_text((10, 75 + TEAM_OVERLAY_PADDING * i), mass_text,
                         align='left', color=mass_color, outline=(BLACK, 2), size=12)
 
-            c.draw_text((10, 88 + TEAM_OVERLAY_PADDING * i), '#' + player.party_token,
-                        align='left', color=GRAY, outline=(BLACK, 2), size=12)
-
-            button = Button(90, 75 - 12 + TEAM_OVERLAY_PADDING * i, 50, 25, "JOIN")
+            button = self.buttons[pid]
+            w.widgets.move(button, button.x, 75 - 12 + TEAM_OVERLAY_PADDING * i)
             button.id = player
-            w.register_button(button)
-            c.draw_button(button)
+            w.widgets.draw(c, button)
 
             if self.tagar_client.player.is_alive and player.is_alive:
                 # draw lines to team members
                 client_pos = w.world_to_screen_pos(w.player.center)
-                pos = w.world_to_screen_pos(Vec(player.position_x, player.position_y))
+                pos = w.world_to_screen_pos(player_pos)
                 c.draw_line(client_pos, pos, width=2, color=GREEN)
 
                 # TODO draw names
@@ -144,16 +188,14 @@ class TeamOverlay(Subscriber):
                         pos.x += client_pos.x
                         pos.y = y
 
-                    dist = ((w.player.center.x-player.position_x)**2 + (w.player.center.y-player.position_y)**2)**0.5
+                    dist = (w.player.center - player_pos).len()
 
                     c.draw_text(pos, "%s (%.1f / %.1f)" % (player.nick, player.total_mass, dist), align=alignment, color=WHITE, outline=(BLACK, 2), size=text_size)
 
 
-    @staticmethod
-    def on_button_hover(button, pos):
-        button.highlight = True
-
     def on_button_pressed(self, button, pos):
+        if button not in self.buttons.values():
+            return  # not ours
         player = button.id
         if player.party_token == 'FFA':
             return
@@ -0,0 +1,458 @@
+"""
+Delta-compressed team synchronization.
+
+Every teammate periodically sends the cells it sees. Instead of the full
+cell set, only cells that are new, moved more than `move_threshold`,
+changed size, or disappeared since the last message are sent, in a
+compact binary format. Names are only sent with new cells.
+A full refresh every `full_interval` seconds heals lost messages.
+Messages larger than `max_size` are split into parts, each of which can
+be applied on its own; a full refresh only removes cells once all of its
+parts arrived.
+
+The send interval adapts: it grows when the delay of received messages
+or the used bandwidth exceed their targets, and shrinks back otherwise.
+The delay is measured against the fastest message seen from the same
+sender, so the clocks of the teammates do not need to agree.
+
+Received deltas are merged into the team world incrementally, and
+subscribers are told which cells changed via on_team_update().
+
+Any transport works that has a `send(data)` method and calls
+`TeamSync.receive(data)` (from any thread) for incoming messages.
+`UdpTransport` signs its messages with a shared key.
+"""
+from collections import deque
+import hashlib
+import hmac
+import queue
+import random
+import socket
+import struct
+import threading
+import time
+
+from .diagnostics import swallowed
+from .subscriber import Subscriber
+
+MAGIC = 0x47  # 'G'
+DELTA = 1
+FULL = 2
+
+MAX_MESSAGE_SIZE = 1200  # bytes, fits into one Ethernet frame with the signature
+TAGAR_UPDATE_RATE = 0.5  # seconds between Tagar pushes, when cells come via team sync
+DELAY_WINDOW = 200  # messages per sender to find the fastest one in
+
+header_struct = struct.Struct('<BBIIdHH')  # magic, kind, sender, seq, sent time, part, parts
+count_struct = struct.Struct('<H')
+cid_struct = struct.Struct('<I')
+cell_struct = struct.Struct('<IhhHBBBB')  # cid, x, y, size, r, g, b, flags
+
+MAC_SIZE = 16  # bytes of HMAC-SHA256 appended to each UDP message
+
+CELL_VIRUS = 1
+CELL_AGITATED = 2
+CELL_NAME = 4
+
+
+def encode_cell(cell, with_name):
+    r, g, b = (int(round(c * 255)) for c in cell.color)
+    flags = (CELL_VIRUS if cell.is_virus else 0) \
+        | (CELL_AGITATED if cell.is_agitated else 0) \
+        | (CELL_NAME if with_name and cell.name else 0)
+    data = cell_struct.pack(cell.cid, int(cell.pos.x), int(cell.pos.y), int(cell.size),
+                            r, g, b, flags)
+    if flags & CELL_NAME:
+        name = cell.name.encode('utf-8')[:255]
+        data += bytes((len(name),)) + name
+    return data
+
+
+def decode(data):
+    """
+    Returns (kind, sender, seq, sent_time, part, parts, removed, cells),
+    `cells` being a list of (cid, x, y, size, color, flags, name or None).
+    """
+    magic, kind, sender, seq, sent_time, part, parts = header_struct.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError('Not a team sync message')
+    offset = header_struct.size
+
+    n, = count_struct.unpack_from(data, offset)
+    offset += count_struct.size
+    removed = struct.unpack_from('<%iI' % n, data, offset)
+    offset += 4 * n
+
+    n, = count_struct.unpack_from(data, offset)
+    offset += count_struct.size
+    cells = []
+    for _ in range(n):
+        cid, x, y, size, r, g, b, flags = cell_struct.unpack_from(data, offset)
+        offset += cell_struct.size
+        name = None
+        if flags & CELL_NAME:
+            length = data[offset]
+            name = bytes(data[offset + 1:offset + 1 + length]).decode('utf-8', 'replace')
+            offset += 1 + length
+        cells.append((cid, x, y, size, (r, g, b), flags, name))
+    return kind, sender, seq, sent_time, part, parts, removed, cells
+
+
+class DeltaEncoder(object):
+    """Remembers what was sent last, to only send what changed since."""
+
+    def __init__(self, sender, move_threshold=10, max_size=MAX_MESSAGE_SIZE):
+        self.sender = sender
+        self.move_threshold = move_threshold
+        self.max_size = max_size
+        self.seq = 0
+        self.sent = {}  # cid -> (x, y, size, name)
+
+    def encode(self, cells, full=False):
+        """
+        Encodes the {cid: cell} dict as delta (or full) message,
+        returns the list of its parts.
+        """
+        sent = self.sent
+        threshold = self.move_threshold
+        removed = [cid for cid in sent if cid not in cells]
+        for cid in removed:
+            del sent[cid]
+
+        changed = []
+        for cid, cell in cells.items():
+            last = sent.get(cid)
+            x, y = cell.pos.x, cell.pos.y
+            if last is None or full or last[3] != cell.name:
+                changed.append(encode_cell(cell, with_name=True))
+            elif abs(last[0] - x) > threshold or abs(last[1] - y) > threshold \
+                    or last[2] != cell.size:
+                changed.append(encode_cell(cell, with_name=False))
+            else:
+                continue
+            sent[cid] = (x, y, cell.size, cell.name)
+
+        self.seq += 1
+        return self.split(FULL if full else DELTA, removed, changed)
+
+    def split(self, kind, removed, changed):
+        """Packs the removed cids and changed cells into messages of at most `max_size`."""
+        budget = self.max_size - header_struct.size - 2 * count_struct.size
+        bodies = []  # (removed cids, encoded cells)
+        cids, cells, size = [], [], 0
+        for cid in removed:
+            if size + cid_struct.size > budget:
+                bodies.append((cids, cells))
+                cids, cells, size = [], [], 0
+            cids.append(cid)
+            size += cid_struct.size
+        for data in changed:
+            if size + len(data) > budget and (cids or cells):
+                bodies.append((cids, cells))
+                cids, cells, size = [], [], 0
+            cells.append(data)
+            size += len(data)
+        bodies.append((cids, cells))  # possibly empty, tells we are still there
+
+        sent_time = time.time()
+        messages = []
+        for part, (cids, cells) in enumerate(bodies):
+            message = [header_struct.pack(MAGIC, kind, self.sender, self.seq, sent_time,
+                                          part, len(bodies)),
+                       count_struct.pack(len(cids)),
+                       struct.pack('<%iI' % len(cids), *cids),
+                       count_struct.pack(len(cells))]
+            message.extend(cells)
+            messages.append(b''.join(message))
+        return messages
+
+
+class TeamMerger(object):
+    """Applies received messages to the team world, one sender at a time."""
+
+    def __init__(self, world):
+        self.world = world
+        self.owners = {}  # cid -> set of senders that see the cell
+        self.sender_cells = {}  # sender -> set of cids
+        self.last_seq = {}  # sender -> seq, kept after expiring against replays
+        self.parts_seen = {}  # sender -> parts of its last seq
+        self.full_cids = {}  # sender -> cids in the parts of its last full refresh
+        self.offsets = {}  # sender -> arrival minus sent time of recent messages
+        self.last_heard = {}  # sender -> monotonic time
+
+    def merge(self, data, arrival=None):
+        """
+        Returns (changed cids, removed cids, delay), or None if outdated.
+        `delay` is how much later than the fastest recent message from the same
+        sender this one arrived, which does not depend on the sender's clock.
+        """
+        kind, sender, seq, sent_time, part, parts, removed, cells = decode(data)
+        last_seq = self.last_seq.get(sender, 0)
+        if seq < last_seq:
+            return None  # reordered
+        if seq == last_seq:
+            seen = self.parts_seen.get(sender, set())
+            if part in seen:
+                return None  # duplicated
+        else:
+            self.last_seq[sender] = seq
+            seen = self.parts_seen[sender] = set()
+            self.full_cids[sender] = set()
+        seen.add(part)
+        self.last_heard[sender] = time.monotonic()
+
+        offsets = self.offsets.get(sender)
+        if offsets is None:
+            offsets = self.offsets[sender] = deque(maxlen=DELAY_WINDOW)
+        offsets.append((time.time() if arrival is None else arrival) - sent_time)
+        delay = offsets[-1] - min(offsets)
+
+        own = self.sender_cells.setdefault(sender, set())
+        if kind == FULL:
+            full = self.full_cids[sender]
+            full.update(cell[0] for cell in cells)
+            if len(seen) == parts:  # complete, drop what the sender no longer sees
+                removed = list(removed) + [cid for cid in own if cid not in full]
+
+        gone = self.remove(sender, removed)
+        changed = []
+        world_cells = self.world.cells
+        for cid, x, y, size, color, flags, name in cells:
+            own.add(cid)
+            self.owners.setdefault(cid, set()).add(sender)
+            if cid not in world_cells:
+                self.world.create_cell(cid)
+            cell = world_cells[cid]
+            cell.update(cid=cid, x=x, y=y, size=size,
+                        name=name if name is not None else getattr(cell, 'name', ''),
+                        color=color,
+                        is_virus=bool(flags & CELL_VIRUS),
+                        is_agitated=bool(flags & CELL_AGITATED))
+            changed.append(cid)
+        return changed, gone, delay
+
+    def remove(self, sender, cids):
+        """Removes the sender's cells, returns those nobody else sees."""
+        own = self.sender_cells.get(sender, set())
+        gone = []
+        for cid in list(cids):
+            own.discard(cid)
+            owners = self.owners.get(cid)
+            if owners:
+                owners.discard(sender)
+                if not owners:
+                    del self.owners[cid]
+                    self.world.cells.pop(cid, None)
+                    gone.append(cid)
+        return gone
+
+    def expire(self, timeout):
+        """Removes the cells of senders not heard of for `timeout` seconds."""
+        gone = []
+        now = time.monotonic()
+        for sender, last_heard in list(self.last_heard.items()):
+            if now - last_heard > timeout:
+                gone.extend(self.remove(sender, self.sender_cells.pop(sender, ())))
+                del self.last_heard[sender]
+                self.parts_seen.pop(sender, None)
+                self.full_cids.pop(sender, None)
+                self.offsets.pop(sender, None)
+        return gone
+
+
+class AdaptiveRate(object):
+    """
+    Send interval that grows multiplicatively when latency or bandwidth
+    are too high, and shrinks additively when they are fine.
+    """
+
+    def __init__(self, min_interval=0.04, max_interval=1.0,
+                 target_latency=0.15, max_bandwidth=16 * 1024):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_latency = target_latency
+        self.max_bandwidth = max_bandwidth  # bytes per second
+        self.interval = min_interval
+        self.latency = 0.0  # smoothed
+        self.bandwidth = 0.0  # smoothed, bytes per second
+        self.last_sent = None
+
+    def on_latency(self, latency):
+        self.latency += (latency - self.latency) * 0.1
+
+    def on_sent(self, num_bytes, now):
+        if self.last_sent is not None:
+            dt = max(now - self.last_sent, self.min_interval)
+            self.bandwidth += (num_bytes / dt - self.bandwidth) * 0.2
+        self.last_sent = now
+
+        if self.latency > self.target_latency or self.bandwidth > self.max_bandwidth:
+            self.interval = min(self.interval * 1.5, self.max_interval)
+        else:
+            self.interval = max(self.interval - 0.01, self.min_interval)
+
+    def due(self, now):
+        return self.last_sent is None or now - self.last_sent >= self.interval
+
+
+class TeamSync(Subscriber):
+    """
+    Sends the cells we see to the team and merges what the team sees into
+    `team_world`, on every world update.
+    """
+
+    def __init__(self, client, team_world, transport=None, min_interval=0.04,
+                 move_threshold=10, full_interval=5.0, tagar_client=None):
+        self.client = client
+        self.team_world = team_world
+        self.transport = transport
+        if tagar_client is not None:
+            # the cells come from here, Tagar only needs to keep the player list
+            rate = getattr(tagar_client, 'update_rate', 0)
+            tagar_client.update_rate = max(rate, TAGAR_UPDATE_RATE)
+        self.encoder = DeltaEncoder(random.getrandbits(32), move_threshold)
+        self.merger = TeamMerger(team_world)
+        self.rate = AdaptiveRate(min_interval)
+        self.full_interval = full_interval
+        self.last_full = 0
+        self.received = queue.Queue()  # raw messages from the transport thread
+
+    def on_profile_changed(self, settings):
+        self.rate.min_interval = settings.team_sync_interval
+        self.rate.interval = max(self.rate.interval, settings.team_sync_interval)
+
+    def receive(self, data):
+        """Called by the transport, from any thread."""
+        self.received.put(data)
+
+    def merge_received(self):
+        changed = set()
+        removed = set()
+        latency = None
+        while True:
+            try:
+                data = self.received.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                result = self.merger.merge(data)
+            except (ValueError, struct.error):
+                continue  # garbage, or truncated message
+            if result:
+                c, r, latency = result
+                changed.update(c)
+                changed.difference_update(r)
+                removed.update(r)
+                self.rate.on_latency(latency)
+        removed.update(self.merger.expire(3 * self.full_interval))
+        if changed or removed:
+            self.client.subscriber.on_team_update(
+                world=self.team_world, changed=changed, removed=removed)
+        if latency is not None:
+            self.client.subscriber.on_team_sync(latency=latency)
+
+    def send(self):
+        now = time.monotonic()
+        if not self.transport or not self.rate.due(now):
+            return
+        full = now - self.last_full >= self.full_interval
+        if full:
+            self.last_full = now
+        cells = {cid: cell for cid, cell in self.client.player.world.cells.items()
+                 if not cell.is_food and not cell.is_ejected_mass}
+        num_bytes = 0
+        for data in self.encoder.encode(cells, full):
+            self.transport.send(data)
+            num_bytes += len(data)
+        self.rate.on_sent(num_bytes, now)
+
+    def on_world_update_post(self):
+        self.merge_received()
+        self.send()
+
+    def on_sock_closed(self):
+        self.encoder.sent.clear()
+        self.last_full = 0  # make the others drop our old cells
+
+
+class LoopbackTransport(object):
+    """
+    Stand-in for a team server: delivers messages to all other
+    transports of the same hub (a list), in the same process.
+    """
+
+    def __init__(self, hub, sync=None):
+        self.hub = hub
+        self.sync = sync
+        hub.append(self)
+
+    def send(self, data):
+        for other in self.hub:
+            if other is not self and other.sync:
+                other.sync.receive(data)
+
+
+def local_address(peer):
+    """The address of the interface through which `peer` (host, port) is reached."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect(peer)  # only looks up the route, sends nothing
+        return sock.getsockname()[0]
+    finally:
+        sock.close()
+
+
+def sign(key, data):
+    return data + hmac.new(key, data, hashlib.sha256).digest()[:MAC_SIZE]
+
+
+def verify(key, packet):
+    """The message of a signed `packet`, or None if it was not signed with `key`."""
+    data, mac = packet[:-MAC_SIZE], packet[-MAC_SIZE:]
+    if len(packet) <= MAC_SIZE or not hmac.compare_digest(
+            mac, hmac.new(key, data, hashlib.sha256).digest()[:MAC_SIZE]):
+        return None
+    return data
+
+
+class UdpTransport(object):
+    """
+    Sends messages to a fixed list of peers, receives in a daemon thread.
+    Messages are signed with the shared `key`, unsigned ones are dropped.
+    Listens on `host`, by default the interface that reaches the first peer.
+    """
+
+    def __init__(self, port, peers, key, sync=None, host=None):
+        if not key:
+            raise ValueError('Team sync needs a shared key')
+        self.key = key.encode('utf-8') if isinstance(key, str) else key
+        self.peers = peers  # list of (host, port)
+        self.sync = sync
+        self.rejected = 0
+        if host is None:
+            host = local_address(peers[0]) if peers else '127.0.0.1'
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        thread = threading.Thread(target=self.listen)
+        thread.daemon = True
+        thread.start()
+
+    def listen(self):
+        while True:
+            packet, address = self.sock.recvfrom(65535)
+            data = verify(self.key, packet)
+            if data is None:
+                self.rejected += 1
+                if self.rejected == 1:
+                    print('[TEAMSYNC] Dropping unsigned message from %s:%i' % address)
+                continue
+            if self.sync:
+                self.sync.receive(data)
+
+    def send(self, data):
+        packet = sign(self.key, data)
+        for peer in self.peers:
+            try:
+                self.sock.sendto(packet, peer)
+            except OSError as e:  # peer unreachable, it will get the next full refresh
+                swallowed('UdpTransport.send', e)
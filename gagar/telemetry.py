@@ -0,0 +1,315 @@
+"""
+Metrics (counters, gauges, histograms) fed from subscriber events,
+exported as Prometheus text over HTTP on localhost and/or as JSONL file.
+
+Updating a metric is an attribute increment or a bisect, exporting happens
+in background threads, so this stays far below 1% of the frame time.
+Metrics may be created while exporting, so the registry is only iterated
+over copies taken under its lock.
+"""
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import sys
+import threading
+import time
+
+from . import diagnostics
+from .subscriber import Subscriber
+
+# seconds, for frame times, update intervals and latencies
+TIME_BUCKETS = (.001, .0025, .005, .01, .02, .04, .08, .16, .32, .64, 1.28)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % kv for kv in labels)
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Gauge(object):
+    kind = 'gauge'
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Histogram(object):
+    kind = 'histogram'
+
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket containing the q-quantile."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def samples(self, name, labels):
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            yield name + '_bucket', labels + (('le', repr(bound)),), seen
+        yield name + '_bucket', labels + (('le', '+Inf'),), self.count
+        yield name + '_sum', labels, self.sum
+        yield name + '_count', labels, self.count
+
+
+class Registry(object):
+    """Creates and collects metrics, identified by name and labels."""
+
+    def __init__(self):
+        self.metrics = {}  # (name, labels) -> metric
+        self.help = {}
+        self.collectors = []  # called before exporting, to update metrics
+        self.lock = threading.Lock()
+
+    def get(self, cls, name, help, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = self.metrics[key] = cls(**kwargs)
+                    self.help[name] = help
+        return metric
+
+    def counter(self, name, help='', **labels):
+        return self.get(Counter, name, help, labels)
+
+    def gauge(self, name, help='', **labels):
+        return self.get(Gauge, name, help, labels)
+
+    def histogram(self, name, help='', buckets=TIME_BUCKETS, **labels):
+        return self.get(Histogram, name, help, labels, buckets=buckets)
+
+    def add_collector(self, collector):
+        with self.lock:
+            self.collectors.append(collector)
+
+    def collect(self):
+        """Updates the metrics, returns a list of ((name, labels), metric) and the help texts."""
+        with self.lock:
+            collectors = list(self.collectors)
+        for collector in collectors:
+            collector()
+        with self.lock:
+            return list(self.metrics.items()), dict(self.help)
+
+    def render_prometheus(self):
+        metrics, help = self.collect()
+        lines = []
+        described = set()
+        for (name, labels), metric in sorted(metrics, key=lambda kv: kv[0]):
+            if name not in described:
+                described.add(name)
+                lines.append('# HELP %s %s' % (name, help[name]))
+                lines.append('# TYPE %s %s' % (name, metric.kind))
+            for sample_name, sample_labels, value in metric.samples(name, labels):
+                lines.append('%s%s %s' % (sample_name, format_labels(sample_labels), value))
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """All metrics as one JSON-serializable dict."""
+        metrics, _ = self.collect()
+        snapshot = {}
+        for (name, labels), metric in metrics:
+            key = name + format_labels(labels)
+            if isinstance(metric, Histogram):
+                snapshot[key] = {'count': metric.count, 'sum': metric.sum,
+                                 'p50': metric.quantile(.5), 'p99': metric.quantile(.99)}
+            else:
+                snapshot[key] = metric.value
+        return snapshot
+
+
+def serve_prometheus(registry, port, host='127.0.0.1'):
+    """Serves the registry in Prometheus text format from a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            try:
+                body = registry.render_prometheus().encode('utf-8')
+            except Exception as e:
+                print('[METRICS] Rendering failed: %r' % e)
+                self.send_error(500)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # do not spam stderr on every scrape
+
+    server = HTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def write_jsonl(registry, path, interval=1.0):
+    """Appends a snapshot of the registry to `path` every `interval` seconds."""
+
+    def writer():
+        with open(path, 'a') as f:
+            while True:
+                time.sleep(interval)
+                try:
+                    snapshot = registry.snapshot()
+                    snapshot['time'] = time.time()
+                    f.write(json.dumps(snapshot, sort_keys=True) + '\n')
+                    f.flush()
+                except Exception as e:  # keep writing, the next snapshot may work
+                    print('[METRICS] Writing %s failed: %r' % (path, e))
+
+    thread = threading.Thread(target=writer)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+# packet events sent by agarnet's Client, counted by type
+PACKET_EVENTS = ('world_update_pre', 'leaderboard_names', 'leaderboard_groups',
+                 'own_id', 'world_rect', 'server_version', 'spectate_update',
+                 'experience_info', 'clear_cells', 'debug_line')
+
+
+class Telemetry(Subscriber):
+    """Feeds a `Registry` from the events of a client and its drawing."""
+
+    def __init__(self, client, registry=None):
+        self.client = client
+        self.registry = r = registry or Registry()
+
+        self.frame_time = r.histogram('gagar_frame_seconds', 'Time to draw one frame')
+        self.world_interval = r.histogram('gagar_world_update_interval_seconds',
+                                          'Time between two world updates')
+        self.team_latency = r.histogram('gagar_team_sync_latency_seconds',
+                                        'Delay of team data beyond the fastest recent message')
+        self.cells_in_view = r.gauge('gagar_cells', 'Cells in the world')
+        self.own_cells = r.gauge('gagar_own_cells', 'Cells controlled by the player')
+        self.total_mass = r.gauge('gagar_total_mass', 'Mass of the player')
+        self.packets = {event: r.counter('gagar_packets_total', 'Packets received',
+                                         type=event[:-4] if event[-4:] == '_pre' else event)
+                        for event in PACKET_EVENTS}
+        self.target_requests = r.counter('gagar_target_requests_total',
+                                         'Mouse target updates, before coalescing')
+        self.target_sent = r.counter('gagar_target_packets_total', 'Target packets sent')
+        self.target_redundant = r.counter('gagar_target_redundant_total',
+                                          'Target updates coalesced or unchanged, not sent')
+        self.last_world_update = None
+        self.frames_skipped = {reason: r.counter('gagar_frames_skipped_total',
+                                                 'World updates not drawn, by reason',
+                                                 reason=reason)
+                               for reason in ('hidden', 'unfocused', 'frame_rate')}
+        self.draw_time_saved = r.counter('gagar_draw_seconds_saved_total',
+                                         'Drawing time saved by skipped frames, estimated')
+        cpu_time = r.counter('gagar_process_cpu_seconds_total', 'CPU time used by the process')
+
+        def collect_cpu():
+            cpu_time.value = time.process_time()
+
+        r.add_collector(collect_cpu)
+
+        skin_hits = r.counter('gagar_skin_cache_hits_total', 'Skin lookups found in cache')
+        skin_misses = r.counter('gagar_skin_cache_misses_total', 'Skin lookups not in cache')
+        skin_prefetched = r.counter('gagar_skin_prefetched_total', 'Skins loaded ahead of drawing')
+        skin_bytes = r.gauge('gagar_skin_cache_bytes', 'Memory used by cached skins')
+
+        def collect_skins():
+            # do not import skins (and cairo) just for reporting
+            skins = sys.modules.get(__package__ + '.skins')
+            if skins:
+                skin_hits.value = skins.skin_stats['hits']
+                skin_misses.value = skins.skin_stats['misses']
+                skin_prefetched.value = skins.skin_stats['prefetched']
+                skin_bytes.value = skins.skin_stats['bytes']
+
+        r.add_collector(collect_skins)
+
+        def collect_errors():
+            # copy, the counts may grow on other threads
+            for key, count in list(diagnostics.error_counts.items()):
+                r.counter('gagar_swallowed_errors_total',
+                          'Exceptions caught while drawing, by call site',
+                          site=key).value = count
+
+        r.add_collector(collect_errors)
+
+    def __getattr__(self, func_name):
+        # count packet events
+        counter = self.__dict__.get('packets', {}).get(func_name[3:])
+        if counter is not None:
+            return lambda *args, **kwargs: counter.inc()
+        return super(Telemetry, self).__getattr__(func_name)
+
+    def on_world_update_pre(self):
+        self.packets['world_update_pre'].inc()
+
+    def on_world_update_post(self):
+        now = time.monotonic()
+        if self.last_world_update is not None:
+            self.world_interval.observe(now - self.last_world_update)
+        self.last_world_update = now
+
+        player = self.client.player
+        self.cells_in_view.set(len(player.world.cells))
+        self.own_cells.set(len(player.own_ids))
+        self.total_mass.set(player.total_mass)
+
+    def on_sock_closed(self):
+        self.last_world_update = None  # do not count reconnect time
+
+    def on_frame_drawn(self, duration):
+        self.frame_time.observe(duration)
+
+    def on_frame_skipped(self, reason):
+        self.frames_skipped[reason].inc()
+        if self.frame_time.count:  # as long as an average frame
+            self.draw_time_saved.inc(self.frame_time.sum / self.frame_time.count)
+
+    def on_target_flush(self, requests, sent):
+        self.target_requests.inc(requests)
+        self.target_sent.inc(sent)
+        self.target_redundant.inc(requests - sent)
+
+    def on_team_sync(self, latency):
+        self.team_latency.observe(latency)
@@ -0,0 +1,155 @@
+"""
+Who can eat whom, computed once per world update and queryable as data,
+for the overlays and for bots.
+
+    threats = ThreatIndex(client, cell_index, stats)
+    threats.eaters(3)            # 3 nearest cells that can eat me
+    threats.split_killers()      # cells that can split and eat me right now
+    threats.best_food(2.0)       # largest food reachable in 2 seconds
+    threats.dangerous_viruses()  # viruses that would pop my largest cell
+"""
+import heapq
+
+from .subscriber import Subscriber
+
+EAT_RATIO = 1.33  # a cell eats cells this much smaller
+SPLIT_DIST = 760  # distance a split cell flies, plus its size * .7071
+MIN_SPLIT_SIZE = 60  # smaller cells can not split
+
+# hostility of a cell towards the player
+PREY_SPLIT = 'prey_split'  # we can split and eat it
+PREY = 'prey'
+NEUTRAL = 'neutral'
+THREAT = 'threat'  # can eat us
+SPLIT_THREAT = 'split_threat'  # can split and eat us
+VIRUS = 'virus'  # would pop our largest cell
+
+
+def hostility(cell, own_min_mass, own_max_mass):
+    """Hostility of `cell`, or None if it is no threat and no prey at all."""
+    if cell.is_food or cell.is_ejected_mass:
+        return None
+    if cell.is_virus:
+        # any cell larger than the virus pops on it
+        return VIRUS if own_max_mass > cell.mass else None
+    if own_min_mass > cell.mass * EAT_RATIO * 2:
+        return PREY_SPLIT
+    if own_min_mass > cell.mass * EAT_RATIO:
+        return PREY
+    if cell.mass > own_min_mass * EAT_RATIO * 2:
+        return SPLIT_THREAT
+    if cell.mass > own_min_mass * EAT_RATIO:
+        return THREAT
+    return NEUTRAL
+
+
+def split_reach(cell):
+    """How far a cell reaches when splitting."""
+    return SPLIT_DIST + cell.size * .7071
+
+
+def cell_speed(size):
+    """Approximate speed of a cell in world units per second."""
+    return 2200 * size ** -0.439
+
+
+def dist_sq(a, b):
+    dx = a.x - b.x
+    dy = a.y - b.y
+    return dx * dx + dy * dy
+
+
+class ThreatIndex(Subscriber):
+    """
+    Classifies all cells once per world update (see `hostility()`),
+    queries use these lists and the spatial index of `cell_index`.
+    The own masses come from the `PlayerStats` of the same tick.
+    """
+
+    def __init__(self, client, cell_index, stats):
+        self.client = client
+        self.cell_index = cell_index  # subscribed before, to be up to date
+        self.stats = stats  # also subscribed before
+        self.levels = {}  # cid -> hostility, for cells that are not None
+        self.threats = []  # cells that can eat us
+        self.split_threats = []  # cells that can split and eat us
+        self.viruses = []  # viruses that would pop our largest cell
+
+    def on_world_update_post(self):
+        player = self.client.player
+        own_ids = player.own_ids
+        levels = self.levels = {}
+        self.threats = threats = []
+        self.split_threats = split_threats = []
+        self.viruses = viruses = []
+        if not player.is_alive:
+            return
+
+        own_min = self.stats.own_min_mass
+        own_max = self.stats.own_max_mass
+
+        for cid, cell in player.world.cells.items():
+            if cell.is_food or cell.is_ejected_mass or cid in own_ids:
+                continue
+            level = hostility(cell, own_min, own_max)
+            if level is None:
+                continue
+            levels[cid] = level
+            if level == THREAT:
+                threats.append(cell)
+            elif level == SPLIT_THREAT:
+                threats.append(cell)
+                if cell.size >= MIN_SPLIT_SIZE:
+                    split_threats.append(cell)
+            elif level == VIRUS:
+                viruses.append(cell)
+
+    def hostility(self, cell):
+        return self.levels.get(cell.cid)
+
+    def eaters(self, k=1, pos=None):
+        """The `k` nearest cells that can eat us, nearest first."""
+        pos = pos or self.client.player.center
+        return heapq.nsmallest(k, self.threats, key=lambda cell: dist_sq(cell.pos, pos))
+
+    def split_killers(self):
+        """Cells that can split and eat one of our cells from where they are."""
+        own_cells = list(self.client.player.own_cells)
+        killers = []
+        for cell in self.split_threats:
+            reach = split_reach(cell)
+            for own in own_cells:
+                r = reach + own.size
+                if dist_sq(cell.pos, own.pos) < r * r:
+                    killers.append(cell)
+                    break
+        return killers
+
+    def reachable_food(self, t):
+        """Food and ejected mass our cells reach within `t` seconds."""
+        local = self.cell_index.local
+        found = {}
+        for own in self.client.player.own_cells:
+            r = cell_speed(own.size) * t + own.size
+            x, y = own.pos.x, own.pos.y
+            r_sq = r * r
+            for cid, cell in local.query_rect(x - r, y - r, x + r, y + r).items():
+                if (cell.is_food or cell.is_ejected_mass) and dist_sq(cell.pos, own.pos) < r_sq:
+                    found[cid] = cell
+        return list(found.values())
+
+    def best_food(self, t):
+        """The largest food or ejected mass reachable within `t` seconds, or None."""
+        food = self.reachable_food(t)
+        return max(food, key=lambda cell: cell.mass) if food else None
+
+    def dangerous_viruses(self, near=None):
+        """
+        Viruses that would pop our largest cell,
+        only those within `near` world units of it if given.
+        """
+        if near is None or not self.viruses:
+            return self.viruses
+        largest = max(self.client.player.own_cells, key=lambda cell: cell.size)
+        r = near + largest.size
+        return [v for v in self.viruses if dist_sq(v.pos, largest.pos) < r * r]
@@ -0,0 +1,166 @@
+"""
+Draws many cells on several threads, for zoomed out views of crowded worlds.
+
+The window is split into tiles, each cell goes into the tiles its bounding box
+touches, and each tile is rasterized into its own image surface on a thread
+pool (cairo does not hold the GIL while filling). The tiles are then
+composited in the drawing thread.
+
+Enable it for the cells plugin in ~/.config/gagar/plugins.cfg:
+
+    [plugin:cells]
+    kwargs = tile_threads=4
+
+Compare thread counts on a synthetic world:
+
+    gagar bench-tiles [cells] [WIDTHxHEIGHT] [frames]
+"""
+from concurrent.futures import ThreadPoolExecutor
+import random
+import time
+
+TILE_SIZE = 256
+
+
+class TileRasterizer(object):
+    def __init__(self, threads=4, tile_size=TILE_SIZE):
+        self.threads = threads
+        self.tile_size = tile_size
+        self.pool = ThreadPoolExecutor(threads) if threads > 1 else None
+        self.surfaces = {}  # (col, row) -> surface, reused between frames
+        self.grid = None  # (cols, rows)
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
+
+    def bucket(self, transform, cells, cols, rows):
+        """Circles (x, y, radius, rgba) in screen coordinates, per tile."""
+        ts = self.tile_size
+        s, ox, oy = transform.scale, transform.offset_x, transform.offset_y
+        tiles = {}
+        for cell in cells:
+            x = cell.pos.x * s + ox
+            y = cell.pos.y * s + oy
+            r = cell.draw_size * s
+            col_min = max(0, int((x - r) // ts))
+            col_max = min(cols - 1, int((x + r) // ts))
+            row_min = max(0, int((y - r) // ts))
+            row_max = min(rows - 1, int((y + r) // ts))
+            if col_min > col_max or row_min > row_max:
+                continue  # outside the window
+            r_, g, b = cell.color
+            circle = (x, y, r, (r_, g, b, min(cell.draw_alpha, 0.9)))
+            for col in range(col_min, col_max + 1):
+                for row in range(row_min, row_max + 1):
+                    tile = tiles.get((col, row))
+                    if tile is None:
+                        tile = tiles[col, row] = []
+                    tile.append(circle)
+        return tiles
+
+    def rasterize(self, key, circles):
+        import cairo
+        ts = self.tile_size
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = cairo.ImageSurface(cairo.FORMAT_ARGB32, ts, ts)
+        ctx = cairo.Context(surface)
+        ctx.set_operator(cairo.OPERATOR_CLEAR)
+        ctx.paint()
+        ctx.set_operator(cairo.OPERATOR_OVER)
+        ctx.translate(-key[0] * ts, -key[1] * ts)
+        last_color = None
+        for x, y, r, color in circles:
+            if color != last_color:
+                ctx.set_source_rgba(*color)
+                last_color = color
+            ctx.new_sub_path()
+            ctx.arc(x, y, r, 0, 6.28318530717958)
+            ctx.fill()
+        surface.flush()
+        return surface
+
+    def draw(self, c, w, cells):
+        """Draws `cells` (in drawing order) onto the canvas `c` of view `w`."""
+        ts = self.tile_size
+        cols = int(w.win_size.x // ts) + 1
+        rows = int(w.win_size.y // ts) + 1
+        if self.grid != (cols, rows):
+            self.surfaces = {}
+            self.grid = (cols, rows)
+
+        tiles = self.bucket(w.transform, cells, cols, rows)
+        if self.pool:
+            futures = [(key, self.pool.submit(self.rasterize, key, circles))
+                       for key, circles in tiles.items()]
+            done = [(key, f.result()) for key, f in futures]
+        else:
+            done = [(key, self.rasterize(key, circles)) for key, circles in tiles.items()]
+
+        for (col, row), surface in done:
+            c.draw_surface(surface, (col * ts, row * ts))
+
+
+def dense_world(num_cells, size=11000.0, seed=1):
+    """A world full of randomly sized and coloured cells."""
+    from agarnet.world import Cell, World
+    rnd = random.Random(seed)
+    now = time.time()
+    world = World()
+    world.top_left.set(0, 0)
+    world.bottom_right.set(size, size)
+    for cid in range(1, num_cells + 1):
+        cell = Cell(cid, rnd.uniform(0, size), rnd.uniform(0, size),
+                    rnd.choice((10, 10, 10, 40, 100, 300)), '',
+                    (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)))
+        # set by the drawing-aware agarnet, not by plain Cell()
+        cell.draw_size = cell.size
+        cell.draw_alpha = 1.0
+        cell.spawn_time = now
+        cell.skin = ''
+        world.cells[cid] = cell
+    return world
+
+
+def benchmark(num_cells=20000, size=(1920, 1080), frames=20, thread_counts=(1, 2, 4, 8)):
+    """Returns {threads: seconds per frame} for the full world view of a dense world."""
+    import cairo
+    from .drawutils import Canvas
+    from .view import View
+
+    world = dense_world(num_cells)
+    view = View(world, size)
+    view.show_full_world()
+    view.screen_scale = min(size[0] / world.size.x, size[1] / world.size.y)
+    view.recalculate()
+    cells = sorted(world.cells.values(), reverse=True)  # small over large
+
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, *size)
+    c = Canvas(cairo.Context(surface))
+    results = {}
+    for threads in thread_counts:
+        rasterizer = TileRasterizer(threads)
+        rasterizer.draw(c, view, cells)  # warm up, allocates the tiles
+        start = time.perf_counter()
+        for _ in range(frames):
+            rasterizer.draw(c, view, cells)
+        surface.flush()
+        results[threads] = (time.perf_counter() - start) / frames
+        rasterizer.close()
+    return results
+
+
+def main(args):
+    if args[:1] in (['-h'], ['--help']):
+        print("Usage: gagar bench-tiles [cells] [WIDTHxHEIGHT] [frames]")
+        return
+    num_cells, size, frames, *_ = args + [None] * 3
+    num_cells = int(num_cells or 20000)
+    size = tuple(map(int, size.split('x'))) if size else (1920, 1080)
+    frames = int(frames or 20)
+    print('%i cells, %ix%i, %i frames' % (num_cells, size[0], size[1], frames))
+    results = benchmark(num_cells, size, frames)
+    for threads, seconds in sorted(results.items()):
+        print('%i threads: %6.1f ms/frame  %.2fx' % (
+            threads, seconds * 1000, results[1] / seconds if 1 in results else 1))
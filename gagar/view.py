@@ -0,0 +1,204 @@
+from array import array
+import time
+
+from agarnet.vec import Vec
+from .drawutils import *
+from .widgets import WidgetLayer
+
+
+class Transform(object):
+    """
+    Maps world to screen coordinates: `screen = world * scale + offset`.
+    Computed once per frame, so drawing only needs a multiply and an add
+    per coordinate, or nothing at all with `Canvas.push_transform()`.
+    """
+
+    def __init__(self, scale=1.0, offset_x=0.0, offset_y=0.0):
+        self.scale = scale
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+
+    def set(self, scale, world_pos, screen_pos):
+        """Scales by `scale`, mapping `world_pos` to `screen_pos`."""
+        self.scale = scale
+        self.offset_x = screen_pos.x - world_pos.x * scale
+        self.offset_y = screen_pos.y - world_pos.y * scale
+
+    def xy(self, x, y):
+        return x * self.scale + self.offset_x, y * self.scale + self.offset_y
+
+    def pos(self, world_pos):
+        s = self.scale
+        return Vec(world_pos.x * s + self.offset_x, world_pos.y * s + self.offset_y)
+
+    def size(self, world_size):
+        return world_size * self.scale
+
+    def inverse_xy(self, x, y):
+        return (x - self.offset_x) / self.scale, (y - self.offset_y) / self.scale
+
+    def inverse_pos(self, screen_pos):
+        return Vec(*self.inverse_xy(screen_pos.x, screen_pos.y))
+
+    def map_coords(self, coords, out=None):
+        """
+        Transforms the flat sequence `coords` (x0, y0, x1, y1, ...)
+        into `out`, an array('d') that is reused if large enough.
+        Returns `out`, only the first `len(coords)` items are valid.
+        Used to map many positions per frame without a `Vec` for each.
+        """
+        n = len(coords)
+        if n % 2:
+            raise ValueError('Odd number of coordinates: %i' % n)
+        if out is None or len(out) < n:
+            out = array('d', bytes(8 * n))
+        s, ox, oy = self.scale, self.offset_x, self.offset_y
+        for i in range(0, n, 2):
+            out[i] = coords[i] * s + ox
+            out[i + 1] = coords[i + 1] * s + oy
+        return out
+
+
+class View(object):
+    """
+    Draws one world onto any cairo context, without needing a window.
+    Calls draw_subscriber.on_draw_{background|cells|minimap|hud}() methods when drawing.
+    """
+
+    INFO_SIZE = 300
+
+    MIN_SCREEN_SCALE = 0.075
+    MAX_SCREEN_SCALE = 1
+
+    def __init__(self, world, win_size=None):
+        self.world = world
+        self.player = None  # the focused player, or None to show full world
+
+        # the class instance on which to call draw_background, draw_cells, draw_hud
+        self.draw_subscriber = None
+        self.button_subscriber = None
+
+        self.widgets = WidgetLayer()  # buttons, kept across frames
+
+        self.win_size = Vec(win_size or (1000, 1000 * 9 / 16))
+        self.screen_center = self.win_size / 2
+        self.screen_scale = 1
+        self.screen_zoom_scale = 1
+        self.min_screen_scale = self.MIN_SCREEN_SCALE
+        self.max_screen_scale = self.MAX_SCREEN_SCALE
+        self.zoom_smoothing = 0.1
+        self.follow_smoothing = 0.3  # while alive
+        self.spectate_smoothing = 0.1
+        self.minimap_size = 1 / 5  # of the window width
+        self.world_center = Vec(0, 0)
+        self.mouse_pos = Vec(0, 0)
+
+        # updated once per frame by recalculate()
+        self.transform = Transform()  # world -> screen
+        self.minimap = Transform()  # world -> minimap, if the world size is known
+
+    def configure(self, settings):
+        """Applies the zoom, smoothing and minimap size of a `profiles.Settings`."""
+        self.min_screen_scale = settings.min_zoom
+        self.max_screen_scale = settings.max_zoom
+        self.screen_zoom_scale = min(max(self.screen_zoom_scale, settings.min_zoom),
+                                     settings.max_zoom)
+        self.zoom_smoothing = settings.zoom_smoothing
+        self.follow_smoothing = settings.follow_smoothing
+        self.spectate_smoothing = settings.spectate_smoothing
+        self.minimap_size = settings.minimap_size
+
+    def focus_player(self, player):
+        """Follow this client regarding center and zoom."""
+        self.player = player
+        self.world = player.world
+
+    def show_full_world(self, world=None):
+        """
+        Show the full world view instead of one client.
+        :param world: optionally update the drawn world
+        """
+        self.player = None
+        if world:
+            self.world = world
+
+    def register_button(self, button):
+        """Adds the button until `widgets.remove(button)`, draw it with `widgets.draw()`."""
+        self.widgets.add(button)
+        if button.contains_point(self.mouse_pos):
+            self.hover(self.mouse_pos)
+
+    def hover(self, pos):
+        widgets = self.widgets
+        if widgets.hover(pos) and widgets.hovered and self.button_subscriber:
+            self.button_subscriber.on_button_hover(widgets.hovered, pos)
+
+    def world_to_screen_pos(self, world_pos):
+        return self.transform.pos(world_pos)
+
+    def screen_to_world_pos(self, screen_pos):
+        return self.transform.inverse_pos(screen_pos)
+
+    def world_to_screen_size(self, world_size):
+        return world_size * self.transform.scale
+
+    def recalculate(self):
+        self.screen_center = self.win_size / 2
+        if self.player:  # any client is focused
+            # if self.player.is_alive or (self.player.center.x == 0 and self.player.center.y == 0) or not self.player.scale == 1.0: # HACK due to bug: player scale is sometimes wrong (sent by server?) in spectate mode
+            window_scale = max(self.win_size.x / 1920, self.win_size.y / 1080)
+            new_screen_scale = self.player.scale * window_scale * self.screen_zoom_scale
+            self.screen_scale = lerp_smoothing(self.screen_scale, new_screen_scale, self.zoom_smoothing, 0.0001)
+
+            smoothing_factor = self.spectate_smoothing
+            if self.player.is_alive:
+                smoothing_factor = self.follow_smoothing
+
+            self.world_center.x = lerp_smoothing(self.world_center.x, self.player.center.x, smoothing_factor, 0.01)
+            self.world_center.y = lerp_smoothing(self.world_center.y, self.player.center.y, smoothing_factor, 0.01)
+
+            self.world = self.player.world
+        elif self.world.size:
+            new_screen_scale = min(self.win_size.x / self.world.size.x, self.win_size.y / self.world.size.y) * self.screen_zoom_scale
+            self.screen_scale = lerp_smoothing(self.screen_scale, new_screen_scale, self.zoom_smoothing, 0.0001)
+            self.world_center = self.world.center
+        else:
+            # happens when the window gets drawn before the world got updated
+            self.screen_scale = self.screen_zoom_scale
+            self.world_center = Vec(0, 0)
+
+        self.transform.set(self.screen_scale, self.world_center, self.screen_center)
+        if self.world.size:
+            minimap_w = self.win_size.x * self.minimap_size
+            self.minimap.set(minimap_w / self.world.size.x, self.world.top_left,
+                             self.win_size - Vec(minimap_w, minimap_w))
+
+    def render(self, cairo_context):
+        """Recalculates the view and draws one frame."""
+        self.widgets.frame += 1
+        c = Canvas(cairo_context)
+        if self.draw_subscriber:
+            start = time.perf_counter()
+            self.recalculate()
+            self.draw_subscriber.on_draw_background(c, self)
+            self.draw_subscriber.on_draw_cells(c, self)
+            self.draw_minimap_backgound(c, self)
+            self.draw_subscriber.on_draw_minimap(c, self)
+            self.draw_subscriber.on_draw_hud(c, self)
+            self.draw_subscriber.on_frame_drawn(duration=time.perf_counter() - start)
+
+    def draw_minimap_backgound(self, c, w):
+        if w.world.size:
+            minimap_w = w.win_size.x * w.minimap_size
+            minimap_size = Vec(minimap_w, minimap_w)
+            minimap_offset = w.win_size - minimap_size
+
+            # minimap background
+            c.fill_rect(minimap_offset, size=minimap_size,
+                        color=to_rgba(DARK_GRAY, .8))
+
+            # outline the area visible in window
+            to_map = w.minimap.xy
+            c.stroke_rect(to_map(*w.transform.inverse_xy(0, 0)),
+                          to_map(*w.transform.inverse_xy(w.win_size.x, w.win_size.y)),
+                          width=1, color=BLACK)
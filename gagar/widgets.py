@@ -0,0 +1,106 @@
+"""
+Buttons that stay registered across frames.
+
+Their owner adds them once and moves or removes them when needed.
+Hit testing and hover go through a small grid of the window, so mouse
+motion only looks at the few buttons under the mouse. Each button is
+drawn into its own layer, which is only redrawn when the button changed.
+Only buttons drawn in the last frame can be hovered and pressed,
+so the buttons of a hidden overlay do not react.
+"""
+from .layers import Layer
+from .spatial import SpatialHash
+
+BUCKET_SIZE = 64  # pixels
+
+
+class WidgetLayer(object):
+    def __init__(self):
+        self.buttons = {}  # id(button) -> button
+        self.stacking = {}  # id(button) -> number, later added ones are on top
+        self.added = 0
+        self.index = SpatialHash(BUCKET_SIZE)
+        self.layers = {}  # id(button) -> Layer
+        self.drawn = {}  # id(button) -> frame in which it was last drawn
+        self.frame = 0  # counted up by the view for each frame
+        self.hovered = None
+
+    def __len__(self):
+        return len(self.buttons)
+
+    def __contains__(self, button):
+        return id(button) in self.buttons
+
+    def add(self, button):
+        key = id(button)
+        self.buttons[key] = button
+        if key not in self.stacking:
+            self.added += 1
+            self.stacking[key] = self.added
+        self.layers.setdefault(key, Layer())
+        self.reindex(button)
+
+    def remove(self, button):
+        key = id(button)
+        self.buttons.pop(key, None)
+        self.stacking.pop(key, None)
+        self.layers.pop(key, None)
+        self.drawn.pop(key, None)
+        self.index.remove(key)
+        if self.hovered is button:
+            self.hovered = None
+
+    def move(self, button, x, y):
+        if (button.x, button.y) != (x, y):
+            button.x = x
+            button.y = y
+            self.reindex(button)
+
+    def reindex(self, button):
+        half_w = button.width / 2
+        half_h = button.height / 2
+        self.index.insert(id(button), button, button.x + half_w, button.y + half_h,
+                          max(half_w, half_h))
+
+    def hit(self, pos):
+        """The topmost button containing `pos`, or None."""
+        found = self.index.query_rect(pos.x, pos.y, pos.x, pos.y)
+        if not found:
+            return None
+        drawn = self.drawn
+        visible_since = self.frame - 1  # events may arrive while drawing
+        top = None
+        for key, button in found.items():
+            if drawn.get(key, -1) >= visible_since and button.contains_point(pos):
+                if top is None or self.stacking[key] > self.stacking[id(top)]:
+                    top = button
+        return top
+
+    def hover(self, pos):
+        """Highlights the button at `pos`, returns True if another one got hovered."""
+        button = self.hit(pos)
+        if button is self.hovered:
+            return False
+        if self.hovered is not None:
+            self.hovered.highlight = False
+        if button is not None:
+            button.highlight = True
+        self.hovered = button
+        return True
+
+    def draw(self, c, button):
+        """Draws `button` from its layer, redrawing that only if the button changed."""
+        key = id(button)
+        layer = self.layers.get(key)
+        if layer is None:
+            c.draw_button(button)  # not added
+            return
+        self.drawn[key] = self.frame
+        rect = (button.x - 1, button.y - 1, button.width + 2, button.height + 2)
+        version = (rect, button.text, button.highlight, button.fill_color,
+                   button.border_color, button.text_color)
+        layer.draw(c, version, rect, lambda c: c.draw_button(button))
+
+    def draw_all(self, c):
+        for key in sorted(self.buttons, key=self.stacking.get):
+            self.draw(c, self.buttons[key])
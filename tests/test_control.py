@@ -0,0 +1,96 @@
+from gagar import control
+from gagar.control import TargetScheduler
+from gagar.subscriber import Subscriber
+
+
+class Flushes(Subscriber):
+    def __init__(self):
+        self.flushes = []
+
+    def on_target_flush(self, requests, sent):
+        self.flushes.append((requests, sent))
+
+
+class Client(object):
+    def __init__(self):
+        self.subscriber = Flushes()
+        self.targets = []
+
+    def send_target(self, x, y):
+        self.targets.append((x, y))
+
+
+def make_scheduler(monkeypatch, rate=25):
+    now = [100.0]
+    monkeypatch.setattr(control.time, 'monotonic', lambda: now[0])
+    client = Client()
+    return TargetScheduler(client, rate), client, now
+
+
+def test_coalesces_to_latest_target(monkeypatch):
+    targets, client, now = make_scheduler(monkeypatch)
+    targets.set(1, 1)
+    assert targets.flush()
+    for x in range(10):  # faster than the rate
+        now[0] += .001
+        targets.set(x, 5.7)
+        assert not targets.flush()
+    now[0] += .04
+    assert targets.flush()
+    assert client.targets == [(1, 1), (9, 5)]
+    assert client.subscriber.flushes == [(1, 1), (10, 1)]
+    assert (targets.requests, targets.sent) == (11, 2)
+
+
+def test_skips_unchanged_target(monkeypatch):
+    targets, client, now = make_scheduler(monkeypatch)
+    targets.set(3, 4)
+    targets.flush()
+    now[0] += 1
+    targets.set(3.2, 4.9)  # same target once truncated
+    assert not targets.flush()
+    assert not targets.flush()  # nothing pending
+    assert client.targets == [(3, 4)]
+    assert client.subscriber.flushes == [(1, 1), (1, 0)]
+
+
+def test_force_and_reset(monkeypatch):
+    targets, client, now = make_scheduler(monkeypatch)
+    targets.set(1, 1)
+    targets.flush()
+    targets.set(2, 2)
+    assert targets.flush(force=True)  # e.g. before split
+    targets.reset()  # reconnected, the server forgot the target
+    targets.set(2, 2)
+    assert targets.flush(force=True)
+    assert client.targets == [(1, 1), (2, 2), (2, 2)]
+
+
+def test_unlimited_rate(monkeypatch):
+    targets, client, now = make_scheduler(monkeypatch, rate=0)
+    for x in range(3):
+        targets.set(x, 0)
+        assert targets.flush()
+    assert len(client.targets) == 3
+
+
+def test_every_jittered_tick_sends(monkeypatch):
+    targets, client, now = make_scheduler(monkeypatch)
+    jitter = (.004, -.004, .001, -.003, .002)
+    for tick in range(250):
+        now[0] = 100 + tick * .04 + jitter[tick % len(jitter)]
+        targets.set(tick, 0)  # the player moves, so does the target
+        targets.flush()
+    assert len(client.targets) == 250
+
+
+def test_held_back_target_sent_on_next_tick(monkeypatch):
+    targets, client, now = make_scheduler(monkeypatch)
+    targets.set(1, 1)
+    targets.flush()
+    now[0] += .01  # too early, e.g. right after a forced send
+    targets.set(2, 2)
+    assert not targets.flush()
+    now[0] += .04
+    assert targets.flush()
+    assert client.targets == [(1, 1), (2, 2)]
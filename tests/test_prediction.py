@@ -0,0 +1,45 @@
+from gagar.prediction import MotionPredictor
+
+
+def observe_moving(predictor, key, speed, until, step=.1):
+    """Feeds a position moving along x at `speed` per second, from 0 to `until`."""
+    t = 0.0
+    while t <= until + 1e-9:
+        predictor.observe(key, speed * t, 0, now=t)
+        t += step
+    return t - step
+
+
+def test_extrapolates_moving_cell():
+    predictor = MotionPredictor(smoothing=1.0)
+    last = observe_moving(predictor, 1, 200, .2)
+    x, y = predictor.predict_xy(predictor.tracks[1], last + .2)  # errors blended out
+    assert abs(x - 80) < 1e-6 and y == 0
+
+
+def test_converges_to_cell_that_stopped():
+    predictor = MotionPredictor(smoothing=1.0)
+    observe_moving(predictor, 1, 200, .2)  # stops at x=40
+    track = predictor.tracks[1]
+    for i in range(1, 10):
+        predictor.observe(1, 40, 0, now=.2 + i * .1)
+    assert predictor.predict_xy(track, 60) == (40, 0)
+    assert track.vx == track.vy == 0
+
+
+def test_converges_without_further_updates():
+    predictor = MotionPredictor(smoothing=1.0)
+    observe_moving(predictor, 1, 200, .2)
+    track = predictor.tracks[1]
+    # no jump when the extrapolation starts to fade out
+    x, _ = predictor.predict_xy(track, .2 + predictor.max_extrapolation)
+    x_later, _ = predictor.predict_xy(track, .2 + predictor.max_extrapolation + .01)
+    assert abs(x - x_later) < 10
+    assert predictor.predict_xy(track, 60) == (40, 0)
+
+
+def test_snaps_on_large_error():
+    predictor = MotionPredictor(smoothing=1.0, max_error=100)
+    observe_moving(predictor, 1, 200, .2)
+    predictor.observe(1, 1000, 0, now=.3)
+    assert predictor.predict_xy(predictor.tracks[1], .3) == (1000, 0)
@@ -0,0 +1,79 @@
+from agarnet.world import Cell, Player
+
+from gagar import replay
+from gagar.replay import ReplayClient, ReplayRecorder
+from gagar.subscriber import Subscriber
+
+
+class Client(object):
+    def __init__(self):
+        self.player = Player()
+        self.subscriber = Subscriber()
+
+
+def record(path, monkeypatch, stop=True):
+    """30 world updates, 0.1 s apart: cell 1 moves, cell 2 leaves, cell 3 appears."""
+    now = [0.0]
+    monkeypatch.setattr(replay.time, 'monotonic', lambda: now[0])
+    client = Client()
+    cells = client.player.world.cells
+    recorder = ReplayRecorder(client, keyframe_interval=1.0)
+    recorder.start(path)
+    for i in range(30):
+        now[0] = i * .1
+        cells[1] = Cell(1, i * 100, 0, 50, 'mover', (0, 255, 0))
+        if i == 0:
+            cells[2] = Cell(2, 0, 500, 40, 'leaver', (255, 0, 0))
+        if i == 15:
+            del cells[2]
+        if i == 20:
+            cells[3] = Cell(3, 700, 700, 30, 'newcomer', (0, 0, 255))
+        recorder.on_world_update_post()
+    if stop:
+        recorder.stop()
+    else:
+        recorder.file.close()  # interrupted, no index
+    return recorder
+
+
+def test_keyframes_indexed(tmpdir, monkeypatch):
+    path = str(tmpdir.join('test.replay'))
+    recorder = record(path, monkeypatch)
+    assert len(recorder.index) == 3
+    client = ReplayClient(Subscriber(), path)
+    assert client.reader.index_times == [t for t, _ in recorder.index]
+    assert abs(client.reader.duration - 2.9) < 1e-9
+
+
+def check_seek(client):
+    cells = client.world.cells
+    client.seek(1.55)
+    assert cells[1].pos.x == 1500 and 2 not in cells and 3 not in cells
+    client.seek(.35)  # backwards, before the keyframe just used
+    assert cells[1].pos.x == 300 and cells[2].name == 'leaver'
+    client.seek(2.05)
+    assert cells[1].pos.x == 2000 and cells[3].name == 'newcomer'
+    client.seek(99)
+    assert cells[1].pos.x == 2900
+
+
+def test_seek(tmpdir, monkeypatch):
+    path = str(tmpdir.join('test.replay'))
+    record(path, monkeypatch)
+    check_seek(ReplayClient(Subscriber(), path))
+
+
+def test_seek_without_index(tmpdir, monkeypatch):
+    path = str(tmpdir.join('test.replay'))
+    record(path, monkeypatch, stop=False)
+    check_seek(ReplayClient(Subscriber(), path))
+
+
+def test_advance_continues_after_seek(tmpdir, monkeypatch):
+    path = str(tmpdir.join('test.replay'))
+    record(path, monkeypatch)
+    client = ReplayClient(Subscriber(), path)
+    client.seek(.95)
+    assert client.advance(1.25)
+    assert client.world.cells[1].pos.x == 1200
+    assert not client.advance(5)
@@ -0,0 +1,82 @@
+from agarnet.world import Cell, World
+
+from gagar.team_sync import (FULL, DeltaEncoder, TeamMerger,
+                             decode, header_struct, sign, verify)
+
+
+def make_cells(n, x=0):
+    return {cid: Cell(cid, x + cid * 10, cid * 20, 32, 'cell %i' % cid, (255, 0, 0))
+            for cid in range(1, n + 1)}
+
+
+def test_round_trip():
+    cells = make_cells(3)
+    message, = DeltaEncoder(7).encode(cells, full=True)
+    kind, sender, seq, sent_time, part, parts, removed, decoded = decode(message)
+    assert (kind, sender, seq, part, parts) == (FULL, 7, 1, 0, 1)
+    assert list(removed) == []
+    assert [(cid, x, y, size, name) for cid, x, y, size, color, flags, name in decoded] \
+        == [(1, 10, 20, 32, 'cell 1'), (2, 20, 40, 32, 'cell 2'), (3, 30, 60, 32, 'cell 3')]
+
+
+def test_delta_sends_moved_and_removed_cells():
+    encoder = DeltaEncoder(7, move_threshold=10)
+    cells = make_cells(3)
+    encoder.encode(cells, full=True)
+    cells[1].pos.set(cells[1].pos.x + 50, cells[1].pos.y)
+    cells[2].pos.set(cells[2].pos.x + 1, cells[2].pos.y)
+    del cells[3]
+    message, = encoder.encode(cells)
+    kind, sender, seq, sent_time, part, parts, removed, decoded = decode(message)
+    assert list(removed) == [3]
+    assert [cell[0] for cell in decoded] == [1]
+
+
+def test_merge_applies_cells():
+    world = World()
+    merger = TeamMerger(world)
+    message, = DeltaEncoder(7).encode(make_cells(3), full=True)
+    changed, gone, delay = merger.merge(message)
+    assert sorted(changed) == [1, 2, 3] and gone == []
+    assert world.cells[2].pos.x == 20 and world.cells[2].name == 'cell 2'
+    assert merger.merge(message) is None  # duplicated
+
+
+def test_full_refresh_is_split_and_removes_once_complete():
+    world = World()
+    merger = TeamMerger(world)
+    encoder = DeltaEncoder(7, max_size=200)
+    for message in encoder.encode(make_cells(3), full=True):
+        merger.merge(message)
+
+    messages = encoder.encode(make_cells(40, x=1000), full=True)
+    assert len(messages) > 1
+    assert all(len(message) <= 200 for message in messages)
+    for message in messages[:-1]:
+        merger.merge(message)
+    assert 1 in world.cells  # may still be in the missing part
+    merger.merge(messages[-1])
+    assert sorted(world.cells) == list(range(1, 41))
+    assert world.cells[1].pos.x == 1010
+
+
+def test_delay_does_not_depend_on_clock_offset():
+    merger = TeamMerger(World())
+    encoder = DeltaEncoder(7)
+    cells = make_cells(1)
+    delays = []
+    for i, transit in enumerate((.02, .05, .02)):
+        message, = encoder.encode(cells, full=True)
+        sent_time = header_struct.unpack_from(message, 0)[4]
+        # the sender's clock is an hour ahead
+        delays.append(merger.merge(message, arrival=sent_time - 3600 + transit)[2])
+    assert [round(delay, 6) for delay in delays] == [0, .03, 0]
+
+
+def test_signature():
+    key = b'secret'
+    packet = sign(key, b'message')
+    assert verify(key, packet) == b'message'
+    assert verify(b'other', packet) is None
+    assert verify(key, b'messagf' + packet[7:]) is None
+    assert verify(key, b'') is None
@@ -0,0 +1,45 @@
+from agarnet.world import Cell, Player
+
+from gagar.spatial import CellIndex
+from gagar.stats import PlayerStats
+from gagar.threats import (NEUTRAL, PREY, PREY_SPLIT, SPLIT_THREAT, THREAT, VIRUS,
+                           ThreatIndex, hostility)
+
+
+def make_cell(size, is_virus=False):
+    return Cell(1, 0, 0, size, '', (255, 0, 0), is_virus)
+
+
+def test_virus_pops_any_larger_cell():
+    virus = make_cell(100, is_virus=True)
+    assert hostility(virus, 50, 101) == VIRUS
+    assert hostility(virus, 50, 100) is None
+
+
+def test_cells():
+    own_mass = 100
+    assert hostility(make_cell(50), own_mass, own_mass) == PREY_SPLIT  # mass 25
+    assert hostility(make_cell(80), own_mass, own_mass) == PREY  # mass 64
+    assert hostility(make_cell(100), own_mass, own_mass) == NEUTRAL  # mass 100
+    assert hostility(make_cell(120), own_mass, own_mass) == THREAT  # mass 144
+    assert hostility(make_cell(200), own_mass, own_mass) == SPLIT_THREAT  # mass 400
+
+
+def test_threat_index_reads_stats():
+    class Client(object):
+        player = Player()
+
+    client = Client()
+    cells = client.player.world.cells
+    cells[1] = Cell(1, 0, 0, 110, 'me', (0, 255, 0))  # mass 121
+    cells[2] = Cell(2, 500, 0, 100, '', (0, 255, 0), True)
+    cells[3] = Cell(3, 900, 0, 200, 'big', (255, 0, 0))
+    client.player.own_ids.add(1)
+    client.player.cells_changed()
+    stats = PlayerStats(client)
+    threats = ThreatIndex(client, CellIndex(client), stats)
+    stats.on_world_update_post()
+    threats.on_world_update_post()
+    assert threats.viruses == threats.dangerous_viruses() == [cells[2]]
+    assert threats.split_threats == [cells[3]]
+    assert threats.split_killers() == [cells[3]]
@@ -0,0 +1,36 @@
+from array import array
+
+import pytest
+
+pytest.importorskip('cairo')  # view draws with cairo
+
+from agarnet.vec import Vec  # noqa: E402
+
+from gagar.view import Transform  # noqa: E402
+
+
+def make_transform():
+    transform = Transform()
+    transform.set(.5, Vec(100, 200), Vec(400, 300))
+    return transform
+
+
+def test_map_coords_matches_xy():
+    transform = make_transform()
+    coords = [0, 0, 100, 200, -50.5, 1e4]
+    out = transform.map_coords(coords)
+    assert list(out[:6]) == [v for i in range(0, 6, 2)
+                             for v in transform.xy(coords[i], coords[i + 1])]
+
+
+def test_map_coords_reuses_large_enough_output():
+    transform = make_transform()
+    out = array('d', [7.0] * 10)
+    assert transform.map_coords([100, 200], out) is out
+    assert list(out[:2]) == [400, 300] and out[2] == 7.0
+    assert len(transform.map_coords([0, 0] * 8, out)) == 16
+
+
+def test_map_coords_rejects_odd_length():
+    with pytest.raises(ValueError):
+        make_transform().map_coords([1, 2, 3])